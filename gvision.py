@@ -7,7 +7,7 @@ import io
 import subprocess
 import tempfile
 import codecs
-from zipfile import ZipFile
+from zipfile import ZipFile, ZIP_STORED
 import gzip
 import time
 import shutil
@@ -69,7 +69,105 @@ def pdf_to_jpg(infile, jpgdir, ppi):
     else:
         return False
 
-def google_ocr(client, input_file, gocr_file):
+def split_jpegs(stream, chunk_size = 1 << 20):
+    # the images of a stream of concatenated jpegs, as ghostscript writes
+    # them to stdout, split at their end of image markers. Scan data ends
+    # at the first marker that is not a stuffed 0xff00 or a restart marker
+    buf  = bytearray()
+    pos  = 0
+    scan = False
+    while True:
+        chunk = stream.read(chunk_size)
+        buf  += chunk
+
+        while pos <= len(buf):
+            if pos == 0:
+                if len(buf) < 2:
+                    break
+                if buf[0:2] != b'\xff\xd8':
+                    raise ValueError('Not a jpeg image')
+                pos = 2
+
+            if scan:
+                i = buf.find(b'\xff', pos)
+                while i >= 0 and i + 1 < len(buf) and \
+                        (buf[i+1] == 0 or 0xd0 <= buf[i+1] <= 0xd7):
+                    i = buf.find(b'\xff', i + 2)
+                if i < 0:
+                    pos = len(buf)
+                    break
+                pos = i
+                if i + 1 >= len(buf):
+                    break
+                scan = False
+
+            if len(buf) < pos + 2:
+                break
+            if buf[pos] != 0xff:
+                raise ValueError('No jpeg marker at %d' % pos)
+
+            marker = buf[pos+1]
+            if marker == 0xff:
+                # fill byte
+                pos += 1
+            elif marker == 0xd9:
+                yield bytes(buf[:pos+2])
+                del buf[:pos+2]
+                pos = 0
+            elif 0xd0 <= marker <= 0xd7 or marker == 0x01:
+                pos += 2
+            else:
+                if len(buf) < pos + 4:
+                    break
+                pos += 2 + ((buf[pos+2] << 8) | buf[pos+3])
+                scan = (marker == 0xda)
+
+        if not chunk:
+            if buf:
+                raise ValueError('Truncated jpeg image')
+            return
+
+def pdf_to_jpg_zip(infile, jpgzip, ppi):
+    # rasterizes infile straight into jpgzip, as <name>_jpg/<name>_%04d.jpg
+    # the way the files of pdf_to_jpg are zipped, without writing the pages
+    # to a directory first. Members are stored, jpeg does not deflate.
+    # Returns the number of pages, None if infile could not be converted
+    logger   = logging.getLogger('gvision')
+    itemname = os.path.splitext(os.path.basename(infile))[0]
+    arcdir   = os.path.splitext(os.path.basename(jpgzip))[0]
+
+    # PostScript writes to %stdout go to stderr, stdout is only the images
+    command = ['gs', '-q', '-dNOPAUSE', '-dBATCH',  '-dSAFER', \
+               '-sstdout=%stderr', '-r%dx%d' % (ppi, ppi), \
+               '-sDEVICE=jpeg', '-sOutputFile=-', '-c',  \
+               'save', 'pop', '-f',  '%s' % infile]
+
+    p = subprocess.Popen(command, stdout=subprocess.PIPE, stderr = FNULL)
+
+    tmpzip    = jpgzip + '.part'
+    num_pages = 0
+    success   = True
+    try:
+        with ZipFile(tmpzip, 'w', ZIP_STORED) as zipobj:
+            for image in split_jpegs(p.stdout):
+                num_pages += 1
+                arcname = '%s/%s_%04d.jpg' % (arcdir, itemname, num_pages)
+                zipobj.writestr(arcname, image)
+    except ValueError as e:
+        logger.warning('Bad jpeg output for %s: %s', infile, e)
+        p.kill()
+        success = False
+
+    p.stdout.close()
+    p.wait()
+    if not success or p.returncode != 0:
+        os.remove(tmpzip)
+        return None
+
+    os.rename(tmpzip, jpgzip)
+    return num_pages
+
+def google_ocr(client, input_file, gocr_file, content = None):
     if gocr_file and os.path.exists(gocr_file):
         serialized = codecs.open(gocr_file, 'r', 'utf-8').read()
         response = vision.AnnotateImageResponse()
@@ -79,7 +177,8 @@ def google_ocr(client, input_file, gocr_file):
         except ParseError:
             pass
 
-    content = io.open(input_file, 'rb').read()
+    if content == None:
+        content = io.open(input_file, 'rb').read()
     image = vision.Image(content=content)
 
     try:
@@ -368,6 +467,29 @@ def to_hocr(jpgdir, filenames, client, outhandle, gocr_dir, ppi, langtags):
 
     hocr.write_footer()
 
+def zip_to_hocr(jpgzip, client, outhandle, gocr_dir, ppi, langtags):
+    # to_hocr over the page images in a zip from pdf_to_jpg_zip
+    logger = logging.getLogger('gvision')
+    hocr   = HOCR(outhandle, langtags)
+
+    hocr.write_header()
+    with ZipFile(jpgzip) as zipobj:
+        for member in zipobj.namelist():
+            filename  = os.path.basename(member)
+            if gocr_dir:
+                gocr_file, n =  re.subn('jpg$', 'json', filename)
+                gocr_file = os.path.join(gocr_dir, gocr_file)
+            else:
+                gocr_file = None
+            response  = google_ocr(client, member, gocr_file, zipobj.read(member))
+            if response and response.full_text_annotation.pages:
+                hocr.handle_google_response(response, ppi, filename)
+            else:
+                logger.warning('No pages in %s', filename)
+                hocr.handle_page(None, ppi, filename)
+
+    hocr.write_footer()
+
 def to_abby(jpgdir, filenames, client, outhandle, gocr_dir, ppi, langtags):
     logger = logging.getLogger('gvision')
     abby= Abby(outhandle, langtags)
@@ -6,19 +6,25 @@ import re
 import shutil
 import os
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from requests.exceptions import HTTPError
-from zipfile import ZipFile
-import codecs
+import gzip
 
 from internetarchive import upload, get_session, get_item, modify_metadata
 from egazette.utils.file_storage import FileManager
+from egazette.utils.iacache import IAItemCache, get_metadata_hash, get_metadata_changes
+from egazette.utils.iaqueue import UploadQueue
 
 from egazette.utils import reporting
 from egazette.utils import utils
 from egazette.utils import pdf_ops
-from egazette.gvision import get_google_client, to_hocr, pdf_to_jpg, compress_file, LangTags
+from egazette.gvision import get_google_client, zip_to_hocr, pdf_to_jpg_zip, LangTags
 from egazette.srcs import datasrcs_info
 
+class RetryLater(Exception):
+    pass
+
 class Stats:
     def __init__(self):
         self.uploads = {}
@@ -27,6 +33,9 @@ class Stats:
         self.modify = {}
         self.modify_success = {}
 
+        # updated from the threads of an UploadPipeline
+        self.lock = threading.Lock()
+
     def update_upload(self, srcname, success):    
         self.update(srcname, success, self.uploads, self.upload_success)
 
@@ -34,14 +43,15 @@ class Stats:
         self.update(srcname, success, self.modify, self.modify_success)
 
     def update(self, srcname, success, total, total_success):
-        if srcname not in total:
-            total[srcname]         = 0
-            total_success[srcname] = 0
+        with self.lock:
+            if srcname not in total:
+                total[srcname]         = 0
+                total_success[srcname] = 0
 
-        total[srcname] += 1
+            total[srcname] += 1
 
-        if success:
-            total_success[srcname] += 1
+            if success:
+                total_success[srcname] += 1
 
     def get_msg_by_srcs(self, msg, total, total_success):
         msg.append('------------')
@@ -70,73 +80,84 @@ class Stats:
              msg.append('No updates from %s' % ', '.join(noupdate))
         return '\n'.join(msg)
 
-def create_zip(zipfile, filenames):
-    zipobj = ZipFile(zipfile, 'w')
-    for filename in filenames:
-        head, tail   = os.path.split(filename)
-        head1, tail1 = os.path.split(head)
-        dirpath = os.path.join(tail1, tail)
-        zipobj.write(filename, dirpath)
-    zipobj.close()
-
-def atoi(text):
-    return int(text) if text.isdigit() else text
-
-def natural_keys(text):
-    return [ atoi(c) for c in re.split('(\d+)', text) ]
-
 class Gvision:
     def __init__(self, iadir, key_file):
         self.client = get_google_client(key_file)
         self.iadir  = iadir
+        self.logger = logging.getLogger('iasync.gvision')
 
     def mkdir(self, path):
         if not os.path.exists(path):
             os.mkdir(path)
 
-    def convert_to_jpg_hocr(self, identifier, filepath):
+    def get_paths(self, identifier, filepath):
+        # item directory, zip of page images, Vision json per page and
+        # gzipped hocr of filepath
         path, filename  = os.path.split(filepath)
         name, n = re.subn('.pdf$', '', filename)
 
         item_path = os.path.join(self.iadir, identifier)
-        jpgdir    = os.path.join(item_path, name + '_jpg')
+        jpgzip    = os.path.join(item_path, name + '_jpg.zip')
         gocrdir   = os.path.join(item_path, name + '_gocr')
-        hocrfile  = os.path.join(item_path, name + '_chocr.html')
+        hocrfile  = os.path.join(item_path, name + '_chocr.html.gz')
+        return item_path, jpgzip, gocrdir, hocrfile
 
-        self.mkdir(item_path)
-        self.mkdir(jpgdir)
-        self.mkdir(gocrdir)
+    def rasterize(self, identifier, filepath, num_pages = None):
+        # the number of pages of filepath, None if it could not be
+        # converted. The page images are written straight into the zip,
+        # which is renamed into place once complete, so the zip of an
+        # earlier run that got num_pages is not made again
+        item_path, jpgzip, gocrdir, hocrfile = self.get_paths(identifier, filepath)
+
+        if num_pages and os.path.exists(jpgzip):
+            return num_pages
 
-        success = pdf_to_jpg(filepath, jpgdir, 300)
-        if not success:
+        self.mkdir(item_path)
+        num_pages = pdf_to_jpg_zip(filepath, jpgzip, 300)
+        if num_pages == None:
             self.logger.warning('Could not convert into jpg files %s', filepath)
-            return None, None
+        return num_pages
 
-        filenames = os.listdir(jpgdir)
-        filenames.sort(key=natural_keys)
+    def ocr(self, identifier, filepath):
+        # the hocr of the page images of filepath, gzipped as it is written;
+        # pages that have their Vision json in the _gocr directory are not
+        # sent again
+        item_path, jpgzip, gocrdir, hocrfile = self.get_paths(identifier, filepath)
+        self.mkdir(gocrdir)
 
-        outhandle = codecs.open(hocrfile, 'w', encoding = 'utf8')
+        tmpfile   = hocrfile + '.part'
         langtags  = LangTags()
-        to_hocr(jpgdir, filenames, self.client, outhandle, gocrdir, 300, langtags)
-        outhandle.close()
-        
-        hocrfile_gz =  hocrfile + '.gz'
-        compress_file(hocrfile, hocrfile_gz)
-
-        jpgzip   = jpgdir + '.zip'
-        jpgfiles = [os.path.join(jpgdir, x) for x in filenames]
+        with gzip.open(tmpfile, 'wt', encoding = 'utf8') as outhandle:
+            zip_to_hocr(jpgzip, self.client, outhandle, gocrdir, 300, langtags)
+        os.rename(tmpfile, hocrfile)
+        return hocrfile
+
+    def package(self, identifier, filepath):
+        # the zip of the page images of filepath, made by rasterize
+        item_path, jpgzip, gocrdir, hocrfile = self.get_paths(identifier, filepath)
+        if not os.path.exists(jpgzip):
+            raise IOError('No page images for %s' % filepath)
+        return jpgzip
 
-        create_zip(jpgzip, jpgfiles)
-        if os.path.exists(jpgdir):
-            shutil.rmtree(jpgdir)
+    def convert_to_jpg_hocr(self, identifier, filepath):
+        if not self.rasterize(identifier, filepath):
+            return None, None
 
+        hocrfile_gz = self.ocr(identifier, filepath)
+        jpgzip      = self.package(identifier, filepath)
         return jpgzip, hocrfile_gz
 
 class GazetteIA:
     def __init__(self, gvisionobj, file_storage, access_key, secret_key, \
-                 loglevel, logfile):
+                 loglevel, logfile, item_cache = None):
         self.gvisionobj   = gvisionobj         
         self.file_storage = file_storage
+        # IAItemCache, consulted before asking IA for an item
+        self.item_cache   = item_cache
+        # with dry_run, metadata changes are only reported
+        self.dry_run      = False
+        self.report_lock  = threading.Lock()
+        self.changed_fields = {}
         self.access_key   = access_key
         self.secret_key   = secret_key
 
@@ -187,34 +208,80 @@ class GazetteIA:
 
             metainfo['linkids'] = linkids
 
-    def upload(self, relurl):
+    def wait_for_item(self, identifier, wait):
+        while 1:
+            item = self.get_ia_item(identifier)
+            if item:
+                return item
+            if not wait:
+                raise RetryLater('Could not get item %s' % identifier)
+            time.sleep(self.reattempt_delay_secs)
+
+    def refresh_item(self, identifier, wait):
+        # (exists, file names) of the item as IA has it now
+        item = self.wait_for_item(identifier, wait)
+        if item.exists:
+            files = set([f.name for f in item.get_files()])
+        else:
+            files = set([])
+
+        if self.item_cache:
+            self.item_cache.put(identifier, item.exists, files)
+        return item.exists, files
+
+    def get_item_state(self, identifier, filenames, to_update, wait):
+        # the cached state of the item if it is enough to decide, else the
+        # state read from IA; an item that lacks some of filenames could
+        # have got them since it was cached
+        if self.item_cache:
+            state = self.item_cache.get(identifier)
+            if state != None:
+                exists, files, meta_hash = state
+                if exists and (to_update or files.issuperset(filenames)):
+                    return exists, files
+
+        return self.refresh_item(identifier, wait)
+
+    def get_doc_files(self, relurl):
+        rawfile  = self.file_storage.get_rawfile_path(relurl)
+        metafile = self.file_storage.get_metafile_path(relurl)
+        return rawfile, metafile
+
+    def lookup(self, relurl, to_update, wait = True):
+        # the metadata stage of uploading or updating relurl: returns the
+        # task for the transfer stage, None if there is nothing to do. With
+        # wait False, an IA lookup that fails raises RetryLater instead of
+        # being retried here
         metainfo = self.file_storage.get_metainfo(relurl)
         if metainfo == None:
             self.logger.warning('No metainfo, Ignoring upload for %s' % relurl) 
-            return False
+            return None
 
         identifier = self.get_identifier(relurl, metainfo)
         if identifier == None:
             self.logger.warning('Could not form IA identifier. Ignoring upload for %s' % relurl) 
-            return False
+            return None
         self.update_links(relurl, metainfo)
 
-        while 1:
-            item = self.get_ia_item(identifier)
-            if item:
-                break
-            time.sleep(self.reattempt_delay_secs)
+        filenames = []
+        if not to_update:
+            rawfile, metafile = self.get_doc_files(relurl)
+            filenames = [rawfile.split('/')[-1], metafile.split('/')[-1]]
 
-        rawfile  = self.file_storage.get_rawfile_path(relurl)
-        metafile = self.file_storage.get_metafile_path(relurl)
-
-        if item.exists:    
-            filelist = item.get_files() 
+        exists, files = self.get_item_state(identifier, filenames, to_update, wait)
+        if to_update and exists:
+            metadata = self.to_ia_metadata(relurl, metainfo)
+            if not self.get_metadata_changes(identifier, metadata):
+                self.logger.info('Metadata unchanged for %s', identifier)
+                return None
+            return ('modify', identifier, metadata, None, None)
 
-            files = set([f.name for f in filelist])
-            rawname  = rawfile.split('/')[-1]
-            metaname = metafile.split('/')[-1]
+        if to_update:
+            rawfile, metafile = self.get_doc_files(relurl)
+        rawname  = rawfile.split('/')[-1]
+        metaname = metafile.split('/')[-1]
 
+        if exists:    
             to_upload = []
             if rawname in files:
                 self.logger.info('Rawfile already exists for %s. Ignoring.' % \
@@ -235,10 +302,25 @@ class GazetteIA:
 
         if not to_upload:
             self.logger.info('No files need to be uploaded for %s', identifier)
-            return False
+            return None
+
+        return ('upload', identifier, metadata, to_upload, files)
+
+    def run_task(self, task, wait = True):
+        # the transfer stage, for a task from lookup
+        kind, identifier, metadata, to_upload, files = task
+        if kind == 'modify':
+            return self.modify(identifier, metadata, wait)
 
         if self.gvisionobj:
             to_upload = self.ocr_files(identifier, to_upload)
+        return self.send(identifier, metadata, to_upload, files)
+
+    def send(self, identifier, metadata, to_upload, files):
+        # the upload of to_upload, with the outputs of OCR if any. metadata
+        # is complete when the upload creates the item, None otherwise
+        complete = (metadata != None)
+        if self.gvisionobj:
             if metadata == None:
                 metadata = {}
             metadata['ocr'] = 'google-cloud-vision IndianKanoon 1.0'
@@ -251,12 +333,30 @@ class GazetteIA:
         else:
             self.logger.warning('Error in uploading %s', identifier)
 
+        if self.item_cache and success:
+            # to_upload holds what was sent, with a fixed bad pdf
+            filenames = [os.path.basename(f) for f in to_upload]
+            if complete:
+                self.item_cache.add_files(identifier, filenames, metadata)
+            else:
+                self.item_cache.add_files(identifier, filenames)
+                if metadata:
+                    self.item_cache.update_metadata(identifier, metadata)
+        elif self.item_cache:
+            self.item_cache.invalidate(identifier)
+
         if self.gvisionobj and to_upload:
             for filepath in to_upload:
                 os.remove(filepath)
 
         return success
 
+    def upload(self, relurl):
+        task = self.lookup(relurl, False)
+        if task == None:
+            return False
+        return self.run_task(task)
+
     def pop_rawfile(self, to_upload):
         idx = -1
         for i,file in enumerate(to_upload):
@@ -422,6 +522,12 @@ class GazetteIA:
            metadata['date'] = '%s' % dateobj
        
        metadata['description'] = self.get_description(metainfo, src)
+
+       # metainfo values are kept as scraped, IA rejects metadata with
+       # characters that are illegal in xml
+       for k, v in metadata.items():
+           if isinstance(v, str):
+               metadata[k] = utils.replace_xml_illegal_chars(v)
        return metadata
 
     def format_list_field(self, field_name, field_value, srcinfo):
@@ -548,32 +654,67 @@ class GazetteIA:
        desc_html = '<br/>'.join(['%s: %s' % (d[0], d[1]) for d in desc])
        return '<p>' + desc_html + '</p>'
 
-    def update_meta(self, relurl):
-        metainfo = self.file_storage.get_metainfo(relurl)
-        if metainfo == None:
-            self.logger.warning('No metainfo, Ignoring upload for %s' % relurl)
+    def get_metadata_changes(self, identifier, metadata):
+        # the fields of metadata not already sent to the item, all of them
+        # when iasync has not sent metadata to it before
+        if not self.item_cache:
+            return metadata
+
+        state = self.item_cache.get(identifier)
+        if state != None and state[2] == get_metadata_hash(metadata):
+            return {}
+
+        old = self.item_cache.get_metadata(identifier)
+        if old == None:
+            return metadata
+        return get_metadata_changes(old, metadata)
+
+    def report_changes(self, identifier, old, changes):
+        with self.report_lock:
+            for k in sorted(changes.keys()):
+                print('%s\t%s\t%s -> %s' % (identifier, k, old.get(k), changes[k]))
+                self.changed_fields[k] = self.changed_fields.get(k, 0) + 1
+
+    def get_changes_summary(self):
+        msg = ['Field\tItems']
+        for k in sorted(self.changed_fields.keys()):
+            msg.append('%s\t%d' % (k, self.changed_fields[k]))
+        return '\n'.join(msg)
+
+    def modify(self, identifier, metadata, wait):
+        changes = self.get_metadata_changes(identifier, metadata)
+        if not changes:
             return False
 
-        identifier = self.get_identifier(relurl, metainfo)
-        self.update_links(relurl, metainfo)
+        if self.dry_run:
+            old = {}
+            if self.item_cache:
+                old = self.item_cache.get_metadata(identifier) or {}
+            self.report_changes(identifier, old, changes)
+            return False
 
+        count = self.num_reattempts
         while 1:
-            item = self.get_ia_item(identifier)
-            if item:
+            if self.ia_modify_metadat(identifier, changes):
                 break
-            time.sleep(self.reattempt_delay_secs)
-
-        if not item.exists:
-            return self.upload(relurl)
-        else:
-            metadata = self.to_ia_metadata(relurl, metainfo)
-            while 1:
-                if self.ia_modify_metadat(identifier, metadata):
-                    break
-                time.sleep(self.reattempt_delay_secs)    
- 
+            if not wait:
+                raise RetryLater('Could not modify metadata of %s' % identifier)
+            count -= 1
+            if count <= 0:
+                self.logger.warning('Giving up modifying metadata of %s', identifier)
+                return False
+            time.sleep(self.reattempt_delay_secs)    
+
+        if self.item_cache:
+            self.item_cache.set_metadata(identifier, metadata)
         return True
 
+    def update_meta(self, relurl):
+        task = self.lookup(relurl, True)
+        if task == None:
+            return False
+        return self.run_task(task)
+
     def ia_modify_metadat(self, identifier, metadata):
         try:
             modify_metadata(identifier, metadata = metadata, \
@@ -595,7 +736,14 @@ def print_usage(progname):
                         [-d days_to_sync]
                         [-D gazette_directory]
                         [-I internet_archive_directory]
+                        [-c items_in_flight (pipelined uploads, default: one at a time)]
+                        [-n (with -m, print the metadata changes instead of sending them)]
+                        [--verify (refresh cached IA item states older than -A days)]
+                        [-A max_age_days (with --verify, default 30)]
                         [-g google_gvision_key]
+                        [--ocr-threads n (with -g/-I, default 2)]
+                        [--package-threads n (with -g/-I, default 1)]
+                        [--upload-threads n (with -g/-I, default 2)]
                         [-t start_time (%Y-%m-%d %H:%M:%S)]
                         [-T end_time (%Y-%m-%d %H:%M:%S)]
                         [-p postmark_token]
@@ -627,15 +775,298 @@ def print_usage(progname):
                         ] 
     ''')                     
 
+def update_stats(stats, srcname, to_upload, to_update, success):
+    if to_upload:
+        stats.update_upload(srcname, success)
+    elif to_update:
+        stats.update_modify(srcname, success)
+
 def handle_relurl(gazette_ia, relurl, to_upload, to_update, stats):
     srcname = gazette_ia.get_srcname(relurl)
 
     if to_upload:
         success = gazette_ia.upload(relurl)
-        stats.update_upload(srcname, success)
     elif to_update:
         success = gazette_ia.update_meta(relurl)   
-        stats.update_modify(srcname, success)
+    else:
+        return
+    update_stats(stats, srcname, to_upload, to_update, success)
+
+def verify_items(gazette_ia, max_age_days, num_threads):
+    # rereads from IA the cached items not checked in max_age_days
+    logger = logging.getLogger('iasync.verify')
+    before = time.time() - max_age_days * 24 * 3600
+    identifiers = gazette_ia.item_cache.get_stale(before)
+    logger.info('Verifying %d cached items', len(identifiers))
+
+    def refresh(identifier):
+        try:
+            gazette_ia.refresh_item(identifier, False)
+        except RetryLater as e:
+            logger.warning('%s', e)
+            return False
+        return True
+
+    with ThreadPoolExecutor(num_threads) as executor:
+        refreshed = sum(executor.map(refresh, identifiers))
+    logger.info('Refreshed %d of %d cached items', refreshed, len(identifiers))
+
+class PipelineItem:
+    def __init__(self, relurl):
+        self.relurl   = relurl
+        self.task     = None
+        self.attempts = 0
+        self.error    = None
+
+class UploadPipeline:
+    '''
+    handle_relurl for up to max_inflight relurls at a time. The lookup stage
+    (metainfo and the IA item) and the transfer stage (OCR, upload or
+    metadata change) have their own threads, so lookups of the next items
+    go on while files are being sent. An IA call that fails puts its item
+    back after reattempt_delay_secs without holding a thread, up to
+    max_attempts times; the item keeps its slot meanwhile.
+    '''
+    def __init__(self, gazette_ia, stats, to_upload, to_update, max_inflight, \
+                 max_attempts = 12, num_transfers = None):
+        self.gazette_ia   = gazette_ia
+        self.stats        = stats
+        self.to_upload    = to_upload
+        self.to_update    = to_update
+        self.max_attempts = max_attempts
+        self.logger       = logging.getLogger('iasync.pipeline')
+
+        self.lookups   = ThreadPoolExecutor(max_inflight)
+        self.transfers = ThreadPoolExecutor(num_transfers or max_inflight)
+        self.slots     = threading.BoundedSemaphore(max_inflight)
+        self.cond      = threading.Condition()
+        self.pending   = 0
+
+    def submit(self, relurl):
+        # blocks while max_inflight items are in the pipeline
+        self.slots.acquire()
+        with self.cond:
+            self.pending += 1
+        self.lookups.submit(self.lookup, PipelineItem(relurl))
+
+    def lookup(self, item):
+        try:
+            task = self.gazette_ia.lookup(item.relurl, not self.to_upload and \
+                                          self.to_update, wait = False)
+        except RetryLater as e:
+            self.retry(item, self.lookups, self.lookup, e)
+            return
+        except Exception as e:
+            self.logger.exception('Error in lookup of %s: %s', item.relurl, e)
+            self.finish(item, False)
+            return
+
+        if task == None:
+            self.finish(item, False)
+            return
+        item.task = task
+        self.transfers.submit(self.transfer, item)
+
+    def transfer(self, item):
+        try:
+            success = self.gazette_ia.run_task(item.task, wait = False)
+        except RetryLater as e:
+            self.retry(item, self.transfers, self.transfer, e)
+            return
+        except Exception as e:
+            self.logger.exception('Error in transfer of %s: %s', item.relurl, e)
+            success = False
+        self.finish(item, success)
+
+    def retry(self, item, pool, stage, error):
+        item.attempts += 1
+        item.error     = str(error)
+        if item.attempts >= self.max_attempts:
+            self.logger.warning('Giving up on %s after %d attempts: %s', \
+                                item.relurl, item.attempts, item.error)
+            self.finish(item, False)
+            return
+
+        self.logger.info('Retrying %s (attempt %d): %s', item.relurl, \
+                         item.attempts, item.error)
+        timer = threading.Timer(self.gazette_ia.reattempt_delay_secs, \
+                                pool.submit, (stage, item))
+        timer.daemon = True
+        timer.start()
+
+    def finish(self, item, success):
+        srcname = self.gazette_ia.get_srcname(item.relurl)
+        update_stats(self.stats, srcname, self.to_upload, self.to_update, success)
+
+        with self.cond:
+            self.pending -= 1
+            self.cond.notify_all()
+        self.slots.release()
+
+    def close(self):
+        # waits for the items in flight, retries included
+        with self.cond:
+            while self.pending > 0:
+                self.cond.wait()
+        self.lookups.shutdown()
+        self.transfers.shutdown()
+
+class OcrPipeline(UploadPipeline):
+    '''
+    An UploadPipeline for uploads with OCR, in stages: lookup, ocr (pages
+    rasterized into a zip and sent to Google Vision), package (the files to
+    upload in place of the pdf) and upload, each with its own threads, so that a slow OCR does not hold up
+    the uploads of the items already packaged. An item past its lookup is
+    kept in an UploadQueue at its stage; resume() picks up the items that a
+    run which was killed left there. An item whose OCR or upload fails stays
+    in the queue for the next run, until it failed max_failures times; it
+    is then dropped with its error logged and is looked up afresh if its
+    relurl comes up again.
+    '''
+    def __init__(self, gazette_ia, stats, queue, num_ocr, num_package, num_upload, \
+                 max_inflight = None, max_failures = 3):
+        if max_inflight == None:
+            max_inflight = 2 * (num_ocr + num_package + num_upload)
+        UploadPipeline.__init__(self, gazette_ia, stats, True, False, max_inflight, \
+                                num_transfers = num_upload)
+        self.queue    = queue
+        self.gvision  = gazette_ia.gvisionobj
+        self.max_failures = max_failures
+        self.ocrs     = ThreadPoolExecutor(num_ocr)
+        self.packages = ThreadPoolExecutor(num_package)
+
+        self.stages   = {'ocr':     (self.ocrs, self.ocr), \
+                         'package': (self.packages, self.package), \
+                         'upload':  (self.transfers, self.transfer)}
+
+    def resume(self):
+        resumed = 0
+        for entry in self.queue.get_entries():
+            if entry.attempts >= self.max_failures:
+                self.give_up(entry)
+                continue
+
+            self.logger.info('Resuming %s at %s after %d failures', entry.identifier, \
+                             entry.stage, entry.attempts)
+            self.slots.acquire()
+            with self.cond:
+                self.pending += 1
+            self.dispatch(entry, entry.stage)
+            resumed += 1
+        return resumed
+
+    def give_up(self, entry):
+        self.logger.warning('Giving up on %s at %s after %d failures: %s', \
+                            entry.identifier, entry.stage, entry.attempts, entry.error)
+        self.queue.remove(entry.identifier)
+
+    def submit(self, relurl):
+        if self.queue.has_relurl(relurl):
+            # resumed
+            return
+        UploadPipeline.submit(self, relurl)
+
+    def dispatch(self, entry, stage):
+        entry.stage = stage
+        self.queue.save(entry)
+        pool, func = self.stages[stage]
+        pool.submit(func, entry)
+
+    def fail(self, entry, error):
+        self.logger.warning('Error in %s of %s: %s', entry.stage, entry.identifier, error)
+        entry.attempts += 1
+        entry.error     = str(error)
+        if entry.attempts >= self.max_failures:
+            self.give_up(entry)
+        else:
+            self.queue.save(entry)
+        self.finish(entry, False)
+
+    def get_pdfs(self, entry):
+        return [f for f in entry.task['to_upload'] if re.search('pdf$', f)]
+
+    def lookup(self, item):
+        try:
+            task = self.gazette_ia.lookup(item.relurl, False, wait = False)
+        except RetryLater as e:
+            self.retry(item, self.lookups, self.lookup, e)
+            return
+        except Exception as e:
+            self.logger.exception('Error in lookup of %s: %s', item.relurl, e)
+            self.finish(item, False)
+            return
+
+        if task == None:
+            self.finish(item, False)
+            return
+
+        entry = self.queue.add(item.relurl, task, 'ocr')
+        if self.get_pdfs(entry):
+            self.dispatch(entry, 'ocr')
+        else:
+            self.dispatch(entry, 'upload')
+
+    def ocr(self, entry):
+        pages = entry.task['pages']
+        try:
+            for filepath in self.get_pdfs(entry):
+                num_pages = self.gvision.rasterize(entry.identifier, filepath, \
+                                                   pages.get(filepath))
+                # 0 for a pdf that could not be rasterized
+                pages[filepath] = num_pages or 0
+                self.queue.save(entry)
+                if num_pages:
+                    self.gvision.ocr(entry.identifier, filepath)
+        except Exception as e:
+            self.fail(entry, e)
+            return
+        self.dispatch(entry, 'package')
+
+    def package(self, entry):
+        # the pdfs are replaced by their page images and hocr, as ocr_files does
+        pages = entry.task['pages']
+        final = []
+        try:
+            for filepath in entry.task['to_upload']:
+                if not re.search('pdf$', filepath):
+                    final.append(filepath)
+                elif pages.get(filepath):
+                    hocrfile = self.gvision.get_paths(entry.identifier, filepath)[3]
+                    final.append(self.gvision.package(entry.identifier, filepath))
+                    final.append(hocrfile)
+        except Exception as e:
+            self.fail(entry, e)
+            return
+        entry.task['to_upload'] = final
+        self.dispatch(entry, 'upload')
+
+    def transfer(self, entry):
+        kind, identifier, metadata, to_upload, files = entry.get_task()
+        missing = [f for f in to_upload if not os.path.exists(f)]
+        if missing:
+            # removed by a failed upload, OCR is redone from the _gocr json
+            self.logger.warning('Missing %s for %s, looking it up again', \
+                                ', '.join(missing), identifier)
+            self.queue.remove(identifier)
+            self.lookups.submit(self.lookup, PipelineItem(entry.relurl))
+            return
+
+        try:
+            success = self.gazette_ia.send(identifier, metadata, to_upload, files)
+        except Exception as e:
+            self.logger.exception('Error in upload of %s: %s', identifier, e)
+            success = False
+
+        if success:
+            self.queue.remove(identifier)
+            self.finish(entry, True)
+        else:
+            self.fail(entry, 'upload failed')
+
+    def close(self):
+        UploadPipeline.close(self)
+        self.ocrs.shutdown()
+        self.packages.shutdown()
 
 if __name__ == '__main__':
     progname  = sys.argv[0]
@@ -657,8 +1088,17 @@ if __name__ == '__main__':
     to_addrs   = []
     key_file   = None
     iadir      = None
-
-    optlist, remlist = getopt.getopt(sys.argv[1:], 'a:k:d:D:f:g:hiI:l:s:t:T:mr:uE:p:U:')
+    max_inflight = None
+    verify       = False
+    dry_run      = False
+    max_age_days = 30
+    num_ocr      = 2
+    num_package  = 1
+    num_upload   = 2
+
+    optlist, remlist = getopt.getopt(sys.argv[1:], 'a:A:c:k:d:D:f:g:hiI:l:ns:t:T:mr:uE:p:U:', \
+                                     ['verify', 'ocr-threads=', 'package-threads=', \
+                                      'upload-threads='])
     for o, v in optlist:
         if o == '-l':
             loglevel = v
@@ -701,6 +1141,20 @@ if __name__ == '__main__':
             iadir = v
         elif o == '-g':
             key_file = v
+        elif o == '-c':
+            max_inflight = int(v)
+        elif o == '--verify':
+            verify = True
+        elif o == '-n':
+            dry_run = True
+        elif o == '--ocr-threads':
+            num_ocr = int(v)
+        elif o == '--package-threads':
+            num_package = int(v)
+        elif o == '--upload-threads':
+            num_upload = int(v)
+        elif o == '-A':
+            max_age_days = int(v)
         elif o == '-h':
             print_usage(progname)
             sys.exit(0)
@@ -723,7 +1177,7 @@ if __name__ == '__main__':
         print_usage(progname)
         sys.exit(0)
 
-    if not to_update and not to_upload:
+    if not to_update and not to_upload and not verify:
         print('Please specify whether to upload or update to internetarchive')
         print_usage(progname)
         sys.exit(0)
@@ -771,23 +1225,46 @@ if __name__ == '__main__':
 
 
     storage = FileManager(datadir, False, False)
-    gazette_ia = GazetteIA(gvisionobj, storage, access_key, secret_key, loglevel, logfile)
+    item_cache = IAItemCache(os.path.join(datadir, 'stats', 'iaitems.db'))
+    gazette_ia = GazetteIA(gvisionobj, storage, access_key, secret_key, loglevel, logfile, \
+                           item_cache = item_cache)
+    gazette_ia.dry_run = dry_run
     stats        = Stats()
 
+    if verify:
+        verify_items(gazette_ia, max_age_days, max_inflight or 8)
+        if not to_update and not to_upload:
+            sys.exit(0)
+
     if len(srcnames) == 0:
         srcnames = datasrcs_info.srcinfos.keys()
 
     if relurls:
-        for relurl in relurls:
-            handle_relurl(gazette_ia, relurl, to_upload, to_update, stats)
+        relurl_iter = iter(relurls)
     elif from_stdin:
-        for line in sys.stdin:
-            relurl = line.strip()
-            handle_relurl(gazette_ia, relurl, to_upload, to_update, stats)
+        relurl_iter = (line.strip() for line in sys.stdin)
     else:        
-        for relurl in storage.find_matching_relurls(srcnames, start_ts, end_ts):
+        relurl_iter = storage.find_matching_relurls(srcnames, start_ts, end_ts)
+
+    if gvisionobj and to_upload:
+        queue    = UploadQueue(os.path.join(datadir, 'stats', 'iaqueue.db'))
+        pipeline = OcrPipeline(gazette_ia, stats, queue, num_ocr, num_package, \
+                               num_upload, max_inflight)
+        pipeline.resume()
+        for relurl in relurl_iter:
+            pipeline.submit(relurl)
+        pipeline.close()
+    elif max_inflight:
+        pipeline = UploadPipeline(gazette_ia, stats, to_upload, to_update, max_inflight)
+        for relurl in relurl_iter:
+            pipeline.submit(relurl)
+        pipeline.close()
+    else:
+        for relurl in relurl_iter:
             handle_relurl(gazette_ia, relurl, to_upload, to_update, stats)
 
+    if dry_run and to_update:
+        print(gazette_ia.get_changes_summary())
 
 
     if to_addrs:
@@ -11,7 +11,6 @@ class AssamBase(BaseGazette):
         BaseGazette.__init__(self, name, storage)
         self.baseurl  = 'https://dpns.assam.gov.in/home.php'
         self.hostname = 'dpns.assam.gov.in'
-        self.page_cache = {}
 
         self.months = [ 'January', 'February', 'March', \
                         'April', 'May', 'June', 'July', 'August', \
@@ -28,17 +27,6 @@ class AssamBase(BaseGazette):
         self.full_date_re = r"Date(\s|_|-)+" + self.base_date_re
 
 
-
-    def download_url_cached(self, url):
-
-        if url not in self.page_cache:
-            response = self.download_url(url)
-
-            self.page_cache[url] = response
-
-        return self.page_cache[url]
- 
-
     def get_yearly_links(self, gztype):
         olinks = {}
         elinks = {}
@@ -459,21 +447,23 @@ class AssamBase(BaseGazette):
 
     def download_onetype(self, dls, relpath, dateobj, url, gztype):
         pagenum = 1
-        response = self.download_url_cached(url)
+        response = self.download_listing(url, dateobj, cached = True)
         while response is not None and response.webpage is not None:
             curr_url = response.response_url
             metainfos, nextpage = self.parse_results(response.webpage, curr_url, pagenum)
 
-            for metainfo in metainfos:
-                relurls = self.download_metainfo(relpath, metainfo, curr_url, dateobj, gztype)
-                dls.extend(relurls)
+            # the page is still parsed for the link to the next one
+            if not response.unchanged:
+                for metainfo in metainfos:
+                    relurls = self.download_metainfo(relpath, metainfo, curr_url, dateobj, gztype)
+                    dls.extend(relurls)
 
             if nextpage is None:
                 break
 
             pagenum += 1
             nexturl = urllib.parse.urljoin(curr_url, nextpage['href'])
-            response = self.download_url_cached(nexturl)
+            response = self.download_listing(nexturl, dateobj, cached = True)
 
 
 class AssamExtraOrdinary(AssamBase):
@@ -3,12 +3,19 @@ import datetime
 import urllib.request, urllib.parse, urllib.error
 import os
 import time
+import copy
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor, Future
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
 import ssl
 
 from ..utils import utils
+from ..utils import asynchttp
+from ..utils import listingcache
+from ..utils import ratecontrol
+from ..utils import telemetry
 
 from .datasrcs_info import get_start_date
 
@@ -19,6 +26,14 @@ class WebResponse:
        self.error        = None
        self.response_url = None
 
+       # set by Downloader.download_listing
+       self.unchanged      = False
+       self.listing_digest = None
+
+       # set instead of webpage when the body was streamed to a file
+       self.head      = None
+       self.num_bytes = 0
+
    def set_error(self, error):
        self.error = error
 
@@ -31,19 +46,114 @@ class WebResponse:
    def set_response_url(self, response_url):
        self.response_url = response_url
 
+   def set_streamed(self, head, num_bytes):
+       self.head      = head
+       self.num_bytes = num_bytes
+
+class GazetteBatch:
+    """Fans out the gazette downloads of one result page.
+
+    Plain GETs are handed to a small thread pool while saves that carry
+    postdata or a cookie jar run immediately in the calling thread, so
+    ASP.NET style postbacks keep their order within the session. The
+    crawler already holds one of the -H slots of its host; a job goes to
+    the pool only if it gets another one, else it runs in the calling
+    thread too. Every request still takes its token from the host's rate
+    controller in download_url.
+    """
+    def __init__(self, gazette, max_workers):
+        self.gazette  = gazette
+        self.results  = []
+        self.relurls  = []
+        self.executor = None
+        if max_workers > 1:
+            # created here, not lazily by the first of the threads
+            gazette.get_rate_control()
+            self.executor = ThreadPoolExecutor(max_workers = max_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.wait()
+        return False
+
+    def save_gazette(self, relurl, gurl, metainfo, **kwargs):
+        serial = kwargs.get('postdata') != None or kwargs.get('cookiefile') != None
+        if self.executor == None or serial or not self.gazette.acquire_host_slot():
+            result = self.gazette.save_gazette(relurl, gurl, metainfo, **kwargs)
+        else:
+            result = self.executor.submit(self.run_job, relurl, gurl, metainfo, kwargs)
+        self.results.append((relurl, result))
+
+    def run_job(self, relurl, gurl, metainfo, kwargs):
+        try:
+            return self.gazette.save_gazette(relurl, gurl, metainfo, **kwargs)
+        finally:
+            self.gazette.release_host_slot()
+
+    def wait(self):
+        relurls = []
+        for relurl, result in self.results:
+            if isinstance(result, Future):
+                try:
+                    result = result.result()
+                except Exception as e:
+                    self.gazette.logger.warning('Error in saving %s: %s', relurl, e)
+                    result = False
+            if result:
+                relurls.append(relurl)
+
+        if self.executor != None:
+            self.executor.shutdown()
+            self.executor = None
+        self.results = []
+        self.relurls = relurls
+        return relurls
+
 class Downloader:
     def __init__(self, name, storage_manager):
         self.hostname    = None
         self.name        = name
 
         self.storage_manager = storage_manager
-        self.backoff  = 0
         self.lookback = 15 
         self.num_http_retries = 3
         self.retry_delay_base_secs = 100
+        # retries of download_url back off exponentially from this base, see
+        # utils/ratecontrol.py; retry_delay_base_secs stays the backoff factor
+        # of the sessions' urllib3 retries
+        self.retry_backoff_base_secs = 5
         self.retry_delay_max_secs = 300
         self.request_timeout_secs = 400
 
+        # bodies streamed to disk are read in chunks and only the first
+        # stream_head_size bytes are kept in memory for sniffing
+        self.stream_chunk_size = 64 * 1024
+        self.stream_head_size  = 8 * 1024
+
+        # utils.ratecontrol.RateController shared by the sources of a host,
+        # set by sync.py
+        self.rate_control    = None
+        self.last_request_ts = 0
+
+        # serve download_url* from the pooled asyncio engine (utils/asynchttp.py)
+        self.async_http = False
+
+        # utils.crawlstate.CrawlState journal, set by sync.py
+        self.crawl_state = None
+        self.num_failed_requests = 0
+        # requests of a GazetteBatch fail in its threads
+        self.failed_lock = threading.Lock()
+
+        # utils.download.UnitScheduler that holds the -H slots of the hosts,
+        # set by utils/download.py with -w
+        self.host_slots = None
+
+        # utils.listingcache.ListingCache, set by sync.py
+        self.listing_cache    = None
+        self.pending_listings = []
+        self.page_cache       = {}
     
         self.logger      = logging.getLogger('crawler.%s' % self.name)
 
@@ -57,30 +167,228 @@ class Downloader:
         self._ssl_ctx      = ctx
 
     def all_downloads(self, event):
-        start_date = get_start_date(self.name)
-        assert start_date != None
-        return self.sync(start_date, datetime.datetime.today(), event)
+        fromdate, todate = self.get_sync_range(None, None, True)
+        return self.sync(fromdate, todate, event)
 
     def sync_daily(self, event):
-        todate = datetime.datetime.today() #- datetime.timedelta(days = 1)
-        fromdate = todate - datetime.timedelta(days = self.lookback)
+        fromdate, todate = self.get_sync_range(None, None, False)
         return self.sync(fromdate, todate, event)
 
+    def get_sync_range(self, fromdate, todate, all_dls):
+        if all_dls:
+            start_date = get_start_date(self.name)
+            assert start_date != None
+            return start_date, datetime.datetime.today()
+
+        if fromdate == None and todate == None:
+            todate = datetime.datetime.today() #- datetime.timedelta(days = 1)
+            fromdate = todate - datetime.timedelta(days = self.lookback)
+        return fromdate, todate
+
+    def syncs_by_day(self):
+        # sources that override sync() walk their listings in their own way
+        # and cannot be split into independent days
+        return type(self).sync == Downloader.sync
+
+    def get_sync_dates(self, fromdate, todate):
+        dates   = []
+        skipped = 0
+        while fromdate <= todate:
+            dateobj = fromdate.date()
+            if self.crawl_state == None or \
+                    self.crawl_state.should_visit(self.name, dateobj, \
+                                                  always_visit_days = self.lookback):
+                dates.append(dateobj)
+            else:
+                skipped += 1
+            fromdate += datetime.timedelta(days=1)
+
+        if skipped:
+            self.logger.info('Skipping %d dates already completed as per the crawl journal', skipped)
+        return dates
+
+    def sync_oneday(self, dateobj):
+        self.logger.info('Date %s' % dateobj)
+        num_failed = self.num_failed_requests
+        self.pending_listings = []
+
+        collector = telemetry.get_collector()
+        collector.set_source(self.name)
+        start_ts  = time.time()
+
+        tmprel    = os.path.join (self.name, dateobj.__str__())
+        dls = self.download_oneday(tmprel, dateobj)
+        self.logger.info('Got %d gazettes for day %s' % (len(dls), dateobj))
+
+        complete = (self.num_failed_requests == num_failed)
+        collector.record_day(self.name, dateobj, time.time() - start_ts, \
+                             len(dls), complete)
+        collector.flush()
+
+        # the day is recorded as done only once its docs are on disk
+        self.storage_manager.flush()
+        if self.crawl_state != None:
+            self.crawl_state.finish_day(self.name, dateobj, complete, len(dls))
+
+        # listings count as processed only if nothing failed on the way
+        if self.listing_cache != None and complete and self.pending_listings:
+            self.listing_cache.mark_processed(self.pending_listings)
+        self.pending_listings = []
+        return dls
+
+    def record_listing(self, dateobj, pagenum, listing):
+        # returns True if the listing page is the same as on the last visit
+        if self.crawl_state == None:
+            return False
+        return self.crawl_state.record_listing(self.name, dateobj, pagenum, listing)
+
+    def download_url_cached(self, url):
+        # listing pages shared by all the dates of a run
+        return self.download_listing(url, None, cached = True)
+
+    def download_listing(self, url, scope, postdata = None, cached = False, **kwargs):
+        """download_url for listing pages, fingerprinted in the listing cache.
+
+        The response has unchanged set if the page (ignoring ASP.NET state) is
+        the one scope, usually the date, was last processed against. A GET of
+        a page seen before is conditional, and a 304 gets the webpage kept in
+        the listing cache. With cached the page is fetched only once in a run.
+        """
+        key = listingcache.get_listing_key(url, postdata)
+        if cached and key in self.page_cache:
+            response = self.page_cache[key]
+        else:
+            headers = dict(kwargs.pop('headers', {}))
+            if self.listing_cache != None and postdata == None:
+                headers.update(self.listing_cache.get_conditional_headers(key))
+
+            response = self.download_url(url, postdata = postdata, \
+                                         headers = headers, **kwargs)
+            if response != None and self.listing_cache != None:
+                if self.is_not_modified(response):
+                    body = self.listing_cache.get_body(key)
+                    if body != None:
+                        response.webpage        = body[1]
+                        response.listing_digest = self.listing_cache.get_digest(key)
+                        if response.response_url == None:
+                            response.set_response_url(body[0])
+                elif response.webpage != None:
+                    srvresponse = response.srvresponse
+                    if isinstance(srvresponse, dict):
+                        srvresponse = srvresponse['headers']
+                    response.listing_digest = self.listing_cache.update(key, \
+                                                   url, srvresponse, response.webpage, \
+                                                   response.response_url)
+            if cached:
+                self.page_cache[key] = response
+
+        if response == None or self.listing_cache == None or scope == None:
+            return response
+
+        # a cached response is shared across scopes
+        response = copy.copy(response)
+        response.unchanged = self.listing_cache.is_processed(key, scope, \
+                                                             response.listing_digest)
+        self.pending_listings.append((key, scope, response.listing_digest))
+        return response
+
+    def get_rate_control(self):
+        if self.rate_control == None:
+            self.rate_control = ratecontrol.RateController()
+        return self.rate_control
+
+    def get_rate_key(self, url):
+        if self.hostname:
+            return self.hostname
+        return urllib.parse.urlsplit(url).hostname
+
+    def wait_for_slot(self, url):
+        self.get_rate_control().acquire(self.get_rate_key(url))
+
+    def acquire_host_slot(self):
+        # another -H slot of the host for a concurrent download, if free;
+        # without -w a crawler process has its host to itself
+        if self.host_slots == None:
+            return True
+        return self.host_slots.try_acquire_host(self.hostname)
+
+    def release_host_slot(self):
+        if self.host_slots != None:
+            self.host_slots.release_host(self.hostname)
+
+    def count_failed_request(self):
+        with self.failed_lock:
+            self.num_failed_requests += 1
+
+    def get_response_status(self, response):
+        error = response.error
+        if error == None:
+            if isinstance(response.srvresponse, dict):
+                return response.srvresponse.get('status')
+            return None
+        if isinstance(error, urllib.error.HTTPError):
+            return error.code
+        if isinstance(error, requests.exceptions.HTTPError) and error.response != None:
+            return error.response.status_code
+        return None
+
+    def record_response(self, url, response, latency):
+        self.last_request_ts = time.time()
+
+        num_bytes = response.num_bytes
+        if response.webpage:
+            num_bytes = len(response.webpage)
+        error = response.error != None and not self.is_not_modified(response)
+        self.get_rate_control().record(self.get_rate_key(url), latency, \
+                                       status = self.get_response_status(response), \
+                                       num_bytes = num_bytes, error = error)
+        telemetry.get_collector().record_request(self.name, \
+                                                 urllib.parse.urlsplit(url).hostname, \
+                                                 latency, num_bytes, error)
+
+    def wait_for_retry(self, url, attempt, response):
+        retry_after = None
+        if isinstance(response.error, urllib.error.HTTPError) and \
+                response.error.headers != None:
+            retry_after = response.error.headers.get('Retry-After')
+
+        rate_control = self.get_rate_control()
+        delay = rate_control.get_retry_delay(self.retry_backoff_base_secs, \
+                                             self.retry_delay_max_secs, \
+                                             attempt, retry_after)
+        self.logger.info('Retrying %s in %.1f secs', url, delay)
+        telemetry.get_collector().record_retry(self.name, urllib.parse.urlsplit(url).hostname)
+        rate_control.hold(self.get_rate_key(url), delay)
+
+    def wait_since_last_request(self, secs):
+        # for servers that check the time between two requests
+        wait = self.last_request_ts + secs - time.time()
+        if wait > 0:
+            time.sleep(wait)
+
+    def is_not_modified(self, response):
+        if isinstance(response.srvresponse, dict):
+            # download_url_using_session does not raise on a 304
+            return response.srvresponse.get('status') == 304
+        return isinstance(response.error, urllib.error.HTTPError) and \
+                   response.error.code == 304
+
+    def log_fetch_error(self, url, response):
+        # urllib raises on the 304 of a conditional GET, a listing cache hit
+        if self.is_not_modified(response):
+            self.logger.debug('Not modified: %s', url)
+        else:
+            self.logger.warning('Could not fetch: %s error: %s', url, response.error)
+
     def sync(self, fromdate, todate, event):
         newdownloads = []
-        while fromdate <= todate:
+        for dateobj in self.get_sync_dates(fromdate, todate):
             if event.is_set():
                 self.logger.warning('Exiting prematurely as timer event is set')
                 break
 
-            dateobj   = fromdate.date()
-            self.logger.info('Date %s' % dateobj)
-
-            tmprel    = os.path.join (self.name, dateobj.__str__())
-            dls = self.download_oneday(tmprel, dateobj)
-            self.logger.info('Got %d gazettes for day %s' % (len(dls), dateobj))
+            dls = self.sync_oneday(dateobj)
             newdownloads.extend(dls)
-            fromdate += datetime.timedelta(days=1)
         return newdownloads
 
     def get_session_retry(self):
@@ -110,12 +418,29 @@ class Downloader:
 
         webresponse = WebResponse()
 
+        # copy, so that concurrent requests do not share the default dict
+        headers = dict(headers)
         headers['User-agent'] = self.useragent
 
         if referer:
             headers['Referer'] = referer
 
         fixed_url = self.url_fix(url)        
+        self.wait_for_slot(url)
+        start_ts = time.time()
+        if self.async_http:
+            if type(postdata) == list:
+                postdata = dict(postdata)
+            webresponse = self.download_url_async(url, fixed_url, postdata, headers, \
+                                           session.cookies, session.cookies, \
+                                           self.get_session_verify(session, fixed_url), \
+                                           allow_redirects = allow_redirects, \
+                                           session_response = True)
+            self.record_response(url, webresponse, time.time() - start_ts)
+            if webresponse.error != None:
+                self.count_failed_request()
+            return webresponse
+
         req_kwargs = {}
         req_kwargs['timeout'] = self.request_timeout_secs
         req_kwargs['allow_redirects'] = allow_redirects
@@ -135,22 +460,31 @@ class Downloader:
             webresponse.set_response_url(response.url)
         except Exception as e:
             webresponse.set_error(e)
+            self.record_response(url, webresponse, time.time() - start_ts)
+            self.count_failed_request()
             self.logger.warning('Could not fetch: %s error: %s' % (url, e))
             return webresponse
 
+        self.record_response(url, webresponse, time.time() - start_ts)
         self.logger.info('Url: %s response_url: %s Status: %s' % (fixed_url, response.url, status_code))
         return webresponse
 
     def download_url(self, url, loadcookies = None, savecookies = None, \
                      postdata = None, referer = None, \
-                     encodepost= True, headers = {}, fixurl = True, method = None, legacy_ssl_context = False):
+                     encodepost= True, headers = {}, fixurl = True, method = None, \
+                     legacy_ssl_context = False, tofile = None):
         for i in range(0, self.num_http_retries):
             if i > 0:
-                time.sleep(i * self.retry_delay_base_secs)
+                self.wait_for_retry(url, i, response)
+
+            self.wait_for_slot(url)
+            start_ts = time.time()
             response = self.download_url_onetime(url, loadcookies, savecookies,\
                                                  postdata, referer, \
-                                                 encodepost, headers, fixurl, method, legacy_ssl_context)
-            if response.error == None:
+                                                 encodepost, headers, fixurl, method, \
+                                                 legacy_ssl_context, tofile)
+            self.record_response(url, response, time.time() - start_ts)
+            if response.error == None or self.is_not_modified(response):
                 return response
             elif isinstance(response.error, urllib.error.HTTPError) and \
                     response.error.code not in [503, 504, 403]:
@@ -158,16 +492,16 @@ class Downloader:
 
             i += 1
 
+        self.count_failed_request()
         return None
 
     def download_url_onetime(self, url, loadcookies, savecookies, \
-                             postdata, referer, encodepost, headers , fixurl, method, legacy_ssl_context):
+                             postdata, referer, encodepost, headers , fixurl, method, \
+                             legacy_ssl_context, tofile = None):
 
         webresponse = WebResponse()
 
-        if self.backoff > 0:
-            time.sleep(self.backoff)
-
+        headers = dict(headers)
         headers['User-agent'] = self.useragent
 
         if referer:
@@ -185,6 +519,19 @@ class Downloader:
         else:
             fixed_url = url      
         
+        if self.async_http:
+            if method is None:
+                method = 'POST' if encodedData != None else 'GET'
+            if encodedData != None and encodepost:
+                headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            if legacy_ssl_context:
+                verify = self._ssl_ctx
+            else:
+                verify = True
+            return self.download_url_async(url, fixed_url, encodedData, headers, \
+                                           loadcookies, savecookies, verify, \
+                                           method = method, tofile = tofile)
+
         if method is None:
             request = urllib.request.Request(fixed_url, encodedData, headers)
         else:
@@ -204,9 +551,7 @@ class Downloader:
                 opener        = urllib.request.build_opener(https_handler)
                 response_obj  = opener.open(request, timeout=self.request_timeout_secs)
                 response      = response_obj.info()
-                webpage       = response_obj.read()
-
-                webresponse.set_webpage(webpage)
+                self.read_body(response_obj, webresponse, tofile)
                 webresponse.set_srvresponse(response)
                 webresponse.set_response_url(response_obj.geturl())
 
@@ -214,7 +559,7 @@ class Downloader:
                                 fixed_url, response_obj.geturl(), response_obj.getcode())
             except Exception as e:
                 webresponse.set_error(e)
-                self.logger.warning('Could not fetch: %s error: %s', url, e)
+                self.log_fetch_error(url, webresponse)
                 return webresponse
 
             self.logger.debug('Server response: %s', response)
@@ -223,17 +568,15 @@ class Downloader:
             try:
                 opener  = urllib.request.urlopen(request, timeout = self.request_timeout_secs)
                 response = opener.info()
-                webpage  = opener.read()
-                
-                webresponse.set_webpage(webpage)
+                self.read_body(opener, webresponse, tofile)
                 webresponse.set_srvresponse(response)
                 webresponse.set_response_url(opener.geturl())
 
                 self.logger.info('Url: %s response_url: %s Status: %s' % (fixed_url, opener.geturl(), opener.getcode()))
             except Exception as e:
                 webresponse.set_error(e)
-                self.logger.warning('Could not fetch: %s error: %s' % (url, e))
-                return webresponse 
+                self.log_fetch_error(url, webresponse)
+                return webresponse
 
             self.logger.debug('Server response: %s', response)
 
@@ -247,6 +590,78 @@ class Downloader:
 
         return webresponse
 
+    def read_body(self, response_obj, webresponse, tofile):
+        if tofile == None:
+            webresponse.set_webpage(response_obj.read())
+            return
+
+        self.rewind_file(tofile)
+        while True:
+            chunk = response_obj.read(self.stream_chunk_size)
+            if not chunk:
+                break
+            tofile.write(chunk)
+        self.set_streamed(webresponse, tofile)
+
+    def rewind_file(self, tofile):
+        # a retry starts the file afresh
+        tofile.seek(0)
+        tofile.truncate()
+
+    def set_streamed(self, webresponse, tofile):
+        tofile.flush()
+        num_bytes = tofile.seek(0, os.SEEK_END)
+        tofile.seek(0)
+        head = tofile.read(self.stream_head_size)
+        tofile.seek(0, os.SEEK_END)
+        webresponse.set_streamed(head, num_bytes)
+
+    def get_session_verify(self, session, url):
+        adapter = session.get_adapter(url)
+        ctx = getattr(adapter, 'ssl_context', None)
+        if ctx != None:
+            return ctx
+        return session.verify
+
+    def download_url_async(self, url, fixed_url, postdata, headers, \
+                           loadcookies, savecookies, verify, method = None, \
+                           allow_redirects = True, session_response = False, \
+                           tofile = None):
+        webresponse = WebResponse()
+
+        if method == None:
+            method = 'GET' if postdata == None else 'POST'
+
+        self.logger.debug('Request url: %s headers: %s data: %s', \
+                          fixed_url, headers, postdata)
+        try:
+            if tofile != None:
+                self.rewind_file(tofile)
+            engine = asynchttp.get_engine()
+            status, response, webpage, response_url = \
+                    engine.request(fixed_url, method = method, headers = headers, \
+                                   data = postdata, loadcookies = loadcookies, \
+                                   savecookies = savecookies, verify = verify, \
+                                   timeout = self.request_timeout_secs, \
+                                   allow_redirects = allow_redirects, tofile = tofile)
+        except Exception as e:
+            webresponse.set_error(e)
+            self.logger.warning('Could not fetch: %s error: %s' % (url, e))
+            return webresponse
+
+        if session_response:
+            # same shape as the requests based download_url_using_session
+            response = {'headers': response, 'status': status}
+
+        if tofile != None:
+            self.set_streamed(webresponse, tofile)
+        webresponse.set_webpage(webpage)
+        webresponse.set_srvresponse(response)
+        webresponse.set_response_url(response_url)
+
+        self.logger.info('Url: %s response_url: %s Status: %s' % (fixed_url, response_url, status))
+        return webresponse
+
     def url_fix(self, s, charset='utf-8'):
         """Sometimes you get a URL by a user that just isn't a real
         URL because it contains unsafe characters like ' ' and so on. This
@@ -271,25 +686,40 @@ class BaseGazette(Downloader):
         self.hostname    = None
         self.parser      = 'lxml'
 
+        # number of gazettes of a result page that are fetched concurrently
+        self.max_parallel_gazettes = 1
+
+        # stream gazettes to a temp file in raw/ instead of holding them in
+        # memory, for sources with very large documents. pull_gazette has to
+        # pass tofile down to download_url.
+        self.stream_gazettes = False
+
     def is_valid_gazette(self, doc, min_size):
         return (min_size <= 0 or len(doc) > min_size)
 
+    def is_valid_streamed_gazette(self, head, num_bytes, min_size):
+        return (min_size <= 0 or num_bytes > min_size)
+
     def get_file_extension(self, doc):
         mtype = utils.get_buffer_type(doc)
         return utils.get_file_extension(mtype)
+
+    def gazette_batch(self):
+        return GazetteBatch(self, self.max_parallel_gazettes)
     
     def pull_gazette(self, gurl, referer = None, postdata = None,
                      cookiefile = None, headers = {}, \
-                     encodepost = True):
+                     encodepost = True, tofile = None):
         if cookiefile:
             response = self.download_url(gurl, referer = referer, \
                                          postdata = postdata, loadcookies = cookiefile,\
-                                         headers = headers, encodepost = encodepost)
+                                         headers = headers, encodepost = encodepost, \
+                                         tofile = tofile)
         else:
             response = self.download_url(gurl, postdata = postdata, \
                                          encodepost = encodepost, \
                                          headers = headers, \
-                                         referer = referer)
+                                         referer = referer, tofile = tofile)
 
         return response
 
@@ -301,22 +731,29 @@ class BaseGazette(Downloader):
         updated = False
         if self.storage_manager.should_download_raw(relurl, gurl, \
                                                     validurl = validurl):
-            response = self.pull_gazette(gurl, referer = referer, \
-                                         postdata = postdata, cookiefile = cookiefile, \
-                                         headers = hdrs, encodepost = encodepost)
+            if self.stream_gazettes:
+                saved = self.stream_gazette(relurl, gurl, referer, postdata, \
+                                            cookiefile, min_size, hdrs, encodepost)
+                if saved == None:
+                    return updated
+                updated = saved
+            else:
+                response = self.pull_gazette(gurl, referer = referer, \
+                                             postdata = postdata, cookiefile = cookiefile, \
+                                             headers = hdrs, encodepost = encodepost)
 
-            if response == None:
-                return updated
+                if response == None:
+                    return updated
                  
-            doc = response.webpage 
-            if doc and self.is_valid_gazette(doc, min_size):  
-                if self.storage_manager.save_rawdoc(self.name, relurl, response.srvresponse, doc):
-                    updated = True
-                    self.logger.info('Saved rawfile %s' % relurl)
-                else:
-                    self.logger.info('not able to save the doc %s' % relurl)
-            else:                    
-                self.logger.info('doc not downloaded %s' % relurl)
+                doc = response.webpage 
+                if doc and self.is_valid_gazette(doc, min_size):  
+                    if self.storage_manager.save_rawdoc(self.name, relurl, response.srvresponse, doc):
+                        updated = True
+                        self.logger.info('Saved rawfile %s' % relurl)
+                    else:
+                        self.logger.info('not able to save the doc %s' % relurl)
+                else:                    
+                    self.logger.info('doc not downloaded %s' % relurl)
         else:
             self.logger.info('rawdoc already exists %s' % relurl)
         if validurl:
@@ -327,3 +764,31 @@ class BaseGazette(Downloader):
                 self.logger.info('Saved metainfo %s' % relurl)
         return updated
 
+    def stream_gazette(self, relurl, gurl, referer, postdata, cookiefile, \
+                       min_size, hdrs, encodepost):
+        # returns None if the download failed, else whether the doc was saved
+        tmpfile = self.storage_manager.new_raw_tmpfile(relurl)
+        try:
+            response = self.pull_gazette(gurl, referer = referer, \
+                                         postdata = postdata, cookiefile = cookiefile, \
+                                         headers = hdrs, encodepost = encodepost, \
+                                         tofile = tmpfile)
+            tmpfile.close()
+            if response == None:
+                return None
+
+            if not response.num_bytes or \
+                    not self.is_valid_streamed_gazette(response.head, response.num_bytes, min_size):
+                self.logger.info('doc not downloaded %s' % relurl)
+                return False
+
+            if self.storage_manager.save_rawfile(self.name, relurl, tmpfile.name, response.head):
+                self.logger.info('Saved rawfile %s (%d bytes)', relurl, response.num_bytes)
+                return True
+
+            self.logger.info('not able to save the doc %s' % relurl)
+            return False
+        finally:
+            tmpfile.close()
+            if os.path.exists(tmpfile.name):
+                os.remove(tmpfile.name)
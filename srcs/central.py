@@ -16,6 +16,8 @@ class CentralBase(BaseGazette):
         self.search_endp = 'SearchCategory.aspx'
         self.result_table= 'tbl_Gazette'
         self.gazette_js  = 'window.open\(\'(?P<href>[^\']+)'
+        # busy extraordinary days have 100+ notifications per day
+        self.max_parallel_gazettes = 4
 
     def find_search_form(self, d, form_href):
         search_form = None
@@ -190,7 +192,7 @@ class CentralBase(BaseGazette):
 
         return None               
 
-    def download_nextpage(self, nextpage, search_url, postdata, cookiejar):
+    def download_nextpage(self, nextpage, search_url, postdata, cookiejar, scope = None):
         newdata = []
         href = nextpage.get('href') 
         if not href:
@@ -215,6 +217,13 @@ class CentralBase(BaseGazette):
                 continue
             else:
                 newdata.append((k, v))
+
+        if scope != None:
+            return self.download_listing(search_url, scope, savecookies = cookiejar, \
+                                         referer = search_url, \
+                                         loadcookies = cookiejar, \
+                                         postdata = newdata)
+
         response = self.download_url(search_url, savecookies = cookiejar, \
                                      referer = search_url, \
                                      loadcookies = cookiejar, \
@@ -258,7 +267,7 @@ class CentralBase(BaseGazette):
 
 
     def download_gazette(self, relpath, search_url, postdata, \
-                         metainfo, cookiejar):
+                         metainfo, cookiejar, batch = None):
 
         if 'gazetteid' not in metainfo:
             return None
@@ -306,6 +315,12 @@ class CentralBase(BaseGazette):
         filename = reobj.groupdict()['num']
         relurl   = os.path.join(relpath, filename)
 
+        # the postbacks above are bound to the session cookies, the pdf
+        # itself is a plain GET and can be fetched in the background
+        if batch != None:
+            batch.save_gazette(relurl, gzurl, metainfo)
+            return None
+
         if self.save_gazette(relurl, gzurl, metainfo): 
             return relurl
 
@@ -346,6 +361,7 @@ class CentralBase(BaseGazette):
         while response != None and response.webpage != None:
             metainfos, nextpage = self.parse_search_results(response.webpage, \
                                                             dateobj, pagenum)
+            self.record_listing(dateobj, pagenum, metainfos)
 
             postdata = self.get_form_data(response.webpage, dateobj, self.search_endp)
 
@@ -363,17 +379,16 @@ class CentralBase(BaseGazette):
 
     def download_metainfos(self, relpath, metainfos, search_url, \
                            postdata, cookiejar):
-        dls = []
-        for metainfo in metainfos:
-            if 'download' in metainfo:
-                newpost = postdata[:]
-                name = metainfo.pop('download')
-                newpost.append(('%s.x' % name, '10'))
-                newpost.append(('%s.y' % name, '10'))
-                relurl = self.download_gazette(relpath, search_url, newpost, metainfo, cookiejar)
-                if relurl:
-                    dls.append(relurl)
-        return dls
+        with self.gazette_batch() as batch:
+            for metainfo in metainfos:
+                if 'download' in metainfo:
+                    newpost = postdata[:]
+                    name = metainfo.pop('download')
+                    newpost.append(('%s.x' % name, '10'))
+                    newpost.append(('%s.y' % name, '10'))
+                    self.download_gazette(relpath, search_url, newpost, \
+                                          metainfo, cookiejar, batch)
+        return batch.relurls
 
 class CentralWeekly(CentralBase):
     def __init__(self, name, storage):
@@ -439,6 +454,7 @@ class CentralWeekly(CentralBase):
 
             metainfos, nextpage = self.parse_search_results(response.webpage, \
                                                             dateobj, pagenum)
+            self.record_listing(dateobj, pagenum, metainfos)
 
             postdata = self.get_form_data(response.webpage, dateobj, form_href)
 
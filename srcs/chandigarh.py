@@ -14,17 +14,7 @@ class Chandigarh(BaseGazette):
         self.baseurl  = 'https://egazette.chd.gov.in/'
         self.hostname = 'egazette.chd.gov.in'
         self.gazette_select_name = 'ctl00$ContentPlaceHolder1$DDlistGazette'
-        self.page_cache = {}
 
-    def download_url_cached(self, url):
-
-        if url not in self.page_cache:
-            response = self.download_url(url)
-
-            self.page_cache[url] = response
-
-        return self.page_cache[url]
- 
     def get_post_data(self, tags):
         postdata = []
 
@@ -358,11 +348,15 @@ class Chandigarh(BaseGazette):
     def download_oneday(self, relpath, dateobj):
         dls = []
 
-        response = self.download_url_cached(self.baseurl)
+        response = self.download_listing(self.baseurl, dateobj, cached = True)
         if response is None or response.webpage is None:
             self.logger.warning('Unable to get main page for date: %s', dateobj)
             return dls
 
+        if response.unchanged:
+            self.logger.info('Main page unchanged since %s was last done', dateobj)
+            return dls
+
         gazetteid = self.find_gazette_id(response.webpage, dateobj)
         if gazetteid is None:
             return dls
@@ -51,9 +51,9 @@ class DelhiWeekly(CentralBase):
                                      'SearchCategory.aspx')
         postdata.append(('ImgSubmitDetails_Delhi.x', '76'))
         postdata.append(('ImgSubmitDetails_Delhi.y', '20'))
-        response = self.download_url(curr_url, savecookies = cookiejar, \
-                                     loadcookies = cookiejar, referer = curr_url, \
-                                     postdata = postdata)
+        response = self.download_listing(curr_url, dateobj, savecookies = cookiejar, \
+                                         loadcookies = cookiejar, referer = curr_url, \
+                                         postdata = postdata)
 
 
         pagenum = 1
@@ -66,13 +66,16 @@ class DelhiWeekly(CentralBase):
 
             postdata = self.get_form_data(response.webpage, dateobj, form_href)
 
-            relurls = self.download_metainfos(relpath, metainfos, curr_url, \
-                                              postdata, cookiejar)
-            dls.extend(relurls)
+            # an unchanged page is still parsed for the link to the next one
+            if not response.unchanged:
+                relurls = self.download_metainfos(relpath, metainfos, curr_url, \
+                                                  postdata, cookiejar)
+                dls.extend(relurls)
             if nextpage:
                 pagenum += 1
                 self.logger.info('Going to page %d for date %s', pagenum, dateobj)
-                response = self.download_nextpage(nextpage, curr_url, postdata, cookiejar)
+                response = self.download_nextpage(nextpage, curr_url, postdata, \
+                                                  cookiejar, scope = dateobj)
             else:
                 break
 
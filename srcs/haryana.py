@@ -229,6 +229,8 @@ class HaryanaArchive(Haryana):
         self.hostname     = 'www.egazetteharyana.gov.in'
         self.search_endp  = 'ArchiveNotifications.aspx'
         self.gazette_js   = 'window.open\(\'(?P<href>ArchiveNotifications[^\']+)'
+        # archive documents can be hundreds of MB
+        self.stream_gazettes = True
 
     def get_post_data(self, tags, dateobj, category):
         datestr  = utils.dateobj_to_str(dateobj, '-', reverse = True)
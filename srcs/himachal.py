@@ -1,7 +1,6 @@
 import urllib.request, urllib.parse, urllib.error
 import re
 import datetime
-import time
 import os 
 import io
 from PIL import Image
@@ -223,8 +222,9 @@ class Himachal(BaseGazette):
 
     def solve_captcha(self, img):
         captcha_val = decode_captcha.himachal(img).strip()
-        # there is either a delay check on the server or a race condition.. so the sleep is needed
-        time.sleep(5)
+        # there is either a delay check on the server or a race condition.. so
+        # the captcha is submitted only 5 secs after it was fetched
+        self.wait_since_last_request(5)
         return captcha_val
 
     def submit_captcha_form(self, search_url, webpage, cookiejar, dateobj):
@@ -14,7 +14,6 @@ class JammuAndKashmir(BaseGazette):
         BaseGazette.__init__(self, name, storage)
         self.baseurl  = 'https://rgp.jk.gov.in/gazette.html'
         self.hostname = 'rgp.jk.gov.in'
-        self.page_cache = {}
         self.session = None
 
     def get_session(self):
@@ -33,16 +32,6 @@ class JammuAndKashmir(BaseGazette):
         return self.download_url_using_session(url, session = self.session, postdata = postdata, \
                                    referer = referer, headers = headers) 
 
-
-    def download_url_cached(self, url):
-
-        if url not in self.page_cache:
-            response = self.download_url(url)
-
-            self.page_cache[url] = response
-
-        return self.page_cache[url]
- 
     def clean_string(self, txt):
         txt = ' '.join(txt.splitlines())
         txt = ' '.join(txt.split())
@@ -129,11 +118,14 @@ class JammuAndKashmir(BaseGazette):
 
 
     def download_section(self, dls, relpath, url, dateobj):
-        response = self.download_url_cached(url)
+        response = self.download_listing(url, dateobj, cached = True)
         if response is None or response.webpage is None:
             self.logger.warning('Unable to get %s for %s', url, dateobj)
             return
 
+        if response.unchanged:
+            return
+
         metainfos = self.get_metainfos(response.webpage, url)
 
         for metainfo in metainfos:
@@ -226,12 +226,17 @@ class KarnatakaBase(BaseGazette):
         postdata[self.category_field] = self.gztype
         payload = self.build_search_payload(dateobj, postdata)
         payload[self.category_field] = self.gztype
-        response = self.download_url(self.search_url, postdata=payload, savecookies= self.cookiejar, \
-                                        loadcookies= self.cookiejar, referer=self.search_url, \
-                                    encodepost= True)
+        response = self.download_listing(self.search_url, dateobj, postdata=payload, \
+                                         savecookies= self.cookiejar, \
+                                         loadcookies= self.cookiejar, referer=self.search_url, \
+                                         encodepost= True)
         if not response or not response.webpage or response.error:
             return dls
 
+        if response.unchanged:
+            self.logger.info('Search results unchanged since %s was last done', dateobj)
+            return dls
+
         self.curr_url = response.response_url
         self.search_url = urllib.parse.urljoin(self.curr_url, self.search_endp)
         payload_for_pdf = self.get_pdf_payload(response.webpage, dateobj)
@@ -120,16 +120,6 @@ class OdishaGovPress(BaseGazette):
         self.ordinary_url = 'https://govtpress.odisha.gov.in/en/light/odisha-gazettes'
         self.extraordinary_url = 'https://govtpress.odisha.gov.in/en/light/ex-ordinary-gazettes'
         self.hostname = 'govtpress.odisha.gov.in'
-        self.page_cache = {}
-
-    def download_url_cached(self, url):
-
-        if url not in self.page_cache:
-            response = self.download_url(url)
-
-            self.page_cache[url] = response
-
-        return self.page_cache[url]
 
     def find_field_order(self, tr):
         order  = []
@@ -217,11 +207,15 @@ class OdishaGovPress(BaseGazette):
         
         for url, gztype in [(self.extraordinary_url, 'Extraordinary'), \
                             (self.ordinary_url, 'Ordinary')]:
-            response = self.download_url_cached(url)
+            response = self.download_listing(url, dateobj, cached = True)
             if response is None or response.webpage is None:
                 self.logger('Unable to get the base page for ate %s', dateobj)
                 return dls
 
+            if response.unchanged:
+                self.logger.info('%s page unchanged since %s was last done', gztype, dateobj)
+                continue
+
             metainfos = self.parse_results(response.webpage, dateobj)
         
             for metainfo in metainfos:
@@ -250,22 +244,12 @@ class OdishaEGazette(BaseGazette):
                             'https://egazette.odisha.gov.in/change_name_surname', \
                             'https://egazette.odisha.gov.in/change_gender', \
                             'https://egazette.odisha.gov.in/other_gazette' ]
-        self.page_cache = {}
-
-    def download_url_cached(self, url):
-
-        if url not in self.page_cache:
-            response = self.download_url(url)
-
-            self.page_cache[url] = response
-
-        return self.page_cache[url]
 
  
     def get_departments(self):
         depts = []
 
-        response = self.download_url_cached(self.extraordinary_url)
+        response = self.download_listing(self.extraordinary_url, None, cached = True)
         if not response or not response.webpage:
             self.logger.warning('Unable to get main page')
             return depts
@@ -15,7 +15,6 @@ class Puducherry(BaseGazette):
         BaseGazette.__init__(self, name, storage)
         self.baseurl  = 'https://styandptg.py.gov.in/{}/{}{}{:02}.{}'
         self.hostname = 'styandptg.py.gov.in'
-        self.page_cache = {}
         self.year = None
         self.wayback_client = None
 
@@ -57,14 +56,6 @@ class Puducherry(BaseGazette):
 
         return response
 
-    def download_url_cached(self, url):
-
-        if url not in self.page_cache:
-            response = self.download_url(url)
-
-            self.page_cache[url] = response
-
-        return self.page_cache[url]
  
     def get_field_order(self, tr):
         order  = []
@@ -208,11 +199,15 @@ class Puducherry(BaseGazette):
             ext = 'html' if year >= 2018 else 'htm'
             url = self.baseurl.format(year, prefix, month, year % 100, ext)
 
-            response = self.download_url_cached(url)
+            response = self.download_listing(url, dateobj, cached = True)
             if not response or not response.webpage:
                 self.logger.warning('Unable to get year page %s for date %s', url, dateobj)
                 continue
 
+            if response.unchanged:
+                self.logger.info('%s page unchanged since %s was last done', section, dateobj)
+                continue
+
             self.process_results(metainfos, response.webpage, dateobj)
 
             for metainfo in metainfos:
@@ -43,6 +43,8 @@ class RajasthanStateArchive(BaseGazette):
         BaseGazette.__init__(self, name, storage)
         self.baseurl = 'https://reams.rajasthan.gov.in/RSAD/RSADGuestSearch'
         self.hostname = 'reams.rajasthan.gov.in'
+        # archive documents can be hundreds of MB
+        self.stream_gazettes = True
     
     def get_session(self):
         ctx = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
@@ -514,7 +516,7 @@ class RajasthanStateArchive(BaseGazette):
 
     def pull_gazette(self, gurl, referer = None, postdata = None,
                      cookiefile = None, headers = {}, \
-                     encodepost = True):
+                     encodepost = True, tofile = None):
 
         postdata_dict = dict(postdata)
         docview_url   = gurl
@@ -601,7 +603,8 @@ class RajasthanStateArchive(BaseGazette):
 
         return BaseGazette.pull_gazette(self, download_url, postdata = download_postdata, \
                                         cookiefile = cookiejar, referer = redirect_url_base, \
-                                        encodepost = encodepost, headers = headers)
+                                        encodepost = encodepost, headers = headers, \
+                                        tofile = tofile)
 
 
     def download_metainfo(self, relpath, metainfo): 
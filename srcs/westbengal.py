@@ -24,6 +24,8 @@ class KolkataWBSL(BaseGazette):
         self.ajax_url = 'https://wbsl.gov.in/ajaxSearch_calcuttaGazette.action'
         self.bookreader_url = 'https://wbsl.gov.in/bookReader.action'
         self.hostname = 'wbsl.gov.in'
+        # books are assembled into PDFs of hundreds of MB
+        self.stream_gazettes = True
 
     def get_session(self):
         # Override to disable SSL verification (weak DH key on wbsl.gov.in)
@@ -322,8 +324,8 @@ class KolkataWBSL(BaseGazette):
         
         return book_info
 
-    def create_pdf_from_images(self, image_dir):
-        """Create a PDF from images in a directory"""
+    def create_pdf_from_images(self, image_dir, filepath=None):
+        """Create a PDF from images in a directory, written to filepath if given"""
         # Get list of image files sorted by name
         image_files = sorted([f for f in os.listdir(image_dir) if f.endswith('.jpg')])
         
@@ -353,6 +355,12 @@ class KolkataWBSL(BaseGazette):
                 self.logger.warning('Could not add image %s to PDF: %s', img_file, e)
                 continue
         
+        if filepath:
+            # Save straight to disk, the PDF of a large book runs into hundreds of MB
+            pdf_doc.save(filepath)
+            pdf_doc.close()
+            return filepath
+
         # Save to bytes
         pdf_bytes = pdf_doc.tobytes()
         pdf_doc.close()
@@ -360,7 +368,7 @@ class KolkataWBSL(BaseGazette):
         return pdf_bytes
 
     def pull_gazette(self, gurl, referer=None, postdata=None, cookiefile=None, 
-                     headers={}, encodepost=True):
+                     headers={}, encodepost=True, tofile=None):
         """
         Override pull_gazette to handle WBSL book reader downloads.
         gurl is expected to be the book reader URL: bookReader.action?bookId={bookid}
@@ -427,7 +435,7 @@ class KolkataWBSL(BaseGazette):
         
         # Create PDF from all images
         self.logger.info('Creating PDF from downloaded images...')
-        pdf_bytes = self.create_pdf_from_images(image_dir)
+        pdf_bytes = self.create_pdf_from_images(image_dir, tofile.name if tofile else None)
         
         if not pdf_bytes:
             return None
@@ -435,11 +443,15 @@ class KolkataWBSL(BaseGazette):
         # Create a WebResponse object to return
         from .basegazette import WebResponse
         web_response = WebResponse()
-        web_response.set_webpage(pdf_bytes)
+        if tofile:
+            self.set_streamed(web_response, tofile)
+        else:
+            web_response.set_webpage(pdf_bytes)
         web_response.set_srvresponse({'headers': {'content-type': 'application/pdf'}, 'status': 200})
         web_response.set_response_url(gurl)
         
-        self.logger.info('Successfully created PDF (%d bytes) from %d pages', len(pdf_bytes), total_pages)
+        num_bytes = web_response.num_bytes if tofile else len(pdf_bytes)
+        self.logger.info('Successfully created PDF (%d bytes) from %d pages', num_bytes, total_pages)
         
         # Clean up image cache after successful PDF creation
         try:
@@ -8,7 +8,12 @@ import re
 
 from egazette.utils import utils
 from egazette.utils import download
+from egazette.utils import telemetry
+from egazette.utils import jobqueue
 from egazette.utils.file_storage import FileManager
+from egazette.utils.crawlstate import CrawlState
+from egazette.utils.listingcache import ListingCache
+from egazette.utils.ratecontrol import RateController
 from egazette.srcs import datasrcs
 
 def print_usage(progname):
@@ -17,10 +22,19 @@ def print_usage(progname):
                        [-m (updateMeta)]
                        [-n (no aggregation of srcs by hostname)]
                        [-r (updateRaw)]
+                       [-F (walk every date, ignoring the crawl journal)]
+                       [-B (share identical raw docs through the blob store)]
+                       [-S s3://bucket/prefix (store docs in S3, datadir keeps a cache)]
                        [-f logfile]
                        [-t fromdate (DD-MM-YYYY)] [-T todate (DD-MM-YYYY)]
                        [-d last_n_days]
                        [-D datadir]
+                       [-W max_wait (seconds)]
+                       [-w num_workers (work-stealing scheduler)]
+                       [-H max_parallel_requests_per_host (with -w, default 1)]
+                       [-Q job_queue (sqlite file or redis:// url, only enqueue jobs)]
+                       [-J days_per_job (with -Q, default 30)]
+                       [--worker (with -Q, claim and run jobs, -w processes)]
                        [-s central_weekly -s central_extraordinary -s central
                         -s states 
                         -s andhra_extraordinary -s andhra_weekly
@@ -66,15 +80,74 @@ def to_datetime(datestr):
             datelist.append(int(num))
         return datetime.datetime(datelist[2], datelist[1], datelist[0])
 
-def execute(storage, srclist, agghosts, fromdate, todate, max_wait, all_dls):
+def setup_srcobj(obj, crawl_state, listing_cache, rate_control):
+    obj.crawl_state   = crawl_state
+    obj.listing_cache = listing_cache
+    obj.rate_control  = rate_control
+
+def write_run_stats(rate_control, statsdir):
+    rate_control.write_stats(os.path.join(statsdir, 'hoststats.json'))
+
+    sources = telemetry.write_prometheus()
+    logger  = logging.getLogger('crawler.controller')
+    for src, stats in sorted(sources.items(), key = lambda x: -x[1]['secs']):
+        logger.info('%s: %d days in %.0f secs, %d requests, %d gazettes', \
+                    src, stats['days'], stats['secs'], stats['requests'], \
+                    stats['gazettes'])
+
+def enqueue(storage, srclist, fromdate, todate, all_dls, jobq, days_per_job):
     if fromdate == None and todate != None:
         fromdate = todate
     elif fromdate != None and todate == None:
         todate = datetime.datetime.today()
 
     srcobjs = datasrcs.get_srcobjs(srclist,  storage)
+    jobs = download.enqueue_jobs(jobq, srcobjs, fromdate, todate, all_dls, days_per_job)
+
+    logger = logging.getLogger('crawler.controller')
+    logger.info('Enqueued %d jobs for %d sources, queue: %s', \
+                len(jobs), len(srcobjs), jobq.counts())
+
+def work(storage, jobq, max_wait, num_workers, crawl_state, listing_cache, statsdir):
+    # hosts are only known once jobs are claimed, so the rate controllers
+    # are local to each worker process
+    rate_control = RateController()
+
+    def get_srcobj(name):
+        for obj in datasrcs.get_srcobjs([name], storage):
+            if obj.name == name:
+                setup_srcobj(obj, crawl_state, listing_cache, rate_control)
+                return obj
+        return None
 
-    download.parallel_download(srcobjs, agghosts, fromdate, todate, max_wait, all_dls)
+    download.run_queue_workers(jobq, get_srcobj, num_workers or 1, max_wait)
+    write_run_stats(rate_control, statsdir)
+
+def execute(storage, srclist, agghosts, fromdate, todate, max_wait, all_dls, \
+            num_workers, host_limit, crawl_state, listing_cache, statsdir):
+    if fromdate == None and todate != None:
+        fromdate = todate
+    elif fromdate != None and todate == None:
+        todate = datetime.datetime.today()
+
+    srcobjs = datasrcs.get_srcobjs(srclist,  storage)
+
+    # created before the crawlers fork so that the sources of a host share it
+    rate_control = RateController([obj.hostname for obj in srcobjs])
+    for obj in srcobjs:
+        setup_srcobj(obj, crawl_state, listing_cache, rate_control)
+
+    if num_workers:
+        # with -W, units are ordered newest first and packed into the
+        # time budget using how long days took in earlier runs
+        durations = telemetry.get_day_durations(statsdir)
+        download.scheduled_download(srcobjs, fromdate, todate, max_wait, \
+                                    all_dls, num_workers, host_limit, durations)
+    else:
+        download.parallel_download(srcobjs, agghosts, fromdate, todate, \
+                                   max_wait, all_dls)
+
+    write_run_stats(rate_control, statsdir)
 
 
 if __name__ == '__main__':
@@ -94,8 +167,17 @@ if __name__ == '__main__':
     all_dls    = False
     max_wait   = None
     agghosts   = True
+    num_workers = None
+    host_limit  = 1
+    force_walk  = False
+    queue_spec  = None
+    days_per_job = 30
+    queue_worker = False
+    dedup_raw   = False
+    storage_url = None
 
-    optlist, remlist = getopt.getopt(sys.argv[1:], 'ad:D:l:mnf:p:t:T:hrs:W:')
+    optlist, remlist = getopt.getopt(sys.argv[1:], 'aBd:D:l:mnf:Fp:t:T:hH:J:Q:rs:S:w:W:', \
+                                     ['worker'])
     for o, v in optlist:
         if o == '-a':
             all_dls = True
@@ -109,6 +191,8 @@ if __name__ == '__main__':
             debuglevel = v
         elif o == '-f':
             filename = v
+        elif o == '-F':
+            force_walk = True
         elif o == '-m':
             updateMeta = True
         elif o == '-n':
@@ -123,6 +207,20 @@ if __name__ == '__main__':
             srclist.append(v)
         elif o == '-W':
             max_wait = int(v)
+        elif o == '-w':
+            num_workers = int(v)
+        elif o == '-H':
+            host_limit = int(v)
+        elif o == '-Q':
+            queue_spec = v
+        elif o == '-J':
+            days_per_job = int(v)
+        elif o == '--worker':
+            queue_worker = True
+        elif o == '-B':
+            dedup_raw = True
+        elif o == '-S':
+            storage_url = v
         else:
             print('Unknown option %s' % o, file=sys.stderr)
             print_usage(progname)
@@ -167,6 +265,42 @@ if __name__ == '__main__':
         # it is considered unsafe.. needs to be undone if we actually see crashes
         multiprocessing.set_start_method('fork')
 
-    storage = FileManager(datadir, updateMeta, updateRaw)
-    execute(storage, srclist, agghosts, fromdate, todate, max_wait, all_dls)
+    # with -m/-r every date has to be walked again, the journal is then
+    # only updated and not used for skipping dates
+    crawl_state = CrawlState(os.path.join(statsdir, 'crawlstate.db'), \
+                             force = force_walk or updateMeta or updateRaw)
+    listing_cache = ListingCache(os.path.join(statsdir, 'listingcache.db'), \
+                                 force = force_walk or updateMeta or updateRaw)
+
+    telemetry.configure(statsdir)
+
+    if storage_url:
+        if dedup_raw:
+            print('-B needs the docs on the local disk, it cannot be used with -S', \
+                  file=sys.stderr)
+            sys.exit(1)
+        try:
+            # boto3 is only needed for this backend
+            from egazette.utils.s3_storage import S3Backend
+            backend = S3Backend.from_url(datadir, storage_url)
+        except ImportError as e:
+            print('Cannot use %s: %s' % (storage_url, e), file=sys.stderr)
+            sys.exit(1)
+        storage = FileManager(datadir, updateMeta, updateRaw, backend = backend)
+    else:
+        storage = FileManager(datadir, updateMeta, updateRaw, dedup = dedup_raw)
+    quarantined = storage.recover()
+    if quarantined:
+        logging.getLogger('crawler').warning('Quarantined %d files left incomplete ' \
+                                             'by an earlier run', len(quarantined))
+    if queue_spec:
+        jobq = jobqueue.get_job_queue(queue_spec)
+        if queue_worker:
+            work(storage, jobq, max_wait, num_workers, crawl_state, \
+                 listing_cache, statsdir)
+        else:
+            enqueue(storage, srclist, fromdate, todate, all_dls, jobq, days_per_job)
+    else:
+        execute(storage, srclist, agghosts, fromdate, todate, max_wait, all_dls, \
+                num_workers, host_limit, crawl_state, listing_cache, statsdir)
 
@@ -0,0 +1,137 @@
+"""Benchmark Downloader's urllib path against the asyncio engine.
+
+A local HTTP/1.1 server stands in for a gazette site. It counts the
+connections it accepts and can add an artificial round-trip delay to every new
+connection (the cost of a TCP+TLS handshake to a distant host) and to every
+request. The same sequence of requests is then made through
+Downloader.download_url with ``async_http`` off and on:
+
+    python -m egazette.tools.bench_http -n 200 --rtt 40 --tls
+
+With ``--tls`` a throwaway self-signed certificate is generated with openssl
+and requests go through the legacy (unverified) SSL context.
+"""
+
+import os
+import ssl
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from egazette.srcs.basegazette import Downloader
+from egazette.utils import asynchttp
+from egazette.utils import ratecontrol
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        # one handler instance per connection
+        server = self.server
+        with server.lock:
+            server.num_connections += 1
+        time.sleep(server.rtt)
+        BaseHTTPRequestHandler.setup(self)
+
+    def do_GET(self):
+        time.sleep(self.server.rtt)
+        body = self.server.body
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/pdf')
+        self.send_header('Content-Length', '%d' % len(body))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def make_certificate(tmpdir):
+    certfile = os.path.join(tmpdir, 'cert.pem')
+    keyfile  = os.path.join(tmpdir, 'key.pem')
+    command  = ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', \
+                '-keyout', keyfile, '-out', certfile, '-days', '1', \
+                '-subj', '/CN=localhost']
+    subprocess.run(command, check = True, capture_output = True)
+    return certfile, keyfile
+
+def start_server(rtt, size, tmpdir):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    server.daemon_threads  = True
+    server.lock            = threading.Lock()
+    server.num_connections = 0
+    server.rtt             = rtt
+    server.body            = b'%PDF-1.4\n' + b'0' * size
+
+    scheme = 'http'
+    if tmpdir:
+        certfile, keyfile = make_certificate(tmpdir)
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ctx.load_cert_chain(certfile, keyfile)
+        server.socket = ctx.wrap_socket(server.socket, server_side = True)
+        scheme = 'https'
+
+    thread = threading.Thread(target = server.serve_forever, daemon = True)
+    thread.start()
+
+    return server, '%s://127.0.0.1:%d' % (scheme, server.server_address[1])
+
+def run(baseurl, server, num_requests, async_http, tls):
+    downloader = Downloader('bench', None)
+    downloader.async_http = async_http
+
+    # measure the engines, not the pacing of requests
+    rate_control = ratecontrol.RateController()
+    rate_control.initial_rate = rate_control.max_rate = 1e6
+    downloader.rate_control = rate_control
+
+    server.num_connections = 0
+    latencies = []
+    start_ts  = time.time()
+    for i in range(num_requests):
+        ts = time.time()
+        response = downloader.download_url('%s/gazette/%d.pdf' % (baseurl, i), \
+                                           legacy_ssl_context = tls)
+        assert response != None and response.webpage, 'request %d failed' % i
+        latencies.append(time.time() - ts)
+    elapsed = time.time() - start_ts
+
+    latencies.sort()
+    return {'engine': 'asyncio' if async_http else 'urllib', \
+            'elapsed': elapsed, 'connections': server.num_connections, \
+            'mean': sum(latencies) / len(latencies), \
+            'p95': latencies[int(len(latencies) * 0.95) - 1]}
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser(description = 'Benchmark Downloader HTTP engines')
+    parser.add_argument('-n', dest = 'num_requests', type = int, default = 100)
+    parser.add_argument('--rtt', type = float, default = 20, \
+                        help = 'simulated round trip in milliseconds')
+    parser.add_argument('--size', type = int, default = 64 * 1024, \
+                        help = 'response body size in bytes')
+    parser.add_argument('--tls', action = 'store_true', help = 'serve over https')
+    return parser
+
+def main():
+    args   = get_arg_parser().parse_args()
+    tmpdir = tempfile.mkdtemp() if args.tls else None
+    try:
+        server, baseurl = start_server(args.rtt / 1000.0, args.size, tmpdir)
+
+        print('engine\trequests\tconnections\telapsed(s)\tmean(ms)\tp95(ms)')
+        for async_http in (False, True):
+            r = run(baseurl, server, args.num_requests, async_http, args.tls)
+            print('%s\t%d\t%d\t%.2f\t%.1f\t%.1f' % (r['engine'], args.num_requests, \
+                  r['connections'], r['elapsed'], r['mean'] * 1000, r['p95'] * 1000))
+
+        asynchttp.get_engine().close()
+        server.shutdown()
+    finally:
+        if tmpdir:
+            shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    main()
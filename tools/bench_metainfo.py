@@ -0,0 +1,84 @@
+"""Benchmark building a large listing of MetaInfo objects.
+
+Archive sources (westbengal, wbsl, rsa) build a MetaInfo for every entry of
+a listing before saving any of them. This builds -n entries the way such a
+listing does, with the previous MetaInfo (a dict with a __dict__ that cleaned
+every string value on set_field) and with the current one, and reports the
+construction time and the memory held by the listing:
+
+    python -m egazette.tools.bench_metainfo -n 100000
+
+The cost of writing the metatags of the entries that are saved is reported
+separately, since that is where values are cleaned now.
+"""
+
+import sys
+import time
+import datetime
+import argparse
+import tracemalloc
+
+from egazette.utils import utils
+from egazette.utils import xml_ops
+
+class OldMetaInfo(dict):
+    def __init__(self):
+        dict.__init__(self)
+
+    def set_field(self, field, value):
+        if type(value) in (str,):
+            value = utils.replace_xml_illegal_chars(value)
+        self.__setitem__(field, value)
+
+def build_listing(cls, num_entries):
+    listing = []
+    dateobj = datetime.date(1950, 1, 1)
+    for i in range(num_entries):
+        metainfo = cls()
+        metainfo.set_field(utils.DATE, dateobj + datetime.timedelta(days = i % 20000))
+        metainfo.set_field(utils.TITLE, 'The Calcutta Gazette, Extraordinary, No. %d' % i)
+        metainfo.set_field(utils.GZTYPE, 'Extraordinary')
+        metainfo.set_field(utils.GZNUM, '%d' % i)
+        metainfo.set_field(utils.DEPARTMENT, 'Home (Political) Department')
+        metainfo.set_field(utils.URL, 'https://wbsl.gov.in/gazette/%d.pdf' % i)
+        metainfo.set_field(utils.NOTIFICATION_NUM, 'No. %d-Home/%d' % (i, 1950 + i % 70))
+        listing.append(metainfo)
+    return listing
+
+def measure(cls, num_entries):
+    tracemalloc.start()
+    start_ts = time.perf_counter()
+    listing  = build_listing(cls, num_entries)
+    elapsed  = time.perf_counter() - start_ts
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return listing, elapsed, current
+
+def measure_write(listing, num_saved):
+    start_ts = time.perf_counter()
+    for metainfo in listing[:num_saved]:
+        xml_ops.obj_to_xml('document', metainfo)
+    return time.perf_counter() - start_ts
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser(description = 'Benchmark MetaInfo listings')
+    parser.add_argument('-n', dest = 'num_entries', type = int, default = 100000)
+    parser.add_argument('-s', dest = 'num_saved', type = int, default = 1000, \
+                        help = 'entries whose metatags are serialised')
+    return parser
+
+def main():
+    args = get_arg_parser().parse_args()
+    # imports and caches of the xml path are not part of the measurement
+    measure_write(build_listing(OldMetaInfo, 100), 100)
+
+    print('metainfo\tentries\tbuild(s)\tmemory(MB)\tbytes/entry\twrite %d(s)' % args.num_saved)
+    for label, cls in (('old', OldMetaInfo), ('current', utils.MetaInfo)):
+        listing, elapsed, memory = measure(cls, args.num_entries)
+        write_secs = measure_write(listing, args.num_saved)
+        print('%s\t%d\t%.3f\t%.1f\t%.0f\t%.3f' % (label, args.num_entries, elapsed, \
+              memory / 1e6, memory / float(args.num_entries), write_secs))
+        del listing
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Benchmark the signature based type detection against libmagic.
+
+Each sample is typed the way it was before (libmagic on the whole buffer and
+a chain of re.match for the extension) and through utils.get_buffer_type and
+utils.get_file_extension, which only look at the first SNIFF_BYTES bytes and
+leave the rest to libmagic:
+
+    python -m egazette.tools.bench_mime -n 200 --size 2000000
+    python -m egazette.tools.bench_mime -d datadir/raw/central_weekly
+
+Without -d synthetic pdf, html, png, postscript, rtf and text docs are used.
+Samples on which the two paths disagree are listed.
+"""
+
+import os
+import re
+import time
+import zlib
+import struct
+import argparse
+
+import magic
+
+from egazette.utils import utils
+
+def old_file_extension(mtype):
+    if re.match('text/html', mtype):
+        return 'html'
+    elif re.match('application/postscript', mtype):
+        return 'ps'
+    elif re.match('application/pdf', mtype):
+        return 'pdf'
+    elif re.match('text/plain', mtype):
+        return 'txt'
+    elif re.match('image/png', mtype):
+        return 'png'
+    return 'unkwn'
+
+def old_extension(buff):
+    return old_file_extension(magic.from_buffer(buff, mime = True))
+
+def new_extension(buff):
+    return utils.get_file_extension(utils.get_buffer_type(buff))
+
+def make_png(width, height):
+    def chunk(name, data):
+        crc = zlib.crc32(name + data) & 0xffffffff
+        return struct.pack('>I', len(data)) + name + data + struct.pack('>I', crc)
+
+    rows = b''.join(b'\x00' + b'\x7f' * width for i in range(height))
+    return b'\x89PNG\r\n\x1a\n' + \
+           chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)) + \
+           chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b'')
+
+def make_samples(size):
+    filler = os.urandom(size)
+    return [
+        ('pdf',  b'%PDF-1.5\n%\xe2\xe3\xcf\xd3\n' + filler + b'\n%%EOF\n'),
+        ('html', b'\n<!DOCTYPE html>\n<html><head><title>Gazette</title></head><body>' + \
+                 b'<p>notification</p>' * (size // 20) + b'</body></html>'),
+        ('png',  make_png(256, 256)),
+        ('ps',   b'%!PS-Adobe-3.0\n' + b'0 0 moveto\n' * (size // 11)),
+        ('rtf',  b'{\\rtf1\\ansi\\deff0 ' + b'gazette text ' * (size // 13) + b'}'),
+        ('txt',  b'THE GAZETTE OF INDIA\n' * (size // 21)),
+    ]
+
+def load_samples(dirname, limit):
+    samples = []
+    for filename in sorted(os.listdir(dirname)):
+        filepath = os.path.join(dirname, filename)
+        if filename.startswith('.') or not os.path.isfile(filepath):
+            continue
+        with open(filepath, 'rb') as f:
+            samples.append((filename, f.read()))
+        if len(samples) >= limit:
+            break
+    return samples
+
+def time_path(func, samples, rounds):
+    start_ts = time.perf_counter()
+    for i in range(rounds):
+        for name, buff in samples:
+            func(buff)
+    return time.perf_counter() - start_ts
+
+def get_arg_parser():
+    parser = argparse.ArgumentParser(description = 'Benchmark raw doc type detection')
+    parser.add_argument('-n', dest = 'rounds', type = int, default = 100, \
+                        help = 'passes over the samples')
+    parser.add_argument('-d', dest = 'dirname', help = 'directory of sample docs')
+    parser.add_argument('-m', dest = 'max_files', type = int, default = 200, \
+                        help = 'max files read from the directory')
+    parser.add_argument('--size', type = int, default = 1000000, \
+                        help = 'size of the synthetic docs in bytes')
+    return parser
+
+def main():
+    args = get_arg_parser().parse_args()
+    if args.dirname:
+        samples = load_samples(args.dirname, args.max_files)
+    else:
+        samples = make_samples(args.size)
+
+    for name, buff in samples:
+        old, new = old_extension(buff), new_extension(buff)
+        if old != new:
+            print('%s: libmagic %s, signatures %s' % (name, old, new))
+
+    num_docs = len(samples) * args.rounds
+    print('path\tdocs\telapsed(s)\tper doc(us)')
+    for label, func in (('libmagic', old_extension), ('signatures', new_extension)):
+        elapsed = time_path(func, samples, args.rounds)
+        print('%s\t%d\t%.3f\t%.1f' % (label, num_docs, elapsed, elapsed * 1e6 / num_docs))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Report raw docs with identical content, optionally hardlinking them.
+
+    python -m egazette.tools.dedup_report -D datadir [-L] [-n top_pairs]
+
+Duplicates are found through the sha256 in the catalog, so the data directory
+has to be indexed first (tools/rebuild_catalog.py). Docs that already share an
+inode count as deduplicated. With -L every doc is moved into the blob store
+(utils/blobstore.py) and identical docs are hardlinked to one blob.
+"""
+
+import os
+import sys
+import getopt
+import logging
+
+from egazette.utils.file_storage import FileManager
+from egazette.utils.blobstore import BlobStore
+
+def print_usage(progname):
+    print('''Usage: %s [-l level(critical, error, warn, info, debug)]
+                       [-L (hardlink duplicates through the blob store)]
+                       [-n number of source pairs to list (default 20)]
+                       -D datadir''' % progname, file=sys.stderr)
+
+def get_groups(catalog):
+    # relurls, raw extension and size of every sha256 stored more than once
+    cursor = catalog.get_conn().execute( \
+               'SELECT sha256, relurl, raw_ext, size FROM docs WHERE sha256 IN ' \
+               '(SELECT sha256 FROM docs WHERE sha256 IS NOT NULL ' \
+               'GROUP BY sha256 HAVING COUNT(*) > 1) ORDER BY sha256, relurl')
+
+    group = []
+    for row in cursor:
+        if group and group[0][0] != row[0]:
+            yield group
+            group = []
+        group.append(row)
+    if group:
+        yield group
+
+def get_report(storage, top_pairs, link):
+    catalog   = storage.catalog
+    blobstore = BlobStore(os.path.join(storage.basedir, 'blobs'))
+
+    total = catalog.get_conn().execute('SELECT COUNT(*), SUM(size), ' \
+                                       'COUNT(DISTINCT sha256) FROM docs ' \
+                                       'WHERE raw_ext IS NOT NULL').fetchone()
+    stats = {'docs': total[0], 'bytes': total[1] or 0, 'unique_docs': total[2], \
+             'duplicate_docs': 0, 'duplicate_bytes': 0, 'linked_bytes': 0, \
+             'newly_linked': 0}
+    pairs = {}
+
+    for group in get_groups(catalog):
+        sha256 = group[0][0]
+        inodes = set()
+        srcs   = set()
+        for _, relurl, raw_ext, size in group:
+            srcs.add(relurl.split('/')[0])
+            filepath = os.path.join(storage.rawdir, '%s.%s' % (relurl, raw_ext))
+            if not os.path.exists(filepath):
+                continue
+
+            if link:
+                if blobstore.link_existing(filepath, sha256):
+                    stats['newly_linked'] += 1
+                catalog.update_raw(relurl, filepath, sha256)
+            inodes.add(os.stat(filepath).st_ino)
+
+        size = group[0][3] or 0
+        stats['duplicate_docs']  += len(group) - 1
+        stats['duplicate_bytes'] += size * (len(group) - 1)
+        stats['linked_bytes']    += size * (len(group) - len(inodes))
+
+        # within a single source the pair is (src, src)
+        srcs = sorted(srcs)
+        if len(srcs) == 1:
+            srcs = srcs * 2
+        for i in range(len(srcs)):
+            for j in range(i + 1, len(srcs)):
+                key = (srcs[i], srcs[j])
+                pairs[key] = pairs.get(key, 0) + 1
+
+    top = sorted(pairs.items(), key = lambda x: -x[1])[:top_pairs]
+    return stats, top
+
+def print_report(stats, top):
+    gb = 1024.0 ** 3
+    print('docs: %d (%.2f GB), unique: %d' % (stats['docs'], stats['bytes'] / gb, \
+                                              stats['unique_docs']))
+    ratio = 0
+    if stats['bytes']:
+        ratio = 100.0 * stats['duplicate_bytes'] / stats['bytes']
+    print('duplicates: %d docs, %.2f GB (%.1f%% of raw)' % \
+          (stats['duplicate_docs'], stats['duplicate_bytes'] / gb, ratio))
+    print('already hardlinked: %.2f GB, reclaimable: %.2f GB' % \
+          (stats['linked_bytes'] / gb, \
+           (stats['duplicate_bytes'] - stats['linked_bytes']) / gb))
+    if stats['newly_linked']:
+        print('linked in this run: %d docs' % stats['newly_linked'])
+
+    print('\nshared docs by source pair:')
+    for (src1, src2), count in top:
+        if src1 == src2:
+            print('  %-40s %d' % (src1, count))
+        else:
+            print('  %-40s %d' % ('%s / %s' % (src1, src2), count))
+
+if __name__ == '__main__':
+    progname  = sys.argv[0]
+    datadir   = None
+    link      = False
+    top_pairs = 20
+    loglevel  = 'info'
+
+    leveldict = {'critical': logging.CRITICAL, 'error': logging.ERROR, \
+                 'warning': logging.WARNING,   'info': logging.INFO, \
+                 'debug': logging.DEBUG}
+
+    optlist, remlist = getopt.getopt(sys.argv[1:], 'D:l:Ln:')
+    for o, v in optlist:
+        if o == '-D':
+            datadir = v
+        elif o == '-L':
+            link = True
+        elif o == '-n':
+            top_pairs = int(v)
+        elif o == '-l':
+            loglevel = v
+        else:
+            print_usage(progname)
+            sys.exit(0)
+
+    if datadir == None or loglevel not in leveldict:
+        print_usage(progname)
+        sys.exit(0)
+
+    logging.basicConfig(level = leveldict[loglevel], \
+                        format = '%(asctime)s: %(name)s: %(levelname)s %(message)s')
+
+    storage = FileManager(datadir, False, False)
+    if not storage.catalog.is_built():
+        print('The catalog of %s is not built, run tools/rebuild_catalog.py first' % \
+              datadir, file=sys.stderr)
+        sys.exit(1)
+
+    stats, top = get_report(storage, top_pairs, link)
+    print_report(stats, top)
@@ -0,0 +1,309 @@
+"""Disk usage of a data directory per source and month, with orphaned files.
+
+    python -m egazette.tools.disk_usage -D datadir [-I iadir] [-s src ...]
+                                        [-p processes] [-m] [-o report.json] [-F]
+
+raw/, metatags/, html/ and pymupdf/ are walked per source, the sources in
+parallel, the way FileManager.recursive_relurls enumerates relurls: every
+file is a relurl with an extension and a day pack (utils/daypack.py) stands
+for its members. Files and bytes are summed per source, tree and month of the
+relurl, and relurls present in one tree but not where they should be are
+reported as orphans: raw docs without metatags, metatags without a raw doc,
+and html/pymupdf conversions without a raw doc. With -I the items of the
+iasync directory are counted too, attributed to sources by identifier prefix.
+
+The listing of every directory is kept in <datadir>/stats/diskusage.db with
+the mtime of the directory. Docs are renamed into place, so a directory whose
+mtime did not change still has the same files and is not listed or stat'ed
+again; a rerun only looks at the days that changed. -F ignores the cache.
+"""
+
+import os
+import re
+import sys
+import json
+import getopt
+import sqlite3
+import logging
+import multiprocessing
+
+from egazette.utils import daypack
+from egazette.utils.catalog import get_relurl_date
+from egazette.srcs import datasrcs_info
+
+TREES = ['raw', 'metatags', 'html', 'pymupdf']
+
+# orphan kind -> (tree, tree in which the relurl is expected)
+ORPHANS = {
+    'raw_without_metatags':  ('raw', 'metatags'),
+    'metatags_without_raw':  ('metatags', 'raw'),
+    'html_without_raw':      ('html', 'raw'),
+    'pymupdf_without_raw':   ('pymupdf', 'raw'),
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS dirs (
+    path    TEXT PRIMARY KEY,
+    mtime   REAL NOT NULL,
+    entries TEXT NOT NULL
+);
+'''
+
+date_re = re.compile(r'(\d{4})-(\d{2})-\d{2}')
+
+def print_usage(progname):
+    print('''Usage: %s [-l level(critical, error, warn, info, debug)]
+                       [-s src (default: all sources in raw/)]
+                       [-I iasync directory]
+                       [-p processes (default: number of cpus)]
+                       [-m (per month)]
+                       [-o json report]
+                       [-F (ignore cached directory listings)]
+                       -D datadir''' % progname, file=sys.stderr)
+
+class DirCache:
+    '''
+    Listings of directories and day packs by path, valid while the mtime of
+    the path is unchanged. Entries are (name, size), size None for a
+    subdirectory. New listings are written in one transaction by save().
+    '''
+    def __init__(self, dbpath, full):
+        self.dbpath   = dbpath
+        self.full     = full
+        self.conn     = None
+        self.conn_pid = None
+        self.updates  = []
+
+    def get_conn(self):
+        if self.conn == None or self.conn_pid != os.getpid():
+            self.conn = sqlite3.connect(self.dbpath, timeout = 60)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.executescript(SCHEMA)
+            self.conn_pid = os.getpid()
+        return self.conn
+
+    def get(self, path, mtime):
+        if self.full:
+            return None
+        row = self.get_conn().execute('SELECT mtime, entries FROM dirs WHERE path = ?', \
+                                      (path,)).fetchone()
+        if row == None or row[0] != mtime:
+            return None
+        return json.loads(row[1])
+
+    def put(self, path, mtime, entries):
+        self.updates.append((path, mtime, json.dumps(entries)))
+
+    def save(self):
+        conn = self.get_conn()
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO dirs (path, mtime, entries) ' \
+                             'VALUES (?, ?, ?)', self.updates)
+        self.updates = []
+
+def list_dir(cache, dirpath):
+    mtime   = os.stat(dirpath).st_mtime
+    entries = cache.get(dirpath, mtime)
+    if entries != None:
+        return entries
+
+    entries = []
+    with os.scandir(dirpath) as it:
+        for entry in it:
+            if entry.name.startswith('.'):
+                # temp files of docs being written
+                continue
+            if entry.is_dir(follow_symlinks = False):
+                entries.append((entry.name, None))
+            elif entry.is_file(follow_symlinks = False):
+                entries.append((entry.name, entry.stat().st_size))
+    cache.put(dirpath, mtime, entries)
+    return entries
+
+def list_pack(cache, packpath):
+    mtime   = os.stat(packpath).st_mtime
+    entries = cache.get(packpath, mtime)
+    if entries != None:
+        return entries
+
+    packs   = daypack.PackReader(max_open = 1)
+    members = packs.get_members(packpath) or {}
+    entries = [(name, zinfo.compress_size) for name, zinfo in members.items()]
+    cache.put(packpath, mtime, entries)
+    return entries
+
+def walk(cache, basedir, relpath):
+    # (relative path, size) of the files under relpath, day packs expanded
+    dirpath = os.path.join(basedir, relpath)
+    for name, size in list_dir(cache, dirpath):
+        rel = os.path.join(relpath, name)
+        if size == None:
+            for item in walk(cache, basedir, rel):
+                yield item
+        elif name.endswith(daypack.PACK_SUFFIX):
+            dayrel = rel[:-len(daypack.PACK_SUFFIX)]
+            for member, msize in list_pack(cache, os.path.join(basedir, rel)):
+                yield os.path.join(dayrel, member), msize
+        else:
+            yield rel, size
+
+def get_month(name):
+    reobj = date_re.search(name)
+    if reobj == None:
+        return 'undated'
+    return '%s-%s' % reobj.groups()
+
+def add_usage(usage, month, size):
+    counts = usage.setdefault(month, [0, 0])
+    counts[0] += 1
+    counts[1] += size
+
+def scan_src(args):
+    datadir, src, full = args
+    cache = DirCache(os.path.join(datadir, 'stats', 'diskusage.db'), full)
+
+    usage   = {}
+    relurls = {}
+    for tree in TREES:
+        usage[tree]   = {}
+        relurls[tree] = set()
+        if not os.path.isdir(os.path.join(datadir, tree, src)):
+            continue
+
+        for rel, size in walk(cache, os.path.join(datadir, tree), src):
+            relurl = rel.rsplit('.', 1)[0]
+            relurls[tree].add(relurl)
+            date = get_relurl_date(relurl)
+            add_usage(usage[tree], date[:7] if date else 'undated', size)
+    cache.save()
+
+    orphans = {}
+    for kind, (tree, expected) in ORPHANS.items():
+        orphans[kind] = sorted(relurls[tree] - relurls[expected])
+    return src, usage, orphans
+
+def get_prefixes():
+    # identifier prefix -> source, longest first
+    prefixes = [(datasrcs_info.get_prefix(src), src) for src in datasrcs_info.srcinfos]
+    prefixes.sort(key = lambda x: -len(x[0]))
+    return prefixes
+
+def scan_ia(args):
+    iadir, datadir, full = args
+    cache    = DirCache(os.path.join(datadir, 'stats', 'diskusage.db'), full)
+    prefixes = get_prefixes()
+
+    usage = {}
+    for identifier, size in list_dir(cache, iadir):
+        if size != None:
+            continue
+        src = 'unknown'
+        for prefix, name in prefixes:
+            if identifier.startswith(prefix):
+                src = name
+                break
+
+        itemsize = sum(s for rel, s in walk(cache, iadir, identifier))
+        add_usage(usage.setdefault(src, {}), get_month(identifier), itemsize)
+    cache.save()
+    return usage
+
+def total(months):
+    files = sum(v[0] for v in months.values())
+    size  = sum(v[1] for v in months.values())
+    return files, size
+
+def print_report(report, per_month):
+    print('src\ttree\tmonth\tfiles\tGB')
+    for src in sorted(report['sources'].keys()):
+        for tree, months in sorted(report['sources'][src]['usage'].items()):
+            if not months:
+                continue
+            if per_month:
+                for month in sorted(months.keys()):
+                    files, size = months[month]
+                    print('%s\t%s\t%s\t%d\t%.2f' % (src, tree, month, files, size / 1e9))
+            files, size = total(months)
+            print('%s\t%s\tall\t%d\t%.2f' % (src, tree, files, size / 1e9))
+
+    print('\nsrc\torphans')
+    for src in sorted(report['sources'].keys()):
+        orphans = report['sources'][src]['orphans']
+        counts  = ['%s %d' % (kind, len(orphans[kind])) for kind in sorted(orphans) \
+                   if orphans[kind]]
+        if counts:
+            print('%s\t%s' % (src, ', '.join(counts)))
+
+if __name__ == '__main__':
+    progname  = sys.argv[0]
+    datadir   = None
+    iadir     = None
+    srcs      = []
+    loglevel  = 'info'
+    num_procs = multiprocessing.cpu_count()
+    per_month = False
+    outfile   = None
+    full      = False
+
+    leveldict = {'critical': logging.CRITICAL, 'error': logging.ERROR, \
+                 'warning': logging.WARNING,   'info': logging.INFO, \
+                 'debug': logging.DEBUG}
+
+    optlist, remlist = getopt.getopt(sys.argv[1:], 'D:FI:l:mo:p:s:')
+    for o, v in optlist:
+        if o == '-D':
+            datadir = v
+        elif o == '-I':
+            iadir = v
+        elif o == '-s':
+            srcs.append(v)
+        elif o == '-p':
+            num_procs = int(v)
+        elif o == '-m':
+            per_month = True
+        elif o == '-o':
+            outfile = v
+        elif o == '-F':
+            full = True
+        elif o == '-l':
+            loglevel = v
+        else:
+            print_usage(progname)
+            sys.exit(0)
+
+    if datadir == None or loglevel not in leveldict:
+        print_usage(progname)
+        sys.exit(0)
+
+    logging.basicConfig(level = leveldict[loglevel], \
+                        format = '%(asctime)s: %(name)s: %(levelname)s %(message)s')
+    logger = logging.getLogger('diskusage')
+
+    if not srcs:
+        srcs = sorted(os.listdir(os.path.join(datadir, 'raw')))
+    os.makedirs(os.path.join(datadir, 'stats'), exist_ok = True)
+
+    report = {'sources': {}, 'iasync': None}
+    with multiprocessing.Pool(num_procs) as pool:
+        ia_result = None
+        if iadir:
+            ia_result = pool.apply_async(scan_ia, ((iadir, datadir, full),))
+
+        units = [(datadir, src, full) for src in srcs]
+        for src, usage, orphans in pool.imap_unordered(scan_src, units):
+            logger.info('%s: scanned', src)
+            report['sources'][src] = {'usage': usage, 'orphans': orphans}
+
+        if ia_result != None:
+            report['iasync'] = ia_result.get()
+
+    print_report(report, per_month)
+    if report['iasync'] != None:
+        print('\nsrc\tiasync items\tGB')
+        for src, months in sorted(report['iasync'].items()):
+            files, size = total(months)
+            print('%s\t%d\t%.2f' % (src, files, size / 1e9))
+
+    if outfile:
+        with open(outfile, 'w') as f:
+            json.dump(report, f, indent = 1, sort_keys = True)
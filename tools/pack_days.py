@@ -0,0 +1,114 @@
+"""Pack closed days of raw/ and metatags/ into one zip each (utils/daypack.py).
+
+    python -m egazette.tools.pack_days -D datadir [-s src ...] [-a min_age_days]
+
+A day directory is packed once its date is at least min_age_days old (default
+60), so that days still being revisited by the crawlers stay loose. Loose docs
+saved later for a packed day are folded into its pack on the next run. The
+metadata segments of a packed metatags day are rewritten so that they keep
+matching the packed XML.
+"""
+
+import os
+import re
+import sys
+import getopt
+import logging
+import datetime
+
+from egazette.utils.file_storage import FileManager
+from egazette.utils import daypack
+from egazette.utils import xml_ops
+
+def print_usage(progname):
+    print('''Usage: %s [-l level(critical, error, warn, info, debug)]
+                       [-s src (default: all sources in raw/)]
+                       [-a min_age_days (default 60)]
+                       -D datadir''' % progname, file=sys.stderr)
+
+def get_day_dirs(basedir, src, before):
+    # (relative dirname, path) of the day directories of src dated before
+    srcdir = os.path.join(basedir, src)
+    if not os.path.isdir(srcdir):
+        return
+
+    for dirpath, dirnames, filenames in os.walk(srcdir):
+        dirnames.sort()
+        reobj = re.match(r'(\d{4})-(\d{2})-(\d{2})$', os.path.basename(dirpath))
+        if reobj == None:
+            continue
+        try:
+            dateobj = datetime.date(*[int(x) for x in reobj.groups()])
+        except ValueError:
+            continue
+        if dateobj < before:
+            yield os.path.relpath(dirpath, basedir), dirpath
+
+def rewrite_segment(storage, dayrel, dirpath):
+    packpath = daypack.get_pack_path(dirpath)
+    members  = storage.packs.get_members(packpath)
+    records  = []
+    for name in sorted(members.keys()):
+        if not name.endswith('.xml'):
+            continue
+        relurl = os.path.join(dayrel, name[:-4])
+        tags   = xml_ops.xml_to_feature(relurl, storage.packs.read(packpath, name))
+        if tags != None:
+            records.append((relurl, daypack.get_member_mtime(members[name]), tags))
+    storage.metastore.rewrite(dayrel, records)
+
+def pack_src(storage, src, before):
+    logger = logging.getLogger('packdays')
+    counts = {'raw': 0, 'metatags': 0}
+
+    for dayrel, dirpath in get_day_dirs(storage.rawdir, src, before):
+        counts['raw'] += len(daypack.pack_dir(dirpath))
+
+    for dayrel, dirpath in get_day_dirs(storage.metadir, src, before):
+        packed = daypack.pack_dir(dirpath)
+        if packed:
+            counts['metatags'] += len(packed)
+            rewrite_segment(storage, dayrel, dirpath)
+
+    logger.info('%s: packed %d raw docs and %d metatags', src, counts['raw'], \
+                counts['metatags'])
+
+if __name__ == '__main__':
+    progname = sys.argv[0]
+    datadir  = None
+    srcs     = []
+    min_age  = 60
+    loglevel = 'info'
+
+    leveldict = {'critical': logging.CRITICAL, 'error': logging.ERROR, \
+                 'warning': logging.WARNING,   'info': logging.INFO, \
+                 'debug': logging.DEBUG}
+
+    optlist, remlist = getopt.getopt(sys.argv[1:], 'a:D:l:s:')
+    for o, v in optlist:
+        if o == '-D':
+            datadir = v
+        elif o == '-s':
+            srcs.append(v)
+        elif o == '-a':
+            min_age = int(v)
+        elif o == '-l':
+            loglevel = v
+        else:
+            print_usage(progname)
+            sys.exit(0)
+
+    if datadir == None or loglevel not in leveldict:
+        print_usage(progname)
+        sys.exit(0)
+
+    logging.basicConfig(level = leveldict[loglevel], \
+                        format = '%(asctime)s: %(name)s: %(levelname)s %(message)s')
+
+    storage = FileManager(datadir, False, False)
+    before  = datetime.date.today() - datetime.timedelta(days = min_age)
+    if not srcs:
+        srcs = sorted(os.listdir(storage.rawdir))
+
+    for src in srcs:
+        pack_src(storage, src, before)
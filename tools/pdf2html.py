@@ -130,8 +130,20 @@ def iter_pdf_relurls(storage, srcs, fromdate, todate):
     """Yield (relurl, pdf_path) for every raw PDF matching srcs and the dates.
 
     PDFs are located using FileManager so the on-disk layout stays the single
-    source of truth.
+    source of truth. Once the data directory's catalog has been built (see
+    tools/rebuild_catalog.py) the PDFs are looked up there instead of walking
+    raw/.
     """
+    if storage.catalog.is_built():
+        for relurl, raw_ext in storage.catalog.find_raw(srcs, fromdate, todate,
+                                                        'pdf'):
+            pdf_path = os.path.join(storage.rawdir, '%s.%s' % (relurl, raw_ext))
+            if not os.path.exists(pdf_path):
+                # in a day pack, unpacked by resolve_pdf when it is converted
+                pdf_path = None
+            yield relurl, pdf_path
+        return
+
     if not srcs:
         srcs = sorted(os.listdir(storage.rawdir))
 
@@ -255,6 +267,12 @@ def convert_one(htmldir, engine, legallayout_dir, relurl, pdf_path,
     return 'converted' if ok else 'failed'
 
 
+def record_converted(storage, htmldir, engine, relurl):
+    """Note the new html of a relurl in the data directory's catalog."""
+    out_path = os.path.join(htmldir, '%s.html' % relurl)
+    storage.save_output(relurl, OUTPUT_SUBDIR[engine], out_path)
+
+
 def resolve_pdf(storage, relurl, pdf_path):
     """Return the raw PDF path for a relurl, or None if there isn't one."""
     if pdf_path is None:
@@ -289,10 +307,14 @@ def _worker_task(relurl_pdf):
         logger.error('No raw PDF found for relurl %s', relurl)
         return 'failed'
 
-    return convert_one(_worker['htmldir'], _worker['engine'],
-                       _worker['legallayout_dir'], relurl, pdf_path,
-                       _worker['overwrite'], _worker['public_base_url'],
-                       _worker['server_root'])
+    result = convert_one(_worker['htmldir'], _worker['engine'],
+                         _worker['legallayout_dir'], relurl, pdf_path,
+                         _worker['overwrite'], _worker['public_base_url'],
+                         _worker['server_root'])
+    if result == 'converted':
+        record_converted(storage, _worker['htmldir'], _worker['engine'],
+                         relurl)
+    return result
 
 
 def convert(storage, datadir, htmldir, engine, legallayout_dir, relurl_pdfs,
@@ -321,6 +343,8 @@ def convert(storage, datadir, htmldir, engine, legallayout_dir, relurl_pdfs,
             result = convert_one(htmldir, engine, legallayout_dir,
                                  relurl, pdf_path, overwrite,
                                  public_base_url, server_root)
+            if result == 'converted':
+                record_converted(storage, htmldir, engine, relurl)
             counts[result] += 1
 
     logger.info('Done. converted=%d failed=%d skipped=%d',
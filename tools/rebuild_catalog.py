@@ -0,0 +1,178 @@
+"""Index an existing data directory into its catalog (utils/catalog.py).
+
+    python -m egazette.tools.rebuild_catalog -D datadir [-s src ...] [-M]
+
+Walks raw/ once and records every relurl with the times of its metatags and
+html/pymupdf conversions. A doc whose size and mtime match the catalog keeps
+its sha256, so rerunning after a partial run only hashes new or changed docs.
+Once every source was indexed the catalog is marked as built and is used for
+enumeration from then on. With -M the JSON-lines metadata segments
+(utils/metastore.py) are rewritten from the metatags as well, and the other
+segments of the source are compacted.
+"""
+
+import os
+import sys
+import getopt
+import logging
+
+from egazette.utils.file_storage import FileManager
+from egazette.utils.catalog import OUTPUT_COLUMNS, get_stream_sha256
+from egazette.utils import xml_ops
+from egazette.utils import daypack
+
+def print_usage(progname):
+    print('''Usage: %s [-l level(critical, error, warn, info, debug)]
+                       [-s src (default: all sources in raw/)]
+                       [-M (rewrite the metadata segments)]
+                       -D datadir''' % progname, file=sys.stderr)
+
+def get_mtime(filepath):
+    if os.path.isfile(filepath):
+        return os.path.getmtime(filepath)
+    return None
+
+def get_meta_record(storage, relurl):
+    metapath = os.path.join(storage.metadir, '%s.xml' % relurl)
+    if os.path.isfile(metapath):
+        with open(metapath, 'rb') as f:
+            xmlstring = f.read()
+        mtime = os.path.getmtime(metapath)
+    else:
+        packed = storage.get_packed_meta(relurl)
+        if packed == None:
+            return None
+        xmlstring = storage.packs.read(packed[0], packed[1].filename)
+        mtime = daypack.get_member_mtime(packed[1])
+
+    tags = xml_ops.xml_to_feature(relurl, xmlstring)
+    if tags == None:
+        return None
+    return relurl, mtime, tags
+
+def index_packed_raw(storage, relurl, packed):
+    catalog = storage.catalog
+    zinfo   = storage.packs.get_member(*packed)
+    mtime   = daypack.get_member_mtime(zinfo)
+
+    doc = catalog.get_doc(relurl)
+    if doc != None and doc[1] == zinfo.file_size and doc[3] == mtime:
+        sha256 = doc[2]
+    else:
+        with storage.packs.open(*packed) as f:
+            sha256 = get_stream_sha256(f)
+    extension = zinfo.filename.rsplit('.', 1)[-1]
+    catalog.set_raw(relurl, extension, zinfo.file_size, mtime, sha256)
+
+def index_src(storage, src, rewrite_meta):
+    logger  = logging.getLogger('catalog')
+    catalog = storage.catalog
+    conn    = catalog.get_conn()
+
+    relurls = set()
+    # metadata records of the day directory being walked
+    meta_dir     = None
+    meta_records = []
+    rewritten    = set()
+    for relurl in storage.recursive_relurls(storage.rawdir, src):
+        rawpath = storage.raw_index.lookup(os.path.join(storage.rawdir, relurl))
+        packed  = None
+        if rawpath == None:
+            # only in the pack of its day, read without unpacking
+            packed = storage.raw_index.lookup_packed(os.path.join(storage.rawdir, relurl))
+            if packed == None:
+                continue
+        relurls.add(relurl)
+
+        meta_mtime = storage.get_meta_mtime(relurl)
+        if rewrite_meta and meta_mtime != None:
+            dirname = os.path.dirname(relurl)
+            if dirname != meta_dir:
+                if meta_records:
+                    storage.metastore.rewrite(meta_dir, meta_records)
+                    rewritten.add(meta_dir)
+                meta_dir     = dirname
+                meta_records = []
+            record = get_meta_record(storage, relurl)
+            if record != None:
+                meta_records.append(record)
+
+        if packed != None:
+            index_packed_raw(storage, relurl, packed)
+        else:
+            stat = os.stat(rawpath)
+            doc  = catalog.get_doc(relurl)
+            if doc != None and doc[1] == stat.st_size and doc[3] == stat.st_mtime:
+                sha256 = doc[2]
+            else:
+                sha256 = None
+            catalog.update_raw(relurl, rawpath, sha256)
+
+        mtimes = {'meta_mtime': meta_mtime}
+        for subdir, column in OUTPUT_COLUMNS.items():
+            outpath = os.path.join(storage.basedir, subdir, '%s.html' % relurl)
+            mtimes[column] = get_mtime(outpath)
+
+        with conn:
+            for column, mtime in mtimes.items():
+                conn.execute('UPDATE docs SET %s = ? WHERE relurl = ?' % column, \
+                             (mtime, relurl))
+
+        if len(relurls) % 10000 == 0:
+            logger.info('%s: %d docs', src, len(relurls))
+
+    if meta_records:
+        storage.metastore.rewrite(meta_dir, meta_records)
+        rewritten.add(meta_dir)
+    if rewrite_meta:
+        dropped = storage.metastore.compact_src(src, skip = rewritten)
+        logger.info('%s: %d metadata segments rewritten, %d stale records dropped', \
+                    src, len(rewritten), dropped)
+
+    removed = catalog.remove_missing(src, relurls)
+    logger.info('%s: %d docs indexed, %d removed', src, len(relurls), removed)
+
+if __name__ == '__main__':
+    progname = sys.argv[0]
+    datadir  = None
+    srcs     = []
+    loglevel = 'info'
+    rewrite_meta = False
+
+    leveldict = {'critical': logging.CRITICAL, 'error': logging.ERROR, \
+                 'warning': logging.WARNING,   'info': logging.INFO, \
+                 'debug': logging.DEBUG}
+
+    optlist, remlist = getopt.getopt(sys.argv[1:], 'D:l:Ms:')
+    for o, v in optlist:
+        if o == '-D':
+            datadir = v
+        elif o == '-s':
+            srcs.append(v)
+        elif o == '-M':
+            rewrite_meta = True
+        elif o == '-l':
+            loglevel = v
+        else:
+            print_usage(progname)
+            sys.exit(0)
+
+    if datadir == None or loglevel not in leveldict:
+        print_usage(progname)
+        sys.exit(0)
+
+    logging.basicConfig(level = leveldict[loglevel], \
+                        format = '%(asctime)s: %(name)s: %(levelname)s %(message)s')
+
+    storage = FileManager(datadir, False, False)
+    if srcs:
+        srclist = srcs
+    else:
+        srclist = sorted(os.listdir(storage.rawdir))
+
+    for src in srclist:
+        index_src(storage, src, rewrite_meta)
+
+    # a partial rebuild does not make the catalog complete
+    if not srcs:
+        storage.catalog.set_built()
@@ -0,0 +1,140 @@
+"""Optional asyncio HTTP engine for Downloader.
+
+Downloader.download_url_onetime builds a fresh urllib opener for every request,
+so each gazette pays for a new TCP and TLS handshake. This engine keeps one
+httpx.AsyncClient (a keep-alive connection pool) per scheme, host and TLS
+setting, running on an event loop in a background thread of the crawler
+process. Downloader keeps its synchronous API and hands requests to the loop,
+so scrapers can move over one at a time by setting ``self.async_http = True``.
+
+Cookies stay in the http.cookiejar.CookieJar objects that scrapers already pass
+around (``loadcookies``/``savecookies`` or ``session.cookies``), so a jar is
+shared by every request of a session whichever engine serves it.
+
+httpx is only needed when a scraper opts in.
+"""
+
+import asyncio
+import threading
+import os
+import ssl
+import http.client
+import urllib.request, urllib.error, urllib.parse
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+class CookieResponse:
+    # the minimal response interface CookieJar.extract_cookies() needs
+    def __init__(self, headers):
+        self.headers = headers
+
+    def info(self):
+        return self.headers
+
+def to_http_message(headers):
+    msg = http.client.HTTPMessage()
+    for k, v in headers.multi_items():
+        msg[k] = v
+    return msg
+
+class AsyncHttpEngine:
+    def __init__(self, max_connections_per_host = 4, keepalive_expiry = 60):
+        self.max_connections_per_host = max_connections_per_host
+        self.keepalive_expiry = keepalive_expiry
+
+        self.clients = {}
+        self.loop    = asyncio.new_event_loop()
+        self.thread  = threading.Thread(target = self.loop.run_forever, \
+                                        name = 'asynchttp', daemon = True)
+        self.thread.start()
+
+    def get_client(self, url, verify):
+        purl = urllib.parse.urlsplit(url)
+        if isinstance(verify, ssl.SSLContext):
+            sslkey = id(verify)
+        else:
+            sslkey = verify
+        key = (purl.scheme, purl.netloc, sslkey)
+
+        if key not in self.clients:
+            limits = httpx.Limits(max_connections = self.max_connections_per_host, \
+                                  max_keepalive_connections = self.max_connections_per_host, \
+                                  keepalive_expiry = self.keepalive_expiry)
+            self.clients[key] = httpx.AsyncClient(verify = verify, limits = limits)
+        return self.clients[key]
+
+    async def fetch(self, url, method = 'GET', headers = None, data = None, \
+                    loadcookies = None, savecookies = None, verify = True, \
+                    timeout = None, allow_redirects = True, tofile = None):
+        headers = dict(headers or {})
+
+        request = urllib.request.Request(url, headers = headers, method = method)
+        if loadcookies != None:
+            loadcookies.add_cookie_header(request)
+            if 'Cookie' in request.unredirected_hdrs:
+                headers['Cookie'] = request.unredirected_hdrs['Cookie']
+
+        kwargs = {'headers': headers, 'timeout': timeout}
+        if isinstance(data, (bytes, str)):
+            kwargs['content'] = data
+        elif data != None:
+            kwargs['data'] = data
+
+        client   = self.get_client(url, verify)
+        request  = client.build_request(method, url, **kwargs)
+        response = await client.send(request, follow_redirects = allow_redirects, \
+                                     stream = tofile != None)
+        try:
+            if savecookies != None:
+                for r in response.history + [response]:
+                    req = urllib.request.Request(str(r.request.url))
+                    savecookies.extract_cookies(CookieResponse(to_http_message(r.headers)), req)
+
+            srvresponse = to_http_message(response.headers)
+            # urllib raises on a 304 too, keep the two engines alike
+            if response.status_code >= 400 or response.status_code == 304:
+                raise urllib.error.HTTPError(str(response.url), response.status_code, \
+                                             response.reason_phrase, srvresponse, None)
+
+            if tofile == None:
+                content = response.content
+            else:
+                # the body goes to disk chunk by chunk
+                content = None
+                async for chunk in response.aiter_bytes():
+                    tofile.write(chunk)
+        finally:
+            await response.aclose()
+
+        return response.status_code, srvresponse, content, str(response.url)
+
+    def request(self, url, **kwargs):
+        future = asyncio.run_coroutine_threadsafe(self.fetch(url, **kwargs), self.loop)
+        return future.result()
+
+    def close(self):
+        async def close_clients():
+            for client in self.clients.values():
+                await client.aclose()
+
+        asyncio.run_coroutine_threadsafe(close_clients(), self.loop).result()
+        self.clients = {}
+
+_engine = None
+_engine_pid = None
+
+def get_engine():
+    # the event loop thread does not survive a fork, so every crawler
+    # process builds its own engine on first use
+    global _engine, _engine_pid
+
+    if httpx == None:
+        raise ImportError('httpx is required for the asyncio HTTP engine')
+
+    if _engine == None or _engine_pid != os.getpid():
+        _engine     = AsyncHttpEngine()
+        _engine_pid = os.getpid()
+    return _engine
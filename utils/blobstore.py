@@ -0,0 +1,68 @@
+"""Content-addressed store of raw docs, in <datadir>/blobs.
+
+Many sources republish the same document under different relurls (weekly and
+extraordinary series, archive and current sites). With the store enabled
+(sync.py -B) every raw doc is also kept as blobs/<ab>/<cd>/<sha256> and a doc
+that is already there is hardlinked into raw/<relurl>.<ext> instead of being
+written again. raw/ keeps its layout, so readers of the tree are unaffected.
+
+Docs are always written to a temporary file and renamed into place: writing
+into an existing raw file would change every relurl linked to the same blob.
+Hardlinks need raw/ and blobs/ on the same filesystem; when linking fails the
+doc is simply kept as a separate copy.
+"""
+
+import os
+import logging
+
+class BlobStore:
+    def __init__(self, blobdir):
+        self.blobdir = blobdir
+        self.logger  = logging.getLogger('judis.blobstore')
+
+    def get_blob_path(self, sha256):
+        return os.path.join(self.blobdir, sha256[:2], sha256[2:4], sha256)
+
+    def put(self, tmppath, filepath, sha256):
+        # moves tmppath to filepath, sharing the blob of sha256 if it exists;
+        # returns True if the doc was deduplicated
+        blobpath = self.get_blob_path(sha256)
+
+        if os.path.exists(blobpath):
+            linkpath = tmppath + '.link'
+            try:
+                os.link(blobpath, linkpath)
+                os.replace(linkpath, filepath)
+            except OSError as e:
+                self.logger.warning('Could not link %s to %s: %s', filepath, blobpath, e)
+            else:
+                os.remove(tmppath)
+                return True
+
+        os.replace(tmppath, filepath)
+        os.makedirs(os.path.dirname(blobpath), exist_ok = True)
+        try:
+            os.link(filepath, blobpath)
+        except FileExistsError:
+            # stored concurrently by another crawler
+            pass
+        except OSError as e:
+            self.logger.warning('Could not add %s to the blob store: %s', filepath, e)
+        return False
+
+    def link_existing(self, filepath, sha256):
+        # deduplicates a doc already in raw/, used on trees downloaded
+        # before the store was enabled
+        blobpath = self.get_blob_path(sha256)
+        if os.path.exists(blobpath):
+            if os.path.samefile(blobpath, filepath):
+                return False
+            dirname, filename = os.path.split(filepath)
+            linkpath = os.path.join(dirname, '.%s.link' % filename)
+            os.link(blobpath, linkpath)
+            os.replace(linkpath, filepath)
+            return True
+
+        os.makedirs(os.path.dirname(blobpath), exist_ok = True)
+        os.link(filepath, blobpath)
+        return False
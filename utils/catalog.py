@@ -0,0 +1,213 @@
+"""Catalog of the gazettes under a data directory, in <datadir>/stats/catalog.db.
+
+For every relurl the catalog keeps its source, date, raw extension, size and
+sha256, and the modification times of its raw doc, metatags file and the html
+and pymupdf conversions. FileManager updates it as docs are saved, so that
+enumerating a source or a time window (iasync -d, tools/generate_relurls.py,
+tools/pdf2html.py) is a query instead of a walk of raw/ with a couple of
+stats per file.
+
+Trees downloaded before the catalog existed, or touched by other means, are
+(re)indexed with tools/rebuild_catalog.py. Until a rebuild has completed once
+the catalog is not trusted for enumeration and callers walk the tree as before.
+"""
+
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS docs (
+    relurl        TEXT PRIMARY KEY,
+    src           TEXT NOT NULL,
+    date          TEXT,
+    raw_ext       TEXT,
+    size          INTEGER,
+    sha256        TEXT,
+    raw_mtime     REAL,
+    meta_mtime    REAL,
+    html_mtime    REAL,
+    pymupdf_mtime REAL
+);
+CREATE INDEX IF NOT EXISTS docs_src_date ON docs (src, date);
+CREATE INDEX IF NOT EXISTS docs_updated ON docs (MAX(raw_mtime, meta_mtime));
+CREATE TABLE IF NOT EXISTS info (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+'''
+
+# converted outputs tracked per relurl, subdirectory of datadir -> column
+OUTPUT_COLUMNS = {'html': 'html_mtime', 'pymupdf': 'pymupdf_mtime'}
+
+date_re = re.compile(r'(\d{4})-(\d{2})-(\d{2})')
+
+def get_relurl_date(relurl):
+    reobj = date_re.search(relurl)
+    if reobj == None:
+        return None
+    return reobj.group(0)
+
+def get_stream_sha256(f, chunk_size = 1024 * 1024):
+    h = hashlib.sha256()
+    while True:
+        buf = f.read(chunk_size)
+        if not buf:
+            break
+        h.update(buf)
+    return h.hexdigest()
+
+def get_file_sha256(filepath):
+    with open(filepath, 'rb') as f:
+        return get_stream_sha256(f)
+
+class Catalog:
+    def __init__(self, dbpath):
+        self.dbpath   = dbpath
+        self.conn     = None
+        self.conn_pid = None
+
+        # the connection is shared by the threads of a crawler (GazetteBatch),
+        # its transactions must not interleave
+        self.lock     = threading.Lock()
+
+    def get_conn(self):
+        # a sqlite connection must not be shared across forked crawlers
+        with self.lock:
+            if self.conn == None or self.conn_pid != os.getpid():
+                os.makedirs(os.path.dirname(self.dbpath), exist_ok = True)
+                self.conn = sqlite3.connect(self.dbpath, timeout = 60, \
+                                            check_same_thread = False)
+                self.conn.execute('PRAGMA journal_mode=WAL')
+                self.conn.executescript(SCHEMA)
+                self.conn_pid = os.getpid()
+            return self.conn
+
+    def is_built(self):
+        # only read, readers of a tree without a catalog should not create one
+        if not os.path.exists(self.dbpath):
+            return False
+        row = self.get_conn().execute('SELECT value FROM info WHERE key = ?', \
+                                      ('built',)).fetchone()
+        return row != None
+
+    def set_built(self):
+        conn = self.get_conn()
+        with self.lock, conn:
+            conn.execute('INSERT OR REPLACE INTO info VALUES (?, ?)', \
+                         ('built', str(time.time())))
+
+    def ensure_doc(self, conn, relurl):
+        conn.execute('INSERT OR IGNORE INTO docs (relurl, src, date) VALUES (?, ?, ?)', \
+                     (relurl, relurl.split('/')[0], get_relurl_date(relurl)))
+
+    def update_raw(self, relurl, filepath, sha256 = None):
+        # sha256 is computed from the file when not already known
+        stat = os.stat(filepath)
+        if sha256 == None:
+            sha256 = get_file_sha256(filepath)
+        extension = filepath.rsplit('.', 1)[-1]
+        self.set_raw(relurl, extension, stat.st_size, stat.st_mtime, sha256)
+
+    def set_raw(self, relurl, extension, size, mtime, sha256):
+        conn = self.get_conn()
+        with self.lock, conn:
+            self.ensure_doc(conn, relurl)
+            conn.execute('UPDATE docs SET raw_ext = ?, size = ?, sha256 = ?, ' \
+                         'raw_mtime = ? WHERE relurl = ?', \
+                         (extension, size, sha256, mtime, relurl))
+
+    def update_mtime(self, relurl, column, filepath):
+        self.set_mtime(relurl, column, os.path.getmtime(filepath))
+
+    def set_mtime(self, relurl, column, mtime):
+        conn  = self.get_conn()
+        with self.lock, conn:
+            self.ensure_doc(conn, relurl)
+            conn.execute('UPDATE docs SET %s = ? WHERE relurl = ?' % column, \
+                         (mtime, relurl))
+
+    def clear_raw(self, relurl):
+        # the raw doc is gone, e.g. quarantined after a crash
+        conn = self.get_conn()
+        with self.lock, conn:
+            conn.execute('UPDATE docs SET raw_ext = NULL, size = NULL, sha256 = NULL, ' \
+                         'raw_mtime = NULL WHERE relurl = ?', (relurl,))
+
+    def clear_meta(self, relurl):
+        conn = self.get_conn()
+        with self.lock, conn:
+            conn.execute('UPDATE docs SET meta_mtime = NULL WHERE relurl = ?', (relurl,))
+
+    def update_meta(self, relurl, filepath):
+        self.update_mtime(relurl, 'meta_mtime', filepath)
+
+    def set_meta_mtime(self, relurl, mtime):
+        self.set_mtime(relurl, 'meta_mtime', mtime)
+
+    def update_output(self, relurl, subdir, filepath):
+        self.update_mtime(relurl, OUTPUT_COLUMNS[subdir], filepath)
+
+    def get_doc(self, relurl):
+        cursor = self.get_conn().execute('SELECT raw_ext, size, sha256, raw_mtime ' \
+                                         'FROM docs WHERE relurl = ?', (relurl,))
+        return cursor.fetchone()
+
+    def remove_missing(self, src, relurls):
+        # drops the docs of src that the rebuild did not find on disk
+        conn = self.get_conn()
+        cursor = conn.execute('SELECT relurl FROM docs WHERE src = ?', (src,))
+        missing = [(row[0],) for row in cursor.fetchall() if row[0] not in relurls]
+        with self.lock, conn:
+            conn.executemany('DELETE FROM docs WHERE relurl = ?', missing)
+        return len(missing)
+
+    def find_relurls(self, srcs, start_ts, end_ts):
+        # same window as the walk in FileManager.find_matching_relurls: kept
+        # unless both the raw doc and the metatags are older than start_ts
+        # or both are newer than end_ts
+        clauses = ['raw_ext IS NOT NULL', 'meta_mtime IS NOT NULL']
+        params  = []
+        if srcs:
+            srcs = sorted(srcs)
+            clauses.append('src IN (%s)' % ','.join(['?'] * len(srcs)))
+            params.extend(srcs)
+        if start_ts != None:
+            clauses.append('MAX(raw_mtime, meta_mtime) >= ?')
+            params.append(start_ts)
+        if end_ts != None:
+            clauses.append('MIN(raw_mtime, meta_mtime) <= ?')
+            params.append(end_ts)
+
+        cursor = self.get_conn().execute('SELECT relurl FROM docs WHERE %s ' \
+                                         'ORDER BY relurl' % ' AND '.join(clauses), params)
+        for row in cursor:
+            yield row[0]
+
+    def find_raw(self, srcs, fromdate, todate, raw_ext = None):
+        # (relurl, raw_ext) of the docs of srcs dated within fromdate-todate
+        clauses = ['raw_ext IS NOT NULL']
+        params  = []
+        if srcs:
+            srcs = sorted(srcs)
+            clauses.append('src IN (%s)' % ','.join(['?'] * len(srcs)))
+            params.extend(srcs)
+        if fromdate != None or todate != None:
+            clauses.append('date IS NOT NULL')
+        if fromdate != None:
+            clauses.append('date >= ?')
+            params.append(str(fromdate))
+        if todate != None:
+            clauses.append('date <= ?')
+            params.append(str(todate))
+        if raw_ext != None:
+            clauses.append('LOWER(raw_ext) = ?')
+            params.append(raw_ext)
+
+        cursor = self.get_conn().execute('SELECT relurl, raw_ext FROM docs WHERE %s ' \
+                                         'ORDER BY relurl' % ' AND '.join(clauses), params)
+        for row in cursor:
+            yield row[0], row[1]
@@ -0,0 +1,158 @@
+"""Persistent crawl-state journal kept in <datadir>/stats/crawlstate.db.
+
+For every (source, date) the journal records whether the day was walked
+without errors, when it was last visited and when its listing last changed.
+Listing pages can additionally be fingerprinted per page. BaseGazette.sync
+consults it to skip finished dates: dates within the lookback of the source
+(the window of a daily run, 15 days) are always walked, older ones on a
+schedule that decays with their age, so a 60 day window mostly costs the days
+that can still change, and a killed -a backfill resumes at the first date that
+was not completed.
+"""
+
+import os
+import time
+import json
+import sqlite3
+import hashlib
+import datetime
+import logging
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS days (
+    src          TEXT NOT NULL,
+    date         TEXT NOT NULL,
+    complete     INTEGER NOT NULL DEFAULT 0,
+    last_visit   REAL,
+    last_change  REAL,
+    listing_hash TEXT,
+    num_gazettes INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (src, date)
+);
+CREATE TABLE IF NOT EXISTS listings (
+    src      TEXT NOT NULL,
+    date     TEXT NOT NULL,
+    page     INTEGER NOT NULL,
+    hash     TEXT NOT NULL,
+    visited  REAL NOT NULL,
+    PRIMARY KEY (src, date, page)
+);
+'''
+
+def get_listing_hash(listing):
+    # listing is either the raw page or the parsed metainfos of the page;
+    # the latter is preferable for ASP.NET sites whose __VIEWSTATE changes
+    # on every request
+    if not isinstance(listing, bytes):
+        listing = json.dumps(listing, sort_keys = True, default = str).encode('utf-8')
+    return hashlib.sha1(listing).hexdigest()
+
+class CrawlState:
+    def __init__(self, dbpath, force = False):
+        self.dbpath = dbpath
+        self.force  = force
+        self.logger = logging.getLogger('crawler.crawlstate')
+
+        # days at most this old are visited on every run, unless the source
+        # gives its own lookback; this covers the window of the daily runs,
+        # in which sites still add gazettes to days already walked
+        self.always_visit_days = 15
+        # otherwise a completed day is revisited once its last visit is older
+        # than revisit_factor * age, capped at max_revisit_days
+        self.revisit_factor    = 0.25
+        self.max_revisit_days  = 90
+        # a day younger than this that changed on its last visit is still
+        # settling and is revisited every settle_interval_days
+        self.settle_days       = 30
+        self.settle_interval_days = 2
+
+        self.conn     = None
+        self.conn_pid = None
+        self.pages    = {}
+
+    def get_conn(self):
+        # a sqlite connection must not be shared across forked crawlers
+        if self.conn == None or self.conn_pid != os.getpid():
+            self.conn = sqlite3.connect(self.dbpath, timeout = 60)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.executescript(SCHEMA)
+            self.conn_pid = os.getpid()
+        return self.conn
+
+    def get_day(self, src, dateobj):
+        cursor = self.get_conn().execute( \
+                   'SELECT complete, last_visit, last_change, listing_hash ' \
+                   'FROM days WHERE src = ? AND date = ?', (src, str(dateobj)))
+        return cursor.fetchone()
+
+    def should_visit(self, src, dateobj, now = None, always_visit_days = None):
+        if self.force:
+            return True
+
+        if always_visit_days == None:
+            always_visit_days = self.always_visit_days
+
+        row = self.get_day(src, dateobj)
+        if row == None or not row[0]:
+            return True
+
+        if now == None:
+            now = time.time()
+
+        age = (datetime.date.today() - dateobj).days
+        if age <= always_visit_days:
+            return True
+
+        interval = min(age * self.revisit_factor, self.max_revisit_days)
+
+        complete, last_visit, last_change, listing_hash = row
+        if age <= self.settle_days and last_change != None and \
+                last_visit - last_change < 86400:
+            interval = min(interval, self.settle_interval_days)
+
+        return now - last_visit >= interval * 86400
+
+    def record_listing(self, src, dateobj, page, listing):
+        """Fingerprint a listing page and return True if it is unchanged."""
+        listing_hash = get_listing_hash(listing)
+        conn = self.get_conn()
+        cursor = conn.execute('SELECT hash FROM listings ' \
+                              'WHERE src = ? AND date = ? AND page = ?', \
+                              (src, str(dateobj), page))
+        row = cursor.fetchone()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?)', \
+                         (src, str(dateobj), page, listing_hash, time.time()))
+
+        key = (src, dateobj)
+        if key not in self.pages:
+            self.pages[key] = []
+        self.pages[key].append(listing_hash)
+
+        return row != None and row[0] == listing_hash
+
+    def finish_day(self, src, dateobj, complete, num_gazettes):
+        now  = time.time()
+        row  = self.get_day(src, dateobj)
+
+        pages = self.pages.pop((src, dateobj), None)
+        if pages:
+            listing_hash = get_listing_hash(pages)
+        elif row != None:
+            listing_hash = row[3]
+        else:
+            listing_hash = None
+
+        if row == None or row[2] == None:
+            last_change = now
+        elif num_gazettes > 0 or listing_hash != row[3]:
+            last_change = now
+        else:
+            last_change = row[2]
+
+        conn = self.get_conn()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO days VALUES (?, ?, ?, ?, ?, ?, ?)', \
+                         (src, str(dateobj), int(complete), now, last_change, \
+                          listing_hash, num_gazettes))
+
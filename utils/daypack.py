@@ -0,0 +1,185 @@
+"""Packed day directories.
+
+Sources like central_extraordinary leave dozens of small files per day in
+raw/<src>/<date>/ and metatags/<src>/<date>/, and at tens of millions of
+inodes backups and rsync spend their time on metadata. A day that is closed
+can be packed (tools/pack_days.py) into a single zip next to where its
+directory was:
+
+    raw/<src>/<date>.pack.zip          members <name>.<ext>
+    metatags/<src>/<date>.pack.zip     members <name>.xml
+
+The central directory of the zip is the index of the pack. Docs that are
+already compressed (PDFs, images) are stored as they are, text is deflated.
+FileManager and the website's AssetStorage look into the pack when a relurl
+has no loose file, so readers keep using relurls. A doc saved later for a
+packed day is written as a loose file, which takes precedence over the pack,
+and is folded into it the next time the day is packed.
+"""
+
+import os
+import time
+import shutil
+import zipfile
+import threading
+import collections
+
+PACK_SUFFIX = '.pack.zip'
+
+# deflated in the pack, everything else is stored
+TEXT_EXTENSIONS = set(['xml', 'html', 'htm', 'txt', 'json', 'csv'])
+
+def get_pack_path(dirname):
+    return dirname.rstrip(os.sep) + PACK_SUFFIX
+
+def get_member_mtime(zinfo):
+    return time.mktime(zinfo.date_time + (0, 0, -1))
+
+class PackReader:
+    '''
+    Open packs, reused across lookups. A pack that is rewritten gets a new
+    size or mtime and is reopened; zip handles are not shared across forks.
+    '''
+    def __init__(self, max_open = 32):
+        self.max_open = max_open
+        self.packs    = collections.OrderedDict()
+        self.lock     = threading.Lock()
+        self.pid      = os.getpid()
+
+    def get_pack(self, packpath):
+        try:
+            stat = os.stat(packpath)
+        except FileNotFoundError:
+            return None
+        key = (stat.st_size, stat.st_mtime)
+
+        with self.lock:
+            if self.pid != os.getpid():
+                self.packs = collections.OrderedDict()
+                self.pid   = os.getpid()
+
+            cached = self.packs.get(packpath)
+            if cached != None and cached[0] == key:
+                self.packs.move_to_end(packpath)
+                return cached[1]
+
+            zfile   = zipfile.ZipFile(packpath)
+            members = dict((zinfo.filename, zinfo) for zinfo in zfile.infolist())
+            self.packs[packpath] = (key, (zfile, members))
+            while len(self.packs) > self.max_open:
+                self.packs.popitem(last = False)[1][1][0].close()
+        return zfile, members
+
+    def get_members(self, packpath):
+        # member name -> ZipInfo, None if there is no pack
+        pack = self.get_pack(packpath)
+        if pack == None:
+            return None
+        return pack[1]
+
+    def get_member(self, packpath, name):
+        members = self.get_members(packpath)
+        if members == None:
+            return None
+        return members.get(name)
+
+    def open(self, packpath, name):
+        pack = self.get_pack(packpath)
+        if pack == None or name not in pack[1]:
+            return None
+        return pack[0].open(name)
+
+    def read(self, packpath, name):
+        f = self.open(packpath, name)
+        if f == None:
+            return None
+        with f:
+            return f.read()
+
+    def extract(self, packpath, name, filepath):
+        # copies a member out to filepath, keeping its time
+        f = self.open(packpath, name)
+        if f == None:
+            return False
+
+        os.makedirs(os.path.dirname(filepath), exist_ok = True)
+        tmppath = '%s.tmp.%d' % (filepath, os.getpid())
+        with f, open(tmppath, 'wb') as out:
+            shutil.copyfileobj(f, out, 1024 * 1024)
+        mtime = get_member_mtime(self.get_member(packpath, name))
+        os.utime(tmppath, (mtime, mtime))
+        os.replace(tmppath, filepath)
+        return True
+
+def pack_file(out, filepath, filename):
+    # writes filepath as the member filename, returns the (inode, mtime,
+    # size) of what was packed; the stat is of the open file, so a doc
+    # replaced meanwhile does not pass for the one packed
+    extension = filename.rsplit('.', 1)[-1].lower()
+    with open(filepath, 'rb') as f:
+        stat  = os.fstat(f.fileno())
+        zinfo = zipfile.ZipInfo(filename, time.localtime(stat.st_mtime)[:6])
+        zinfo.external_attr = (stat.st_mode & 0xFFFF) << 16
+        zinfo.file_size     = stat.st_size
+        if extension in TEXT_EXTENSIONS:
+            zinfo.compress_type = zipfile.ZIP_DEFLATED
+        else:
+            zinfo.compress_type = zipfile.ZIP_STORED
+        with out.open(zinfo, 'w') as dest:
+            shutil.copyfileobj(f, dest, 1024 * 1024)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+def pack_dir(dirname):
+    '''
+    Packs the files of dirname, with the members of an earlier pack of it,
+    into its pack and removes them. A file that was rewritten while it was
+    being packed is left in place, to be packed next time. Returns the
+    names of the files packed.
+    '''
+    packpath = get_pack_path(dirname)
+    if not os.path.isdir(dirname):
+        return []
+
+    filenames = sorted(f for f in os.listdir(dirname) if not f.startswith('.') \
+                       and os.path.isfile(os.path.join(dirname, f)))
+    if not filenames:
+        return []
+
+    tmppath = '%s.tmp.%d' % (packpath, os.getpid())
+    with zipfile.ZipFile(tmppath, 'w') as out:
+        if os.path.exists(packpath):
+            with zipfile.ZipFile(packpath) as old:
+                for zinfo in old.infolist():
+                    if zinfo.filename in filenames:
+                        continue
+                    with old.open(zinfo) as f:
+                        out.writestr(zinfo, f.read())
+
+        packed = {}
+        for filename in filenames:
+            packed[filename] = pack_file(out, os.path.join(dirname, filename), filename)
+
+    with zipfile.ZipFile(tmppath) as check:
+        bad = check.testzip()
+    if bad != None:
+        os.remove(tmppath)
+        raise zipfile.BadZipFile('%s: bad member %s in %s' % (dirname, bad, tmppath))
+
+    with open(tmppath, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(tmppath, packpath)
+
+    for filename in filenames:
+        filepath = os.path.join(dirname, filename)
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            continue
+        if (stat.st_ino, stat.st_mtime_ns, stat.st_size) == packed[filename]:
+            os.remove(filepath)
+    try:
+        os.rmdir(dirname)
+    except OSError:
+        # a doc was saved into it meanwhile, it is packed next time
+        pass
+    return filenames
@@ -1,10 +1,15 @@
 import multiprocessing
 import urllib.request, urllib.error, urllib.parse
+import queue
 import time
 import logging
 import re
+import datetime
+import threading
 
 from . import proxylist
+from . import telemetry
+from . import jobqueue
 
 # Python 3.14 changed the default start method on Linux from 'fork' to
 # 'forkserver', which pickles the target and its args. The source objects hold
@@ -12,21 +17,33 @@ from . import proxylist
 # preserve the inherit-by-fork behavior.
 mpctx = multiprocessing.get_context('fork')
 
-def sync(hostname, gazetteobjs, fromdate, todate, event):
+def install_host_opener(hostname):
     if hostname in proxylist.hostdict:
         proxy = urllib.request.ProxyHandler(proxylist.hostdict[hostname])
         opener = urllib.request.build_opener(proxy)
-        urllib.request.install_opener(opener)
+    else:
+        opener = urllib.request.build_opener()
+    urllib.request.install_opener(opener)
+
+def sync(hostname, gazetteobjs, fromdate, todate, event):
+    if hostname in proxylist.hostdict:
+        install_host_opener(hostname)
 
     for obj in gazetteobjs:
+        telemetry.get_collector().set_source(obj.name)
         if fromdate == None and todate == None:
             obj.sync_daily(event)
-        else:    
+        else:
             obj.sync(fromdate, todate, event)
+        telemetry.get_collector().flush()
+        obj.storage_manager.flush()
 
 def all_downloads(hostname, gazetteobjs, event):
     for obj in gazetteobjs:
+        telemetry.get_collector().set_source(obj.name)
         obj.all_downloads(event)
+        telemetry.get_collector().flush()
+        obj.storage_manager.flush()
 
 def agg_host_processes(gazetteobjs, all_dls, fromdate, todate, event):
     srcdict = {}
@@ -61,13 +78,7 @@ def noagg_host_processes(gazetteobjs, all_dls, fromdate, todate, event):
 
     return tlist
 
-def parallel_download(gazetteobjs, agghosts, fromdate, todate, max_wait, all_dls):
-    event = mpctx.Event()
-    if agghosts:
-        tlist = agg_host_processes(gazetteobjs, all_dls, fromdate, todate, event)
-    else:
-        tlist = noagg_host_processes(gazetteobjs, all_dls, fromdate, todate, event)
-
+def wait_for_crawlers(tlist, max_wait, event):
     start_ts = time.time()
     for t in tlist:
         if max_wait != None and max_wait <= 5:
@@ -80,7 +91,7 @@ def parallel_download(gazetteobjs, agghosts, fromdate, todate, max_wait, all_dls
             max_wait -= elapsed
             start_ts  = end_ts
 
-    if max_wait:       
+    if max_wait:
         logger = logging.getLogger('crawler.controller')
         logger.warning('Time expired. Setting the event and asking the crawlers to exit')
         event.set()
@@ -88,5 +99,318 @@ def parallel_download(gazetteobjs, agghosts, fromdate, todate, max_wait, all_dls
             if t.is_alive():
                 t.join()
 
-  
+def parallel_download(gazetteobjs, agghosts, fromdate, todate, max_wait, all_dls):
+    event = mpctx.Event()
+    if agghosts:
+        tlist = agg_host_processes(gazetteobjs, all_dls, fromdate, todate, event)
+    else:
+        tlist = noagg_host_processes(gazetteobjs, all_dls, fromdate, todate, event)
+
+    wait_for_crawlers(tlist, max_wait, event)
+
+# Work-stealing mode: instead of one process per host, every source is broken
+# into work units that a fixed pool of workers pulls from a shared queue.
+# A unit is (srcidx, dateobj) for sources that crawl one day at a time, or
+# (srcidx, fromdate, todate) for sources with their own sync(). Politeness
+# towards a host is kept by a limit on the units running per host rather
+# than by a process boundary.
+
+def get_work_units(gazetteobjs, all_dls, fromdate, todate):
+    units = []
+    for srcidx, obj in enumerate(gazetteobjs):
+        start, end = obj.get_sync_range(fromdate, todate, all_dls)
+        if obj.syncs_by_day():
+            for dateobj in obj.get_sync_dates(start, end):
+                units.append((srcidx, dateobj))
+        else:
+            units.append((srcidx, start, end))
+    return units
+
+def get_unit_date(unit):
+    if len(unit) == 2:
+        return unit[1]
+    return unit[2].date()
+
+def order_units_by_deadline(gazetteobjs, units, max_wait, num_workers, \
+                            host_limit, durations):
+    # Newest dates first across all sources: round r holds the r-th most
+    # recent unit of every source. Units are admitted while their expected
+    # duration, from the day durations of earlier runs, fits the budget,
+    # longest first within a round so that the tail is short. A host runs
+    # at most host_limit units at a time, so its units share a budget of
+    # min(num_workers, host_limit) * max_wait within the overall
+    # num_workers * max_wait. Whatever does not fit is queued after the
+    # plan in case the estimates were pessimistic.
+    bysrc = {}
+    for unit in units:
+        if unit[0] not in bysrc:
+            bysrc[unit[0]] = []
+        bysrc[unit[0]].append(unit)
+
+    for srcunits in bysrc.values():
+        srcunits.sort(key = get_unit_date, reverse = True)
+
+    known   = sorted(durations.values())
+    default = known[len(known) // 2] if known else 60
+
+    def get_cost(unit):
+        cost = durations.get(gazetteobjs[unit[0]].name, default)
+        if len(unit) == 3:
+            cost *= (unit[2] - unit[1]).days + 1
+        return cost
+
+    budget      = max_wait * num_workers
+    host_budget = max_wait * min(num_workers, host_limit)
+
+    planned   = []
+    deferred  = []
+    used      = 0
+    host_used = {}
+    num_rounds = max([len(srcunits) for srcunits in bysrc.values()] + [0])
+    for r in range(num_rounds):
+        batch = [srcunits[r] for srcunits in bysrc.values() if r < len(srcunits)]
+        batch.sort(key = get_cost, reverse = True)
+        for unit in batch:
+            cost     = get_cost(unit)
+            hostname = gazetteobjs[unit[0]].hostname
+            hostcost = host_used.get(hostname, 0) + cost
+            if used + cost <= budget and hostcost <= host_budget:
+                planned.append(unit)
+                used += cost
+                host_used[hostname] = hostcost
+            else:
+                deferred.append(unit)
+
+    return planned, deferred
+
+def run_work_unit(obj, unit, event):
+    install_host_opener(obj.hostname)
+    if len(unit) == 2:
+        return obj.sync_oneday(unit[1])
+
+    telemetry.get_collector().set_source(obj.name)
+    try:
+        return obj.sync(unit[1], unit[2], event)
+    finally:
+        telemetry.get_collector().flush()
+        obj.storage_manager.flush()
+
+class UnitScheduler:
+    '''
+    Hands out the work units to the workers in their planned order. A unit
+    whose host already has host_limit units running is skipped, not moved,
+    so that it is the first one run once its host is free; a worker with
+    nothing runnable sleeps until a unit finishes. Slots of a host that
+    no unit uses are lent to the downloads that a unit runs alongside its
+    own (GazetteBatch), so that -H holds for those too. The units are known
+    before the workers are forked, only the state of the units and the
+    hosts is shared.
+    '''
+    def __init__(self, gazetteobjs, units, host_limit):
+        self.units      = units
+        self.host_limit = host_limit
+
+        hostnames    = sorted(set([obj.hostname for obj in gazetteobjs]))
+        self.hostidx = dict([(hostname, i) for i, hostname in enumerate(hostnames)])
+        self.hosts   = [self.hostidx[gazetteobjs[unit[0]].hostname] for unit in units]
+
+        # guarded by cond: units handed out, units running per host and
+        # the first unit not handed out yet
+        self.taken   = mpctx.Array('b', len(units), lock = False)
+        self.running = mpctx.Array('i', len(hostnames), lock = False)
+        self.head    = mpctx.Value('i', 0, lock = False)
+        self.cond    = mpctx.Condition()
+
+    def claim(self, event):
+        # the index of the next runnable unit, None once every unit was
+        # handed out or the event is set
+        with self.cond:
+            while not event.is_set():
+                while self.head.value < len(self.units) and self.taken[self.head.value]:
+                    self.head.value += 1
+                if self.head.value >= len(self.units):
+                    return None
+
+                for idx in range(self.head.value, len(self.units)):
+                    host = self.hosts[idx]
+                    if not self.taken[idx] and self.running[host] < self.host_limit:
+                        self.taken[idx]     = 1
+                        self.running[host] += 1
+                        return idx
+
+                # every host with units left is busy, the timeout is only
+                # for noticing the event
+                self.cond.wait(5)
+        return None
+
+    def finish(self, idx):
+        with self.cond:
+            self.running[self.hosts[idx]] -= 1
+            self.cond.notify_all()
 
+    def try_acquire_host(self, hostname):
+        # a spare slot of the host for a download running alongside the
+        # unit of the caller (GazetteBatch), never waits
+        host = self.hostidx[hostname]
+        with self.cond:
+            if self.running[host] >= self.host_limit:
+                return False
+            self.running[host] += 1
+            return True
+
+    def release_host(self, hostname):
+        with self.cond:
+            self.running[self.hostidx[hostname]] -= 1
+            self.cond.notify_all()
+
+def crawl_worker(gazetteobjs, scheduler, event):
+    logger  = logging.getLogger('crawler.worker')
+
+    while True:
+        idx = scheduler.claim(event)
+        if idx == None:
+            break
+
+        unit = scheduler.units[idx]
+        obj  = gazetteobjs[unit[0]]
+        try:
+            run_work_unit(obj, unit, event)
+        except Exception as e:
+            logger.exception('Error in crawling %s unit %s: %s', obj.name, unit[1:], e)
+        finally:
+            scheduler.finish(idx)
+
+def scheduled_download(gazetteobjs, fromdate, todate, max_wait, all_dls, \
+                       num_workers, host_limit, durations = None):
+    logger = logging.getLogger('crawler.controller')
+    event  = mpctx.Event()
+
+    units  = get_work_units(gazetteobjs, all_dls, fromdate, todate)
+    logger.info('Scheduling %d work units over %d workers', len(units), num_workers)
+
+    if max_wait != None and durations != None:
+        planned, deferred = order_units_by_deadline(gazetteobjs, units, max_wait, \
+                                                    num_workers, host_limit, durations)
+        logger.info('%d units are expected to fit in %d secs, %d more queued after them', \
+                    len(planned), max_wait, len(deferred))
+        units = planned + deferred
+
+    scheduler = UnitScheduler(gazetteobjs, units, host_limit)
+    for obj in gazetteobjs:
+        obj.host_slots = scheduler
+
+    tlist = []
+    for i in range(min(num_workers, len(units))):
+        t = mpctx.Process(target = crawl_worker, args = \
+                            (gazetteobjs, scheduler, event))
+        t.start()
+        tlist.append(t)
+
+    wait_for_crawlers(tlist, max_wait, event)
+
+# Queue mode: jobs of (source, fromdate, todate) go into a durable queue
+# (utils/jobqueue.py) and workers on any number of machines claim and run
+# them. Only source names and dates cross the queue; every worker builds its
+# own source objects, SSL contexts and sessions.
+
+def get_queue_jobs(gazetteobjs, fromdate, todate, all_dls, days_per_job):
+    jobs = []
+    for obj in gazetteobjs:
+        start, end = obj.get_sync_range(fromdate, todate, all_dls)
+        # newest chunks first
+        while end >= start:
+            chunk_start = max(start, end - datetime.timedelta(days = days_per_job - 1))
+            jobs.append((obj.name, chunk_start.date(), end.date()))
+            end = chunk_start - datetime.timedelta(days = 1)
+
+    jobs.sort(key = lambda x: x[2], reverse = True)
+    return jobs
+
+def enqueue_jobs(jobq, gazetteobjs, fromdate, todate, all_dls, days_per_job):
+    jobs = get_queue_jobs(gazetteobjs, fromdate, todate, all_dls, days_per_job)
+    jobq.enqueue(jobs)
+    return jobs
+
+def heartbeat_job(jobq, job, worker, lease_secs, deadline, event, done):
+    logger = logging.getLogger('crawler.worker')
+    while not done.wait(lease_secs / 3.0):
+        if not jobq.heartbeat(job['id'], worker, lease_secs):
+            logger.warning('Lost the lease of job %s, stopping it', job['id'])
+            event.set()
+            break
+        if deadline != None and time.time() >= deadline:
+            event.set()
+            break
+
+def run_job(jobq, job, obj, worker, lease_secs, deadline):
+    logger   = logging.getLogger('crawler.worker')
+    fromdate = datetime.datetime.strptime(job['fromdate'], '%Y-%m-%d')
+    todate   = datetime.datetime.strptime(job['todate'], '%Y-%m-%d')
+    logger.info('Job %s: %s from %s to %s', job['id'], job['src'], \
+                job['fromdate'], job['todate'])
+
+    # sync() checks the event between days, it is set on a lost lease or
+    # when the deadline passes
+    event = threading.Event()
+    done  = threading.Event()
+    thread = threading.Thread(target = heartbeat_job, args = \
+                              (jobq, job, worker, lease_secs, deadline, event, done))
+    thread.start()
+
+    install_host_opener(obj.hostname)
+    telemetry.get_collector().set_source(obj.name)
+    try:
+        obj.sync(fromdate, todate, event)
+    except Exception as e:
+        logger.exception('Error in job %s: %s', job['id'], e)
+        jobq.fail(job['id'], worker, repr(e))
+    else:
+        if event.is_set():
+            # unfinished, the crawl journal lets the next claim skip the
+            # days that are already done
+            jobq.release(job['id'], worker)
+        else:
+            jobq.complete(job['id'], worker)
+    finally:
+        done.set()
+        thread.join()
+        telemetry.get_collector().flush()
+        obj.storage_manager.flush()
+
+def queue_worker(jobq, get_srcobj, deadline, lease_secs, poll_secs):
+    logger = logging.getLogger('crawler.worker')
+    worker = jobqueue.get_worker_id()
+
+    while deadline == None or time.time() < deadline:
+        job = jobq.claim(worker, lease_secs)
+        if job == None:
+            counts = jobq.counts()
+            if not counts.get('pending') and not counts.get('leased'):
+                break
+            # leased jobs come back if their workers die
+            time.sleep(poll_secs)
+            continue
+
+        obj = get_srcobj(job['src'])
+        if obj == None:
+            logger.warning('Unknown source %s in job %s', job['src'], job['id'])
+            jobq.fail(job['id'], worker, 'unknown source')
+            continue
+
+        run_job(jobq, job, obj, worker, lease_secs, deadline)
+
+def run_queue_workers(jobq, get_srcobj, num_workers, max_wait, \
+                      lease_secs = 600, poll_secs = 60):
+    deadline = None
+    if max_wait != None:
+        deadline = time.time() + max_wait
+
+    tlist = []
+    for i in range(num_workers):
+        t = mpctx.Process(target = queue_worker, args = \
+                            (jobq, get_srcobj, deadline, lease_secs, poll_secs))
+        t.start()
+        tlist.append(t)
+
+    for t in tlist:
+        t.join()
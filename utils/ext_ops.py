@@ -2,10 +2,61 @@ import re
 import magic
 from pathlib import Path
 
+# only this much of a doc is looked at to recognise the types we store
+SNIFF_BYTES = 1024
+
+# tags that libmagic takes as the start of an html document
+HTML_STARTS = (b'<!doctype html', b'<html', b'<head', b'<title', b'<script', \
+               b'<style', b'<table')
+
+UTF8_BOM = b'\xef\xbb\xbf'
+
+EXTENSIONS = {
+    'text/html':                'html',
+    'application/postscript':   'ps',
+    'application/pdf':          'pdf',
+    'text/plain':               'txt',
+    'image/png':                'png',
+    'application/msword':       'doc',
+    'text/rtf':                 'rtf',
+    'application/vnd.ms-excel': 'xls',
+}
+
+def sniff_type(buff):
+    # the mime type of a doc from the signature at its start, the same as
+    # libmagic would give; None when libmagic has to decide (plain text and
+    # OLE containers, i.e. doc vs xls, need more than a prefix)
+    if not isinstance(buff, bytes):
+        return None
+
+    prefix = buff[:SNIFF_BYTES]
+    if prefix.startswith(b'\x89PNG\r\n\x1a\n') and prefix[12:16] == b'IHDR':
+        return 'image/png'
+    if prefix.startswith(b'%!PS'):
+        return 'application/postscript'
+    if prefix.startswith(b'{\\rtf'):
+        return 'text/rtf'
+
+    if prefix.startswith(UTF8_BOM):
+        prefix = prefix[len(UTF8_BOM):]
+    prefix = prefix.lstrip()
+    if prefix.startswith(b'%PDF-'):
+        return 'application/pdf'
+    if prefix[:16].lower().startswith(HTML_STARTS):
+        return 'text/html'
+    return None
+
 def get_file_type(filepath):
+    with open(filepath, 'rb') as f:
+        mtype = sniff_type(f.read(SNIFF_BYTES))
+    if mtype != None:
+        return mtype
     return get_buffer_type(Path(filepath).read_bytes())
 
 def get_buffer_type(buff):
+    mtype = sniff_type(buff)
+    if mtype != None:
+        return mtype
 
     mtype = magic.from_buffer(buff, mime=True)
 
@@ -18,23 +69,7 @@ def get_buffer_type(buff):
 
 
 def get_extension(mtype):
-    if re.match('text/html', mtype):
-        return 'html'
-    elif re.match('application/postscript', mtype):
-        return 'ps'
-    elif re.match('application/pdf', mtype):
-        return 'pdf'
-    elif re.match('text/plain', mtype):
-        return 'txt'
-    elif re.match('image/png', mtype):
-        return 'png'
-    elif re.match('application/msword', mtype):
-        return 'doc'
-    elif re.match('text/rtf', mtype):
-        return 'rtf'
-    elif re.match('application/vnd.ms-excel', mtype):
-        return 'xls'
-    return 'unkwn'
+    return EXTENSIONS.get(mtype, 'unkwn')
 
 def get_file_extension(doc):
     mtype = get_buffer_type(doc)
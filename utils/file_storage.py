@@ -1,26 +1,197 @@
 import os
 import logging
-import glob
 import time
+import tempfile
+import threading
+import collections
+import hashlib
 
 from . import utils
 from . import xml_ops
+from .catalog import Catalog, get_file_sha256
+from .blobstore import BlobStore
+from .metastore import MetaStore
+from .writejournal import WriteJournal, TMP_SUFFIX
+from . import daypack
 
 def mk_dir(dirname):
     if not os.path.exists(dirname):
-        os.mkdir(dirname)
+        try:
+            os.mkdir(dirname)
+        except FileExistsError:
+            # created by a concurrent save of the same day
+            pass
 
+class RawIndex:
+    '''
+    Filenames in raw/ per directory, so that checking whether a relurl was
+    downloaded does not glob the directory of its day for every gazette.
+    A directory is listed on first use and updated as docs are saved; only
+    the most recently used max_dirs directories are kept. Indices are per
+    process, each crawler writes to the directories of its own sources.
+    Members of the pack of a directory (utils/daypack.py) are indexed
+    separately from its loose files.
+    '''
+    def __init__(self, packs, backend, max_dirs = 1024):
+        self.packs    = packs
+        self.backend  = backend
+        self.max_dirs = max_dirs
+        self.dirs     = collections.OrderedDict()
+        self.lock     = threading.Lock()
+
+    def add_filenames(self, entries, filenames):
+        for filename in filenames:
+            if filename.startswith('.'):
+                continue
+            words = filename.rsplit('.', 1)
+            if len(words) == 2:
+                entries.setdefault(words[0], []).append(filename)
+
+    def list_dir(self, dirname):
+        # (loose, packed), each relurl -> filenames; skips the hidden temp
+        # files of streamed docs
+        loose  = {}
+        packed = {}
+        self.add_filenames(loose, self.backend.list_dir(dirname))
+
+        members = self.packs.get_members(daypack.get_pack_path(dirname))
+        if members:
+            self.add_filenames(packed, sorted(members.keys()))
+        return loose, packed
+
+    def get_entries(self, dirname):
+        with self.lock:
+            if dirname in self.dirs:
+                self.dirs.move_to_end(dirname)
+                return self.dirs[dirname]
+
+        entries = self.list_dir(dirname)
+        with self.lock:
+            entries = self.dirs.setdefault(dirname, entries)
+            while len(self.dirs) > self.max_dirs:
+                self.dirs.popitem(last = False)
+        return entries
+
+    def lookup(self, rawpath):
+        dirname, name = os.path.split(rawpath)
+        filenames = self.get_entries(dirname)[0].get(name)
+        if filenames:
+            return os.path.join(dirname, filenames[0])
+        return None
+
+    def lookup_packed(self, rawpath):
+        # (pack path, member name) of a doc that is only in the pack
+        dirname, name = os.path.split(rawpath)
+        filenames = self.get_entries(dirname)[1].get(name)
+        if filenames:
+            return daypack.get_pack_path(dirname), filenames[0]
+        return None
+
+    def add(self, filepath):
+        dirname, filename = os.path.split(filepath)
+        name     = filename.rsplit('.', 1)[0]
+        entries  = self.get_entries(dirname)[0]
+        with self.lock:
+            filenames = entries.setdefault(name, [])
+            if filename not in filenames:
+                filenames.append(filename)
+
+class LocalBackend:
+    '''
+    Where FileManager keeps its docs: files under basedir. A doc is written
+    to a hidden temp file next to it and renamed into place, and the fsyncs
+    are batched until flush(), see utils/writejournal.py. Other backends
+    (utils/s3_storage.py) take the same local paths and map them to their
+    own keys.
+    '''
+    def __init__(self, basedir):
+        self.basedir = basedir
+        self.journal = WriteJournal(os.path.join(basedir, 'stats', 'journal'))
+
+    def list_dir(self, dirname):
+        # names in dirname, [] if there is no such directory
+        try:
+            return os.listdir(dirname)
+        except FileNotFoundError:
+            return []
+
+    def walk(self, dirname):
+        # paths of the files under dirname, in sorted order
+        if os.path.isfile(dirname):
+            yield dirname
+            return
+        for filename in sorted(self.list_dir(dirname)):
+            path = os.path.join(dirname, filename)
+            if os.path.isdir(path):
+                for filepath in self.walk(path):
+                    yield filepath
+            elif os.path.isfile(path):
+                yield path
+
+    def exists(self, filepath):
+        return os.path.exists(filepath)
+
+    def get_mtime(self, filepath):
+        try:
+            return os.path.getmtime(filepath)
+        except FileNotFoundError:
+            return None
+
+    def get_local_path(self, filepath):
+        return filepath
+
+    def open(self, filepath):
+        return open(filepath, 'rb')
+
+    def new_tmpfile(self, filepath):
+        # a hidden temp file next to filepath, to be renamed into place with
+        # put_file; leftovers are quarantined by recover()
+        self.journal.begin(filepath)
+        dirname, filename = os.path.split(filepath)
+        return tempfile.NamedTemporaryFile(dir = dirname, prefix = '.%s.' % filename, \
+                                           suffix = TMP_SUFFIX, delete = False)
+
+    def put_file(self, tmppath, filepath, mtype = None):
+        # stores the temp file as filepath, returns the mtime of the doc
+        os.replace(tmppath, filepath)
+        self.journal.written(filepath)
+        return os.path.getmtime(filepath)
+
+    def flush(self):
+        self.journal.flush()
+
+    def recover(self, quarantinedir):
+        return self.journal.recover(self.basedir, quarantinedir)
 
 class FileManager:
-    def __init__(self, basedir, updateMeta, updateRaw):
+    def __init__(self, basedir, updateMeta, updateRaw, dedup = False, backend = None):
         self.logger = logging.getLogger('judis.filemanager')
 
+        self.basedir = basedir
         self.rawdir = os.path.join(basedir, 'raw')
         self.metadir = os.path.join(basedir, 'metatags')
 
         self.updateRaw  = updateRaw
         self.updateMeta = updateMeta
 
+        # where the docs are kept, LocalBackend unless given
+        if backend == None:
+            backend = LocalBackend(basedir)
+        self.backend   = backend
+
+        self.packs     = daypack.PackReader()
+        self.raw_index = RawIndex(self.packs, backend)
+        self.catalog   = Catalog(os.path.join(basedir, 'stats', 'catalog.db'))
+
+        self.metastore = MetaStore(os.path.join(basedir, 'metastore'))
+
+        # raw docs with the same content share a blob, see utils/blobstore.py
+        self.blobstore = None
+        if dedup:
+            if not isinstance(backend, LocalBackend):
+                raise ValueError('The blob store needs docs on the local disk')
+            self.blobstore = BlobStore(os.path.join(basedir, 'blobs'))
+
         mk_dir(self.rawdir)
         mk_dir(self.metadir)
 
@@ -30,48 +201,165 @@ class FileManager:
             dirname = os.path.join(dirname, word)
             mk_dir(dirname)
 
+    def get_packed_meta(self, relurl):
+        # (pack path, ZipInfo) of metatags that are only in a day pack
+        dirname, name = os.path.split(os.path.join(self.metadir, relurl))
+        packpath = daypack.get_pack_path(dirname)
+        zinfo = self.packs.get_member(packpath, '%s.xml' % name)
+        if zinfo == None:
+            return None
+        return packpath, zinfo
+
     def get_metainfo(self, relurl):
         metapath = os.path.join(self.metadir, '%s.xml' % relurl)
-        if os.path.exists(metapath):
-            return xml_ops.read_tag_file(metapath, relurl)
+        mtime    = self.backend.get_mtime(metapath)
+        if mtime == None:
+            packed = self.get_packed_meta(relurl)
+            if packed == None:
+                return None
+            mtime = daypack.get_member_mtime(packed[1])
+            metapath = None
+
+        tags = self.metastore.get(relurl, mtime)
+        if tags != None:
+            return xml_ops.feature_to_metainfo(tags)
+        if metapath == None:
+            xmlstring = self.packs.read(packed[0], packed[1].filename)
+            return xml_ops.xml_to_tagdict(relurl, xmlstring)
+        return xml_ops.read_tag_file(self.backend.get_local_path(metapath), relurl)
+
+    def has_metainfo(self, relurl):
+        metapath = os.path.join(self.metadir, '%s.xml' % relurl)
+        return self.backend.exists(metapath) or self.get_packed_meta(relurl) != None
+
+    def unpack(self, subdir, packpath, member, relurl):
+        # a loose copy of a packed doc under <basedir>/temp/unpacked for
+        # callers that need a path, it can be deleted at any time
+        dirname  = os.path.dirname(relurl)
+        filepath = os.path.join(self.basedir, 'temp', 'unpacked', subdir, \
+                                dirname, member)
+        zinfo = self.packs.get_member(packpath, member)
+        if not os.path.exists(filepath) or \
+                os.path.getmtime(filepath) != daypack.get_member_mtime(zinfo):
+            self.packs.extract(packpath, member, filepath)
+        return filepath
+
+    def has_rawfile(self, relurl):
+        rawpath = os.path.join(self.rawdir, relurl)
+        return self.raw_index.lookup(rawpath) != None or \
+               self.raw_index.lookup_packed(rawpath) != None
 
-        return None   
-         
     def get_rawfile_path(self, relurl):
         rawpath  = os.path.join(self.rawdir, relurl)
-        rawpaths = glob.glob('%s.*' % rawpath)
-        if rawpaths:
-            return rawpaths[0]
+        filepath = self.raw_index.lookup(rawpath)
+        if filepath != None:
+            return self.backend.get_local_path(filepath)
 
-        return None    
+        packed = self.raw_index.lookup_packed(rawpath)
+        if packed != None:
+            return self.unpack('raw', packed[0], packed[1], relurl)
+        return None
+
+    def get_raw_mtime(self, relurl):
+        rawpath  = os.path.join(self.rawdir, relurl)
+        filepath = self.raw_index.lookup(rawpath)
+        if filepath != None:
+            return self.backend.get_mtime(filepath)
+
+        packed = self.raw_index.lookup_packed(rawpath)
+        if packed != None:
+            return daypack.get_member_mtime(self.packs.get_member(*packed))
+        return None
+
+    def open_rawdoc(self, relurl):
+        # (file object, extension) of the raw doc, loose or packed
+        rawpath  = os.path.join(self.rawdir, relurl)
+        filepath = self.raw_index.lookup(rawpath)
+        if filepath != None:
+            return self.backend.open(filepath), filepath.rsplit('.', 1)[-1]
+
+        packed = self.raw_index.lookup_packed(rawpath)
+        if packed != None:
+            return self.packs.open(*packed), packed[1].rsplit('.', 1)[-1]
+        return None, None
 
     def get_metafile_path(self, relurl):
         metapath = os.path.join(self.metadir, '%s.xml' % relurl)
-        if os.path.exists(metapath):
-            return metapath
+        if self.backend.exists(metapath):
+            return self.backend.get_local_path(metapath)
+
+        packed = self.get_packed_meta(relurl)
+        if packed != None:
+            return self.unpack('metatags', packed[0], packed[1].filename, relurl)
         return None    
 
+    def get_meta_mtime(self, relurl):
+        metapath = os.path.join(self.metadir, '%s.xml' % relurl)
+        mtime    = self.backend.get_mtime(metapath)
+        if mtime != None:
+            return mtime
+
+        packed = self.get_packed_meta(relurl)
+        if packed != None:
+            return daypack.get_member_mtime(packed[1])
+        return None
+
     def save_metainfo(self, court, relurl, metainfo):
         self.create_dirs(self.metadir, relurl)
 
         metapath = os.path.join(self.metadir, '%s.xml' % relurl)
 
-        if metainfo and (self.updateMeta or not os.path.exists(metapath)):
-            xml_ops.print_tag_file(metapath, metainfo)
+        if metainfo and (self.updateMeta or not self.has_metainfo(relurl)):
+            tmpfile = self.new_tmpfile(metapath)
+            tmpfile.close()
+            xml_ops.print_tag_file(tmpfile.name, metainfo)
+            mtime = self.replace_file(tmpfile.name, metapath, 'application/xml')
+            self.catalog.set_meta_mtime(relurl, mtime)
+            self.metastore.append(relurl, mtime, xml_ops.obj_to_feature(metainfo))
             return True
         return False 
 
     def download_stats(self, start_time, end_time):
         return None, None
         
-    def save_binary_file(self, filepath, buf):
-        h = open(filepath, 'wb')
-        h.write(buf)
-        h.close()
+    def save_binary_file(self, filepath, buf, mtype = None):
+        tmpfile = self.new_tmpfile(filepath)
+        tmpfile.write(buf)
+        tmpfile.close()
+        return self.replace_file(tmpfile.name, filepath, mtype)
+
+    def new_tmpfile(self, filepath):
+        # a temp file to be stored as filepath with replace_file
+        return self.backend.new_tmpfile(filepath)
+
+    def replace_file(self, tmppath, filepath, mtype = None):
+        # returns the mtime of the stored doc
+        return self.backend.put_file(tmppath, filepath, mtype)
+
+    def flush(self):
+        # makes the docs saved so far durable, called once a day is done
+        self.backend.flush()
+
+    def recover(self):
+        # quarantines what crashed crawlers left half written, before the
+        # crawl starts
+        quarantinedir = os.path.join(self.basedir, 'quarantine')
+        quarantined   = self.backend.recover(quarantinedir)
+        for filepath in quarantined:
+            filename = os.path.basename(filepath)
+            if filename.startswith('.'):
+                continue
+            relurl = os.path.relpath(filepath, self.basedir)
+            subdir, relurl = relurl.split(os.sep, 1)
+            relurl = relurl.rsplit('.', 1)[0]
+            if subdir == 'raw':
+                self.catalog.clear_raw(relurl)
+            elif subdir == 'metatags':
+                self.catalog.clear_meta(relurl)
+        return quarantined
 
     def should_download_raw(self, relurl, judge_url, validurl = True):
-        rawpath  = os.path.join(self.rawdir, relurl)
-        return self.updateRaw or not glob.glob('%s.*' % rawpath)
+        return self.updateRaw or not self.has_rawfile(relurl)
 
     def get_file_extension(self, doc):
         mtype = utils.get_buffer_type(doc)
@@ -81,28 +369,79 @@ class FileManager:
         self.create_dirs(self.rawdir, relurl)
         rawpath  = os.path.join(self.rawdir, relurl)
 
-        if doc and (self.updateRaw or not glob.glob('%s.*' % rawpath)):
-            extension = self.get_file_extension(doc)
-            self.save_binary_file('%s.%s' % (rawpath, extension), doc)
+        if doc and (self.updateRaw or not self.has_rawfile(relurl)):
+            mtype     = utils.get_buffer_type(doc)
+            extension = utils.get_file_extension(mtype)
+            filepath  = '%s.%s' % (rawpath, extension)
+            sha256    = hashlib.sha256(doc).hexdigest()
+            if self.blobstore:
+                tmpfile = self.new_raw_tmpfile(relurl)
+                tmpfile.write(doc)
+                tmpfile.close()
+                self.blobstore.put(tmpfile.name, filepath, sha256)
+                self.backend.journal.written(filepath)
+                self.catalog.update_raw(relurl, filepath, sha256)
+            else:
+                # renamed over the old doc, so a doc that shares its blob
+                # with other relurls is left alone
+                mtime = self.save_binary_file(filepath, doc, mtype)
+                self.catalog.set_raw(relurl, extension, len(doc), mtime, sha256)
+            self.raw_index.add(filepath)
             return True
         return False
         
 
+    def new_raw_tmpfile(self, relurl):
+        # in the directory of the doc, so that it can be renamed into place
+        self.create_dirs(self.rawdir, relurl)
+        return self.new_tmpfile(os.path.join(self.rawdir, relurl))
+
+    def save_rawfile(self, court, relurl, tmppath, head):
+        # moves a streamed download into raw/, head is the start of the doc
+        rawpath  = os.path.join(self.rawdir, relurl)
+
+        if head and (self.updateRaw or not self.has_rawfile(relurl)):
+            mtype     = utils.get_buffer_type(head)
+            extension = utils.get_file_extension(mtype)
+            filepath  = '%s.%s' % (rawpath, extension)
+            sha256    = get_file_sha256(tmppath)
+            if self.blobstore:
+                self.blobstore.put(tmppath, filepath, sha256)
+                self.backend.journal.written(filepath)
+                self.catalog.update_raw(relurl, filepath, sha256)
+            else:
+                size  = os.path.getsize(tmppath)
+                mtime = self.replace_file(tmppath, filepath, mtype)
+                self.catalog.set_raw(relurl, extension, size, mtime, sha256)
+            self.raw_index.add(filepath)
+            return True
+        return False
+
+    def save_output(self, relurl, subdir, filepath):
+        # a conversion of the doc written under <basedir>/<subdir>
+        self.catalog.update_output(relurl, subdir, filepath)
+
     def recursive_relurls(self, datadir, relurl):
-        current_dir = os.path.join(datadir, relurl)
-        if os.path.isfile(current_dir):
-            tmprel = relurl.rsplit('.', 1)[0]
-            yield tmprel
-
-        if os.path.isdir(current_dir):
-            filenames = os.listdir(current_dir)
-            filenames.sort()
-            for filename in filenames:
-                tmprel = os.path.join(relurl, filename)
-                for rel1 in self.recursive_relurls(datadir, tmprel):
-                    yield rel1
-                
-                    
+        for filepath in self.backend.walk(os.path.join(datadir, relurl)):
+            filename = os.path.basename(filepath)
+            if filename.startswith('.') or '.tmp.' in filename:
+                # temp files of docs being saved, and of packs or unpacked
+                # docs being written
+                continue
+
+            tmprel = os.path.relpath(filepath, datadir)
+            if filepath.endswith(daypack.PACK_SUFFIX):
+                # the relurls of a packed day that have no loose file
+                dirname = filepath[:-len(daypack.PACK_SUFFIX)]
+                dayrel  = tmprel[:-len(daypack.PACK_SUFFIX)]
+                members = self.packs.get_members(filepath) or {}
+                names   = sorted(set(m.rsplit('.', 1)[0] for m in members))
+                for name in names:
+                    if not self.raw_index.lookup(os.path.join(dirname, name)):
+                        yield os.path.join(dayrel, name)
+            else:
+                yield tmprel.rsplit('.', 1)[0]
+
     def find_matching_relurls(self, srcs, start_ts, end_ts):         
         srcs = set(srcs)
 
@@ -112,27 +451,29 @@ class FileManager:
         if end_ts:
             end_ts = time.mktime(end_ts.timetuple())
 
-        srclist = os.listdir(self.rawdir)
+        if self.catalog.is_built():
+            for relurl in self.catalog.find_relurls(srcs, start_ts, end_ts):
+                yield relurl
+            return
+
+        srclist = self.backend.list_dir(self.rawdir)
         srclist.sort()
         for src in srclist:
             if srcs and src not in srcs:
                 continue
       
             for relurl in self.recursive_relurls(self.rawdir, src):
-                rawpath   = self.get_rawfile_path(relurl)
-                metapath  = self.get_metafile_path(relurl)
-
-                if not os.path.isfile(rawpath):
-                    continue
+                raw_mtime  = self.get_raw_mtime(relurl)
+                meta_mtime = self.get_meta_mtime(relurl)
 
-                if not metapath or not os.path.isfile(metapath):
+                if raw_mtime == None or meta_mtime == None:
                     continue
 
-                if start_ts != None and os.path.getmtime(rawpath) < start_ts \
-                        and  os.path.getmtime(metapath) < start_ts:
+                if start_ts != None and raw_mtime < start_ts \
+                        and  meta_mtime < start_ts:
                     continue 
 
-                if end_ts != None and os.path.getmtime(rawpath) > end_ts \
-                        and  os.path.getmtime(metapath) > end_ts:
+                if end_ts != None and raw_mtime > end_ts \
+                        and  meta_mtime > end_ts:
                     continue 
                 yield relurl    
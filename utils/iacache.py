@@ -0,0 +1,142 @@
+"""What iasync knows about Internet Archive items, in <datadir>/stats/iaitems.db.
+
+For every identifier the cache keeps whether the item exists, the names of
+its files, the metadata iasync last sent for it with its hash and when IA was
+last asked. iasync consults it before calling get_item: a relurl whose raw
+doc and metatags are already in the cached file list is skipped without a
+request. The entry of an item is updated with the files iasync uploads and
+dropped when an upload fails, so that the next run asks IA again.
+`iasync.py --verify` refreshes the entries not checked for a while in bulk.
+With the metadata last sent, `iasync.py -m` sends only the fields that
+changed and skips items whose metadata hash is unchanged.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS items (
+    identifier TEXT PRIMARY KEY,
+    item_exists INTEGER NOT NULL,
+    files      TEXT NOT NULL,
+    meta_hash  TEXT,
+    checked    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_checked ON items (checked);
+CREATE TABLE IF NOT EXISTS metadata (
+    identifier TEXT PRIMARY KEY,
+    metadata   TEXT NOT NULL
+);
+'''
+
+def to_json(metadata):
+    return json.dumps(metadata, sort_keys = True, ensure_ascii = False, default = str)
+
+def get_metadata_hash(metadata):
+    return hashlib.sha256(to_json(metadata).encode('utf-8')).hexdigest()
+
+def get_metadata_changes(old, new):
+    # the fields of new that differ from old, values compared as stored;
+    # fields missing from new are left alone, uploads add fields (ocr) that
+    # the metadata of an update does not have
+    new     = json.loads(to_json(new))
+    changes = {}
+    for k, v in new.items():
+        if old.get(k) != v:
+            changes[k] = v
+    return changes
+
+class IAItemCache:
+    def __init__(self, dbpath):
+        self.dbpath = dbpath
+        # a connection per thread, uploads may run in an UploadPipeline
+        self.local  = threading.local()
+
+    def get_conn(self):
+        if getattr(self.local, 'pid', None) != os.getpid():
+            os.makedirs(os.path.dirname(self.dbpath), exist_ok = True)
+            self.local.conn = sqlite3.connect(self.dbpath, timeout = 60)
+            self.local.conn.execute('PRAGMA journal_mode=WAL')
+            self.local.conn.executescript(SCHEMA)
+            self.local.pid  = os.getpid()
+        return self.local.conn
+
+    def get(self, identifier):
+        # (exists, set of file names, metadata hash) or None if not known
+        cursor = self.get_conn().execute('SELECT item_exists, files, meta_hash ' \
+                                         'FROM items WHERE identifier = ?', (identifier,))
+        row = cursor.fetchone()
+        if row == None:
+            return None
+        return bool(row[0]), set(json.loads(row[1])), row[2]
+
+    def put(self, identifier, exists, files):
+        # the state of the item as just read from IA
+        conn = self.get_conn()
+        with conn:
+            conn.execute('INSERT INTO items (identifier, item_exists, files, checked) ' \
+                         'VALUES (?, ?, ?, ?) ON CONFLICT (identifier) DO UPDATE ' \
+                         'SET item_exists = excluded.item_exists, files = excluded.files, ' \
+                         'checked = excluded.checked', \
+                         (identifier, int(exists), json.dumps(sorted(files)), time.time()))
+
+    def add_files(self, identifier, filenames, metadata = None):
+        # after a successful upload of filenames into the item, with the
+        # metadata it was created with. Only complete metadata goes here,
+        # the fields of an upload into an existing item go to update_metadata
+        state = self.get(identifier)
+        files = set(filenames)
+        meta_hash = None
+        if state != None:
+            files.update(state[1])
+            meta_hash = state[2]
+
+        conn = self.get_conn()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO items (identifier, item_exists, files, ' \
+                         'meta_hash, checked) VALUES (?, 1, ?, ?, ?)', \
+                         (identifier, json.dumps(sorted(files)), meta_hash, time.time()))
+        if metadata != None:
+            self.set_metadata(identifier, metadata)
+
+    def set_metadata(self, identifier, metadata):
+        # after the item got metadata, in full
+        conn = self.get_conn()
+        with conn:
+            conn.execute('UPDATE items SET meta_hash = ? WHERE identifier = ?', \
+                         (get_metadata_hash(metadata), identifier))
+            conn.execute('INSERT OR REPLACE INTO metadata (identifier, metadata) ' \
+                         'VALUES (?, ?)', (identifier, to_json(metadata)))
+
+    def update_metadata(self, identifier, fields):
+        # after fields were added to the metadata of the item; merged into
+        # the metadata last sent, nothing is known of the rest otherwise
+        old = self.get_metadata(identifier)
+        if old == None:
+            return
+        old.update(json.loads(to_json(fields)))
+        self.set_metadata(identifier, old)
+
+    def get_metadata(self, identifier):
+        # the metadata last sent for the item, None if not known
+        cursor = self.get_conn().execute('SELECT metadata FROM metadata ' \
+                                         'WHERE identifier = ?', (identifier,))
+        row = cursor.fetchone()
+        if row == None:
+            return None
+        return json.loads(row[0])
+
+    def invalidate(self, identifier):
+        conn = self.get_conn()
+        with conn:
+            conn.execute('DELETE FROM items WHERE identifier = ?', (identifier,))
+
+    def get_stale(self, before):
+        # identifiers last checked before the time before
+        cursor = self.get_conn().execute('SELECT identifier FROM items WHERE checked < ? ' \
+                                         'ORDER BY checked', (before,))
+        return [row[0] for row in cursor.fetchall()]
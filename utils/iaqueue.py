@@ -0,0 +1,101 @@
+"""Uploads with OCR that are in progress, in <datadir>/stats/iaqueue.db.
+
+With -g/-I, iasync uploads an item in three stages: ocr (the pdf rasterized
+and sent to Google Vision page by page), package (the page images zipped)
+and upload. An entry is added once the lookup of a relurl says what to
+upload and moves from stage to stage with the files made so far; it is
+removed once the upload is done, or dropped after failing too often (the
+attempts column counts the failures across runs). A run that was killed
+resumes the entries it left at their stage. The number of pages a pdf was rasterized into is
+kept too, so that the ocr stage of a resumed entry does not rasterize it
+again, and the pages already OCRed are read from their _gocr json files.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+STAGES = ['ocr', 'package', 'upload']
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tasks (
+    identifier TEXT PRIMARY KEY,
+    relurl     TEXT NOT NULL,
+    stage      TEXT NOT NULL,
+    task       TEXT NOT NULL,
+    attempts   INTEGER NOT NULL DEFAULT 0,
+    error      TEXT,
+    updated    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_relurl ON tasks (relurl);
+'''
+
+class QueueEntry:
+    def __init__(self, identifier, relurl, stage, task, attempts = 0, error = None):
+        self.identifier = identifier
+        self.relurl     = relurl
+        self.stage      = stage
+        # kind, metadata, to_upload, files and pages (pdf -> number of
+        # pages it was rasterized into) of the upload
+        self.task       = task
+        self.attempts   = attempts
+        self.error      = error
+
+    def get_task(self):
+        # the task as GazetteIA.lookup returns it
+        return ('upload', self.identifier, self.task['metadata'], \
+                list(self.task['to_upload']), set(self.task['files']))
+
+class UploadQueue:
+    def __init__(self, dbpath):
+        self.dbpath = dbpath
+        # a connection per thread, every stage has its own threads
+        self.local  = threading.local()
+
+    def get_conn(self):
+        if getattr(self.local, 'pid', None) != os.getpid():
+            os.makedirs(os.path.dirname(self.dbpath), exist_ok = True)
+            self.local.conn = sqlite3.connect(self.dbpath, timeout = 60)
+            self.local.conn.execute('PRAGMA journal_mode=WAL')
+            self.local.conn.executescript(SCHEMA)
+            self.local.pid  = os.getpid()
+        return self.local.conn
+
+    def add(self, relurl, task, stage):
+        kind, identifier, metadata, to_upload, files = task
+        entry = QueueEntry(identifier, relurl, stage, {'metadata': metadata, \
+                           'to_upload': list(to_upload), 'files': sorted(files), \
+                           'pages': {}})
+        self.save(entry)
+        return entry
+
+    def save(self, entry):
+        # the entry after a stage or an attempt
+        conn = self.get_conn()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO tasks (identifier, relurl, stage, task, ' \
+                         'attempts, error, updated) VALUES (?, ?, ?, ?, ?, ?, ?)', \
+                         (entry.identifier, entry.relurl, entry.stage, \
+                          json.dumps(entry.task, default = str), entry.attempts, \
+                          entry.error, time.time()))
+
+    def remove(self, identifier):
+        conn = self.get_conn()
+        with conn:
+            conn.execute('DELETE FROM tasks WHERE identifier = ?', (identifier,))
+
+    def has_relurl(self, relurl):
+        cursor = self.get_conn().execute('SELECT 1 FROM tasks WHERE relurl = ?', (relurl,))
+        return cursor.fetchone() != None
+
+    def get_entries(self):
+        # the entries left by earlier runs, oldest first
+        cursor = self.get_conn().execute('SELECT identifier, relurl, stage, task, ' \
+                                         'attempts, error FROM tasks ORDER BY updated')
+        entries = []
+        for identifier, relurl, stage, task, attempts, error in cursor.fetchall():
+            entries.append(QueueEntry(identifier, relurl, stage, json.loads(task), \
+                                      attempts, error))
+        return entries
@@ -0,0 +1,265 @@
+"""Durable queue of crawl jobs shared by workers on several machines.
+
+`sync.py -Q queue` only enqueues (source, fromdate, todate) jobs and
+`sync.py -Q queue --worker` on any node claims and runs them. A claimed job
+is leased to its worker for lease_secs and the worker renews the lease with
+heartbeats while the job runs; a job whose lease expired (the worker crashed
+or lost the network) is handed out again, unless it already had max_attempts
+attempts, in which case it is marked failed.
+
+The queue is either a SQLite file, which needs a filesystem with working
+locks shared by all the nodes, or a Redis compatible store given as a
+redis:// url. The redis package is only needed for the latter.
+"""
+
+import os
+import time
+import socket
+import sqlite3
+import threading
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    src         TEXT NOT NULL,
+    fromdate    TEXT NOT NULL,
+    todate      TEXT NOT NULL,
+    state       TEXT NOT NULL DEFAULT 'pending',
+    worker      TEXT,
+    lease_until REAL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    error       TEXT,
+    updated     REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, lease_until);
+'''
+
+def get_worker_id():
+    return '%s:%d' % (socket.gethostname(), os.getpid())
+
+class SqliteJobQueue:
+    def __init__(self, dbpath, max_attempts = 3):
+        self.dbpath       = dbpath
+        self.max_attempts = max_attempts
+
+        # a connection per process and thread, heartbeats run in a thread
+        self.local = threading.local()
+
+    def get_conn(self):
+        if getattr(self.local, 'pid', None) != os.getpid():
+            # autocommit, transactions are started explicitly
+            self.local.conn = sqlite3.connect(self.dbpath, timeout = 60, \
+                                              isolation_level = None)
+            self.local.conn.executescript(SCHEMA)
+            self.local.pid  = os.getpid()
+        return self.local.conn
+
+    def enqueue(self, jobs):
+        conn = self.get_conn()
+        now  = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        for src, fromdate, todate in jobs:
+            conn.execute('INSERT INTO jobs (src, fromdate, todate, updated) ' \
+                         'VALUES (?, ?, ?, ?)', (src, str(fromdate), str(todate), now))
+        conn.execute('COMMIT')
+
+    def claim(self, worker, lease_secs):
+        conn = self.get_conn()
+        now  = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # a job that keeps killing its workers is not handed out forever
+            conn.execute('UPDATE jobs SET state = \'failed\', updated = ?, ' \
+                         'error = \'lease expired\' WHERE state = \'leased\' ' \
+                         'AND lease_until < ? AND attempts >= ?', \
+                         (now, now, self.max_attempts))
+            row = conn.execute('SELECT id, src, fromdate, todate FROM jobs ' \
+                               'WHERE state = \'pending\' OR ' \
+                               '(state = \'leased\' AND lease_until < ?) ' \
+                               'ORDER BY id LIMIT 1', (now,)).fetchone()
+            if row != None:
+                conn.execute('UPDATE jobs SET state = \'leased\', worker = ?, ' \
+                             'lease_until = ?, attempts = attempts + 1, updated = ? ' \
+                             'WHERE id = ?', (worker, now + lease_secs, now, row[0]))
+            conn.execute('COMMIT')
+        except:
+            conn.execute('ROLLBACK')
+            raise
+
+        if row == None:
+            return None
+        return {'id': row[0], 'src': row[1], 'fromdate': row[2], 'todate': row[3]}
+
+    def heartbeat(self, jobid, worker, lease_secs):
+        # returns False if the job was lost to another worker
+        now = time.time()
+        cursor = self.get_conn().execute('UPDATE jobs SET lease_until = ?, updated = ? ' \
+                                          'WHERE id = ? AND worker = ? AND state = \'leased\'', \
+                                          (now + lease_secs, now, jobid, worker))
+        return cursor.rowcount == 1
+
+    def complete(self, jobid, worker):
+        self.get_conn().execute('UPDATE jobs SET state = \'done\', updated = ? ' \
+                                'WHERE id = ? AND worker = ?', (time.time(), jobid, worker))
+
+    def release(self, jobid, worker):
+        # back to the queue without counting as an attempt
+        self.get_conn().execute('UPDATE jobs SET state = \'pending\', updated = ?, ' \
+                                'attempts = attempts - 1 ' \
+                                'WHERE id = ? AND worker = ? AND state = \'leased\'', \
+                                (time.time(), jobid, worker))
+
+    def fail(self, jobid, worker, error):
+        self.get_conn().execute('UPDATE jobs SET updated = ?, error = ?, ' \
+                                'state = CASE WHEN attempts >= ? THEN \'failed\' ' \
+                                'ELSE \'pending\' END ' \
+                                'WHERE id = ? AND worker = ?', \
+                                (time.time(), error, self.max_attempts, jobid, worker))
+
+    def counts(self):
+        cursor = self.get_conn().execute('SELECT state, COUNT(*) FROM jobs GROUP BY state')
+        return dict(cursor.fetchall())
+
+# claims atomically: expired leases go back to the head of the pending list,
+# or are failed once they had max_attempts attempts, then the first pending
+# job is leased
+REDIS_CLAIM = '''
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for i = #expired, 1, -1 do
+    redis.call('ZREM', KEYS[2], expired[i])
+    local attempts = tonumber(redis.call('HGET', KEYS[3] .. expired[i], 'attempts') or 0)
+    if attempts >= tonumber(ARGV[4]) then
+        redis.call('HSET', KEYS[3] .. expired[i], 'state', 'failed', 'error', 'lease expired')
+    else
+        redis.call('LPUSH', KEYS[1], expired[i])
+    end
+end
+local jobid = redis.call('LPOP', KEYS[1])
+if not jobid then
+    return false
+end
+redis.call('ZADD', KEYS[2], ARGV[2], jobid)
+redis.call('HSET', KEYS[3] .. jobid, 'worker', ARGV[3], 'state', 'leased')
+redis.call('HINCRBY', KEYS[3] .. jobid, 'attempts', 1)
+return jobid
+'''
+
+# renews the lease only if the job is still held by the worker
+REDIS_HEARTBEAT = '''
+if redis.call('HGET', KEYS[2], 'worker') ~= ARGV[3] or
+        not redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+return 1
+'''
+
+class RedisJobQueue:
+    def __init__(self, url, prefix = 'egazette:jobs', max_attempts = 3):
+        if redis == None:
+            raise ImportError('redis is required for a redis:// job queue')
+
+        self.url          = url
+        self.prefix       = prefix
+        self.max_attempts = max_attempts
+
+        self.client     = None
+        self.client_pid = None
+
+    def get_client(self):
+        if self.client == None or self.client_pid != os.getpid():
+            self.client     = redis.Redis.from_url(self.url, decode_responses = True)
+            self.claim_script     = self.client.register_script(REDIS_CLAIM)
+            self.heartbeat_script = self.client.register_script(REDIS_HEARTBEAT)
+            self.client_pid = os.getpid()
+        return self.client
+
+    def key(self, name):
+        return '%s:%s' % (self.prefix, name)
+
+    def job_key(self, jobid):
+        return '%s:job:%s' % (self.prefix, jobid)
+
+    def enqueue(self, jobs):
+        client = self.get_client()
+        for src, fromdate, todate in jobs:
+            jobid = client.incr(self.key('nextid'))
+            pipe  = client.pipeline()
+            pipe.hset(self.job_key(jobid), mapping = {'src': src, 'fromdate': str(fromdate), \
+                                                      'todate': str(todate), 'state': 'pending', \
+                                                      'attempts': 0})
+            pipe.rpush(self.key('pending'), jobid)
+            pipe.execute()
+
+    def claim(self, worker, lease_secs):
+        self.get_client()
+        now   = time.time()
+        jobid = self.claim_script(keys = [self.key('pending'), self.key('leased'), \
+                                          self.job_key('')], \
+                                  args = [now, now + lease_secs, worker, \
+                                          self.max_attempts])
+        if not jobid:
+            return None
+
+        job = self.client.hgetall(self.job_key(jobid))
+        return {'id': jobid, 'src': job['src'], 'fromdate': job['fromdate'], \
+                'todate': job['todate']}
+
+    def heartbeat(self, jobid, worker, lease_secs):
+        self.get_client()
+        renewed = self.heartbeat_script(keys = [self.key('leased'), self.job_key(jobid)], \
+                                        args = [jobid, time.time() + lease_secs, worker])
+        return renewed == 1
+
+    def complete(self, jobid, worker):
+        client = self.get_client()
+        if client.hget(self.job_key(jobid), 'worker') != worker:
+            return
+        pipe = client.pipeline()
+        pipe.zrem(self.key('leased'), jobid)
+        pipe.hset(self.job_key(jobid), 'state', 'done')
+        pipe.execute()
+
+    def release(self, jobid, worker):
+        client = self.get_client()
+        if client.hget(self.job_key(jobid), 'worker') != worker:
+            return
+        if not client.zrem(self.key('leased'), jobid):
+            return
+        pipe = client.pipeline()
+        pipe.hincrby(self.job_key(jobid), 'attempts', -1)
+        pipe.hset(self.job_key(jobid), 'state', 'pending')
+        pipe.lpush(self.key('pending'), jobid)
+        pipe.execute()
+
+    def fail(self, jobid, worker, error):
+        client = self.get_client()
+        job = client.hgetall(self.job_key(jobid))
+        if job.get('worker') != worker:
+            return
+        if not client.zrem(self.key('leased'), jobid):
+            return
+
+        pipe = client.pipeline()
+        if int(job.get('attempts', 0)) >= self.max_attempts:
+            pipe.hset(self.job_key(jobid), mapping = {'state': 'failed', 'error': error})
+        else:
+            pipe.hset(self.job_key(jobid), mapping = {'state': 'pending', 'error': error})
+            pipe.rpush(self.key('pending'), jobid)
+        pipe.execute()
+
+    def counts(self):
+        client = self.get_client()
+        return {'pending': client.llen(self.key('pending')), \
+                'leased':  client.zcard(self.key('leased'))}
+
+def get_job_queue(spec):
+    if spec.startswith('redis://') or spec.startswith('rediss://') or \
+            spec.startswith('unix://'):
+        return RedisJobQueue(spec)
+    return SqliteJobQueue(spec)
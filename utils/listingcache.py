@@ -0,0 +1,170 @@
+"""Fingerprints of listing pages that survive across runs.
+
+Listing pages (search results, yearly index pages) are fetched and parsed on
+every run even when nothing has changed. The cache keeps, per URL plus
+postdata, the ETag, Last-Modified and a digest of the body, and per scope
+(usually the date being crawled) the digest the page had when that scope was
+last processed completely. The last body of a page is kept too, compressed,
+so that Downloader.download_listing can send a conditional GET for every
+listing it has seen before and answer a 304 from the cache; scrapers are
+told that the page is unchanged for a scope, so they can skip parsing it.
+
+A scope is only marked as processed once the whole day finished without
+failed requests (see BaseGazette.sync_oneday), so a gazette that failed to
+download is retried on the next run even if its listing did not change.
+The cache lives in <datadir>/stats/listingcache.db.
+"""
+
+import os
+import re
+import time
+import zlib
+import sqlite3
+import hashlib
+import urllib.parse
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS validators (
+    key           TEXT PRIMARY KEY,
+    url           TEXT NOT NULL,
+    etag          TEXT,
+    last_modified TEXT,
+    digest        TEXT NOT NULL,
+    updated       REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bodies (
+    key          TEXT PRIMARY KEY,
+    response_url TEXT,
+    body         BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS processed (
+    key      TEXT NOT NULL,
+    scope    TEXT NOT NULL,
+    digest   TEXT NOT NULL,
+    updated  REAL NOT NULL,
+    PRIMARY KEY (key, scope)
+);
+'''
+
+# ASP.NET page state that changes on every request without the listing
+# changing; ignored both in the cache key and in the body digest
+VOLATILE_FIELDS = set(['__VIEWSTATE', '__VIEWSTATEGENERATOR', '__VIEWSTATEENCRYPTED', \
+                       '__EVENTVALIDATION', '__PREVIOUSPAGE', '__REQUESTDIGEST'])
+
+volatile_input_re = re.compile(rb'<input[^>]+name="(%s)"[^>]*>' % \
+                               '|'.join(VOLATILE_FIELDS).encode('ascii'), re.IGNORECASE)
+
+def get_listing_key(url, postdata):
+    if postdata == None:
+        data = ''
+    else:
+        if isinstance(postdata, dict):
+            postdata = list(postdata.items())
+        if isinstance(postdata, list):
+            postdata = [(k, v) for k, v in postdata if k not in VOLATILE_FIELDS]
+            data = urllib.parse.urlencode(postdata)
+        else:
+            data = postdata
+        if isinstance(data, bytes):
+            data = data.decode('utf-8', 'ignore')
+
+    return hashlib.sha1(('%s\n%s' % (url, data)).encode('utf-8')).hexdigest()
+
+def get_body_digest(webpage):
+    return hashlib.sha1(volatile_input_re.sub(b'', webpage)).hexdigest()
+
+class ListingCache:
+    def __init__(self, dbpath, force = False):
+        self.dbpath = dbpath
+        # with force every page is treated as changed
+        self.force  = force
+
+        self.conn     = None
+        self.conn_pid = None
+
+    def get_conn(self):
+        if self.conn == None or self.conn_pid != os.getpid():
+            self.conn = sqlite3.connect(self.dbpath, timeout = 60, \
+                                        check_same_thread = False)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.executescript(SCHEMA)
+            self.conn_pid = os.getpid()
+        return self.conn
+
+    def get_validators(self, key):
+        cursor = self.get_conn().execute('SELECT etag, last_modified, digest ' \
+                                         'FROM validators WHERE key = ?', (key,))
+        return cursor.fetchone()
+
+    def get_processed_digest(self, key, scope):
+        cursor = self.get_conn().execute('SELECT digest FROM processed ' \
+                                         'WHERE key = ? AND scope = ?', (key, str(scope)))
+        row = cursor.fetchone()
+        if row == None:
+            return None
+        return row[0]
+
+    def get_conditional_headers(self, key):
+        headers = {}
+        if self.force:
+            return headers
+
+        row = self.get_validators(key)
+        # a 304 is answered with the body kept from the last 200
+        if row == None or self.get_body(key) == None:
+            return headers
+
+        etag, last_modified, digest = row
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def get_body(self, key):
+        # (response_url, body) of the page as last fetched, None if not kept
+        cursor = self.get_conn().execute('SELECT response_url, body FROM bodies ' \
+                                         'WHERE key = ?', (key,))
+        row = cursor.fetchone()
+        if row == None:
+            return None
+        return row[0], zlib.decompress(row[1])
+
+    def get_digest(self, key):
+        row = self.get_validators(key)
+        if row == None:
+            return None
+        return row[2]
+
+    def update(self, key, url, srvresponse, webpage, response_url = None):
+        digest = get_body_digest(webpage)
+
+        etag = last_modified = None
+        if srvresponse != None:
+            etag          = srvresponse.get('ETag')
+            last_modified = srvresponse.get('Last-Modified')
+
+        conn = self.get_conn()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO validators VALUES (?, ?, ?, ?, ?, ?)', \
+                         (key, url, etag, last_modified, digest, time.time()))
+            if etag or last_modified:
+                conn.execute('INSERT OR REPLACE INTO bodies VALUES (?, ?, ?)', \
+                             (key, response_url, zlib.compress(webpage)))
+            else:
+                conn.execute('DELETE FROM bodies WHERE key = ?', (key,))
+        return digest
+
+    def is_processed(self, key, scope, digest):
+        if self.force or digest == None:
+            return False
+        return self.get_processed_digest(key, scope) == digest
+
+    def mark_processed(self, listings):
+        conn = self.get_conn()
+        now  = time.time()
+        with conn:
+            for key, scope, digest in listings:
+                if digest != None:
+                    conn.execute('INSERT OR REPLACE INTO processed VALUES (?, ?, ?, ?)', \
+                                 (key, str(scope), digest, now))
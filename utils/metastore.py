@@ -0,0 +1,148 @@
+"""JSON-lines copies of the metatags, one segment per day directory.
+
+Reading a metatags file means a minidom parse and a recursive walk for every
+gazette. FileManager.save_metainfo also appends the parsed tags of the doc to
+<datadir>/metastore/<src>/<date>.jsonl, and get_metainfo answers from there:
+a segment is read with a single json.loads per line and kept in memory, so a
+pass over the metadata of a whole source reads one small file per day.
+
+The metatags XML stays the primary copy. Each record carries the mtime of the
+XML it was made from and is ignored once the XML changes, so a stale or
+missing segment only costs the XML parse. Later records of a relurl replace
+earlier ones, so a doc saved again leaves a dead line behind; compact()
+drops those. tools/rebuild_catalog.py -M rewrites the segments of an
+existing tree and compacts the ones it did not rewrite. A line appended
+by a crawler while its segment is compacted can be lost, which again only
+costs the XML parse.
+"""
+
+import os
+import json
+import threading
+import collections
+
+class MetaStore:
+    def __init__(self, storedir, max_segments = 64):
+        self.storedir     = storedir
+        self.max_segments = max_segments
+
+        # segment path -> (size, mtime, {relurl: (xml mtime, line)}), the
+        # lines are decoded again on every get so that callers can modify
+        # what they get
+        self.segments = collections.OrderedDict()
+        self.lock     = threading.Lock()
+
+    def get_segment_path(self, relurl):
+        dirname = os.path.dirname(relurl)
+        if not dirname:
+            return None
+        return os.path.join(self.storedir, '%s.jsonl' % dirname)
+
+    def read_segment(self, segpath):
+        records = {}
+        with open(segpath, 'r', encoding = 'utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # a partly written last line
+                    continue
+                records[record['relurl']] = (record['mtime'], line)
+        return records
+
+    def get_segment(self, segpath):
+        try:
+            stat = os.stat(segpath)
+        except FileNotFoundError:
+            return None
+
+        with self.lock:
+            cached = self.segments.get(segpath)
+            if cached != None and cached[0] == stat.st_size and \
+                    cached[1] == stat.st_mtime:
+                self.segments.move_to_end(segpath)
+                return cached[2]
+
+        records = self.read_segment(segpath)
+        with self.lock:
+            self.segments[segpath] = (stat.st_size, stat.st_mtime, records)
+            self.segments.move_to_end(segpath)
+            while len(self.segments) > self.max_segments:
+                self.segments.popitem(last = False)
+        return records
+
+    def get(self, relurl, mtime):
+        # the tags of relurl if they were stored from the xml of this mtime
+        segpath = self.get_segment_path(relurl)
+        if segpath == None:
+            return None
+
+        records = self.get_segment(segpath)
+        if records == None or relurl not in records:
+            return None
+
+        record_mtime, line = records[relurl]
+        if record_mtime != mtime:
+            return None
+        return json.loads(line)['tags']
+
+    def to_line(self, relurl, mtime, tags):
+        return json.dumps({'relurl': relurl, 'mtime': mtime, 'tags': tags}, \
+                          ensure_ascii = False, sort_keys = True) + '\n'
+
+    def append(self, relurl, mtime, tags):
+        segpath = self.get_segment_path(relurl)
+        if segpath == None:
+            return
+
+        os.makedirs(os.path.dirname(segpath), exist_ok = True)
+        # a single write so that lines of concurrent crawlers do not mix
+        with open(segpath, 'a', encoding = 'utf-8') as f:
+            f.write(self.to_line(relurl, mtime, tags))
+
+    def rewrite(self, dirname, records):
+        # replaces the segment of a day directory, records are
+        # (relurl, mtime, tags)
+        segpath = os.path.join(self.storedir, '%s.jsonl' % dirname)
+        os.makedirs(os.path.dirname(segpath), exist_ok = True)
+
+        tmppath = segpath + '.tmp'
+        with open(tmppath, 'w', encoding = 'utf-8') as f:
+            for relurl, mtime, tags in records:
+                f.write(self.to_line(relurl, mtime, tags))
+        os.replace(tmppath, segpath)
+
+    def compact(self, segpath):
+        # keeps the last record of every relurl, returns the number of
+        # lines dropped
+        lines    = 0
+        with open(segpath, 'r', encoding = 'utf-8') as f:
+            for line in f:
+                lines += 1
+        records  = self.read_segment(segpath)
+        if lines == len(records):
+            return 0
+
+        tmppath = segpath + '.tmp'
+        with open(tmppath, 'w', encoding = 'utf-8') as f:
+            for relurl in sorted(records):
+                f.write(records[relurl][1])
+        os.replace(tmppath, segpath)
+        return lines - len(records)
+
+    def compact_src(self, src, skip = None):
+        # compacts the segments of a source, except the day directories
+        # in skip; returns the number of lines dropped
+        srcdir  = os.path.join(self.storedir, src)
+        dropped = 0
+        for dirpath, dirnames, filenames in os.walk(srcdir):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if not filename.endswith('.jsonl'):
+                    continue
+                segpath = os.path.join(dirpath, filename)
+                dirname = os.path.relpath(segpath, self.storedir)[:-len('.jsonl')]
+                if skip != None and dirname in skip:
+                    continue
+                dropped += self.compact(segpath)
+        return dropped
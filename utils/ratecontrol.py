@@ -0,0 +1,151 @@
+"""Adaptive per-host request pacing.
+
+Every request made through Downloader waits for a slot from the controller of
+its host and reports back how it went. The allowed request rate of a host
+grows additively while it answers and is cut multiplicatively when it
+throttles (429/503/504, timeouts), as AIMD does in TCP congestion control.
+Latency is only reported: listings, postbacks and documents of one host take
+very different times, so a slow answer says little about load. Retries wait on the host's
+schedule, honouring Retry-After, instead of sleeping a fixed multiple of
+minutes.
+
+The state of a host lives in shared memory created before the crawlers fork,
+so all sources on the same hostname share one controller. Hosts first seen
+after the fork get a controller local to the process.
+"""
+
+import time
+import json
+import random
+import email.utils
+
+from .download import mpctx
+
+RATE, NEXT_TS, LATENCY, MIN_LATENCY, REQUESTS, THROTTLED, ERRORS, \
+    NUM_BYTES, BUSY_SECS, WAITED_SECS, BACKOFFS = range(11)
+NUM_FIELDS = 11
+
+THROTTLE_CODES = set([429, 503, 504])
+
+class RateController:
+    def __init__(self, hostnames = None):
+        self.initial_rate  = 2.0      # requests per second
+        self.min_rate      = 1/60.0
+        self.max_rate      = 20.0
+        self.increase_step = 0.25     # added to the rate after a good response
+        self.decrease      = 0.5      # rate multiplied by this on throttling
+        self.ewma_weight   = 0.2
+
+        self.hosts  = {}
+        if hostnames:
+            for hostname in hostnames:
+                self.get_host(hostname)
+
+    def get_host(self, hostname):
+        if hostname not in self.hosts:
+            state = mpctx.Array('d', NUM_FIELDS)
+            state[RATE] = self.initial_rate
+            self.hosts[hostname] = state
+        return self.hosts[hostname]
+
+    def acquire(self, hostname):
+        # reserve the next slot of the host and sleep until it comes
+        state = self.get_host(hostname)
+        with state.get_lock():
+            now  = time.time()
+            slot = max(now, state[NEXT_TS])
+            state[NEXT_TS] = slot + 1.0 / state[RATE]
+            wait = slot - now
+            state[WAITED_SECS] += wait
+
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def hold(self, hostname, secs):
+        # no request to the host for secs from now
+        state = self.get_host(hostname)
+        with state.get_lock():
+            state[NEXT_TS] = max(state[NEXT_TS], time.time() + secs)
+            state[BACKOFFS] += 1
+
+    def record(self, hostname, latency, status = None, num_bytes = 0, \
+               error = False):
+        state = self.get_host(hostname)
+        with state.get_lock():
+            state[REQUESTS]  += 1
+            state[BUSY_SECS] += latency
+            state[NUM_BYTES] += num_bytes
+
+            rate = state[RATE]
+            if status in THROTTLE_CODES or (error and status == None):
+                # refused or timed out, the host is struggling
+                state[THROTTLED] += 1
+                rate *= self.decrease
+            elif error:
+                state[ERRORS] += 1
+            else:
+                if state[LATENCY] == 0:
+                    state[LATENCY] = latency
+                else:
+                    state[LATENCY] += self.ewma_weight * (latency - state[LATENCY])
+                if state[MIN_LATENCY] == 0 or latency < state[MIN_LATENCY]:
+                    state[MIN_LATENCY] = latency
+                rate += self.increase_step
+
+            state[RATE] = min(self.max_rate, max(self.min_rate, rate))
+
+    def get_retry_delay(self, base_secs, max_secs, attempt, retry_after = None):
+        # exponential with jitter, or what the server asked for
+        delay = base_secs * (2 ** (attempt - 1))
+        delay = delay * random.uniform(0.5, 1.0)
+
+        retry_after = parse_retry_after(retry_after)
+        if retry_after != None:
+            delay = max(delay, retry_after)
+        return min(delay, max_secs)
+
+    def get_stats(self):
+        stats = {}
+        for hostname, state in self.hosts.items():
+            with state.get_lock():
+                values = state[:]
+
+            requests  = values[REQUESTS]
+            busy_secs = values[BUSY_SECS]
+            stats[str(hostname)] = { \
+                'rate':          round(values[RATE], 3), \
+                'requests':      int(requests), \
+                'throttled':     int(values[THROTTLED]), \
+                'errors':        int(values[ERRORS]), \
+                'backoffs':      int(values[BACKOFFS]), \
+                'bytes':         int(values[NUM_BYTES]), \
+                'latency_ewma':  round(values[LATENCY], 3), \
+                'latency_min':   round(values[MIN_LATENCY], 3), \
+                'busy_secs':     round(busy_secs, 1), \
+                'waited_secs':   round(values[WAITED_SECS], 1), \
+                'bytes_per_sec': round(values[NUM_BYTES] / busy_secs, 1) if busy_secs else 0, \
+                'throttle_rate': round(values[THROTTLED] / requests, 4) if requests else 0, \
+            }
+        return stats
+
+    def write_stats(self, filepath):
+        stats = {'time': time.strftime('%Y-%m-%d %H:%M:%S'), \
+                 'hosts': self.get_stats()}
+        with open(filepath, 'w') as f:
+            json.dump(stats, f, indent = 2, sort_keys = True)
+
+def parse_retry_after(value):
+    if value == None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        dateobj = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if dateobj == None:
+        return None
+    return max(0.0, dateobj.timestamp() - time.time())
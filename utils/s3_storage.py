@@ -0,0 +1,222 @@
+"""Docs of a data directory kept in an S3 compatible object store.
+
+    python -m egazette.sync -D datadir -S s3://bucket/prefix ...
+
+S3Backend is a backend of FileManager (utils/file_storage.py) that keeps the
+docs as objects laid out like the tree on disk:
+
+    <prefix>/raw/<relurl>.<ext>
+    <prefix>/metatags/<relurl>.xml
+
+FileManager hands it the local paths of the docs under datadir, which are
+mapped to keys. The local datadir still holds stats/, the logs and a cache:
+metatags that are saved or read are kept in <datadir>/metatags, and raw docs
+are fetched into <datadir>/raw only for callers that need a file path.
+Cached metatags are trusted, the crawlers of a bucket are expected to write
+through it. Whether a doc exists is answered from a listing per directory.
+Streamed downloads are uploaded from their temp file in parts of 8MB.
+
+The endpoint of a store other than AWS (MinIO, Ceph, a local stand-in) is
+given as s3://bucket/prefix?endpoint=http://localhost:9000; credentials come
+from the usual boto3 configuration. boto3 is only needed for this backend,
+and any client with the same methods can be passed in instead.
+"""
+
+import os
+import tempfile
+import threading
+import collections
+import urllib.parse
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+except ImportError:
+    boto3 = None
+
+from .writejournal import TMP_SUFFIX
+
+PART_SIZE = 8 * 1024 * 1024
+
+class S3Backend:
+    def __init__(self, basedir, bucket, prefix, endpoint_url = None, \
+                 client = None, max_dirs = 1024):
+        if boto3 == None and client == None:
+            raise ImportError('boto3 is required for s3:// storage, ' \
+                              'install it with pip install boto3')
+
+        self.basedir  = basedir
+        self.bucket   = bucket
+        self.prefix   = prefix.strip('/')
+        self.endpoint_url = endpoint_url
+
+        # metatags are kept on disk as well, raw docs only when asked for
+        self.cachedir = os.path.join(basedir, 'metatags')
+
+        # a client per process, boto3 clients are not safe across a fork
+        self.client     = client
+        self.client_pid = os.getpid() if client != None else None
+        self.lock       = threading.Lock()
+
+        # directory -> names of its objects, the most recent max_dirs
+        self.max_dirs = max_dirs
+        self.listings = collections.OrderedDict()
+
+        if boto3 != None:
+            self.transfer_config = TransferConfig(multipart_threshold = PART_SIZE, \
+                                                  multipart_chunksize = PART_SIZE)
+        else:
+            self.transfer_config = None
+
+    @classmethod
+    def from_url(cls, basedir, url):
+        # s3://bucket/prefix[?endpoint=http://host:port]
+        parsed = urllib.parse.urlparse(url)
+        query  = urllib.parse.parse_qs(parsed.query)
+        endpoint_url = query.get('endpoint', [None])[0]
+        return cls(basedir, parsed.netloc, parsed.path, endpoint_url = endpoint_url)
+
+    def get_client(self):
+        with self.lock:
+            if self.client == None or self.client_pid != os.getpid():
+                self.client     = boto3.client('s3', endpoint_url = self.endpoint_url)
+                self.client_pid = os.getpid()
+            return self.client
+
+    def get_key(self, filepath):
+        relpath = os.path.relpath(filepath, self.basedir).replace(os.sep, '/')
+        if relpath == '.':
+            return self.prefix
+        if self.prefix:
+            return '%s/%s' % (self.prefix, relpath)
+        return relpath
+
+    def get_path(self, key):
+        if self.prefix:
+            key = key[len(self.prefix) + 1:]
+        return os.path.join(self.basedir, *key.split('/'))
+
+    def is_cached(self, filepath):
+        return filepath.startswith(self.cachedir + os.sep)
+
+    def get_dir_prefix(self, dirname):
+        key = self.get_key(dirname)
+        if key:
+            return key + '/'
+        return ''
+
+    def list_dir(self, dirname):
+        # names of the objects and subdirectories under dirname
+        prefix    = self.get_dir_prefix(dirname)
+        paginator = self.get_client().get_paginator('list_objects_v2')
+        names     = []
+        for page in paginator.paginate(Bucket = self.bucket, Prefix = prefix, \
+                                       Delimiter = '/'):
+            for item in page.get('Contents', []):
+                names.append(item['Key'][len(prefix):])
+            for item in page.get('CommonPrefixes', []):
+                names.append(item['Prefix'][len(prefix):].strip('/'))
+
+        with self.lock:
+            self.listings[dirname] = set(names)
+            while len(self.listings) > self.max_dirs:
+                self.listings.popitem(last = False)
+        return names
+
+    def walk(self, dirname):
+        # paths of the objects under dirname, in the order of their keys
+        prefix    = self.get_dir_prefix(dirname)
+        paginator = self.get_client().get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket = self.bucket, Prefix = prefix):
+            for item in page.get('Contents', []):
+                yield self.get_path(item['Key'])
+
+    def exists(self, filepath):
+        if self.is_cached(filepath) and os.path.exists(filepath):
+            return True
+
+        dirname, filename = os.path.split(filepath)
+        with self.lock:
+            names = self.listings.get(dirname)
+            if names != None:
+                self.listings.move_to_end(dirname)
+        if names == None:
+            names = self.list_dir(dirname)
+        return filename in names
+
+    def get_mtime(self, filepath):
+        if self.is_cached(filepath) and os.path.exists(filepath):
+            return os.path.getmtime(filepath)
+        if not self.exists(filepath):
+            return None
+
+        client = self.get_client()
+        try:
+            response = client.head_object(Bucket = self.bucket, \
+                                          Key = self.get_key(filepath))
+        except client.exceptions.ClientError:
+            return None
+        return response['LastModified'].timestamp()
+
+    def get_local_path(self, filepath):
+        # a local copy of the doc, fetched on first use
+        if os.path.exists(filepath):
+            return filepath
+        if not self.exists(filepath):
+            return None
+
+        os.makedirs(os.path.dirname(filepath), exist_ok = True)
+        tmpfile = self.new_tmpfile(filepath)
+        tmpfile.close()
+        try:
+            self.get_client().download_file(self.bucket, self.get_key(filepath), \
+                                            tmpfile.name)
+            os.replace(tmpfile.name, filepath)
+        finally:
+            if os.path.exists(tmpfile.name):
+                os.remove(tmpfile.name)
+        return filepath
+
+    def open(self, filepath):
+        # streamed from the store unless cached
+        if self.is_cached(filepath) and os.path.exists(filepath):
+            return open(filepath, 'rb')
+        response = self.get_client().get_object(Bucket = self.bucket, \
+                                                Key = self.get_key(filepath))
+        return response['Body']
+
+    def new_tmpfile(self, filepath):
+        dirname, filename = os.path.split(filepath)
+        return tempfile.NamedTemporaryFile(dir = dirname, prefix = '.%s.' % filename, \
+                                           suffix = TMP_SUFFIX, delete = False)
+
+    def put_file(self, tmppath, filepath, mtype = None):
+        # uploads the temp file as the object of filepath, returns its mtime
+        extra = {}
+        if mtype:
+            extra['ContentType'] = mtype
+        self.get_client().upload_file(tmppath, self.bucket, self.get_key(filepath), \
+                                      ExtraArgs = extra, Config = self.transfer_config)
+
+        dirname, filename = os.path.split(filepath)
+        with self.lock:
+            if dirname in self.listings:
+                self.listings[dirname].add(filename)
+
+        if self.is_cached(filepath):
+            os.replace(tmppath, filepath)
+            return os.path.getmtime(filepath)
+
+        mtime = os.path.getmtime(tmppath)
+        os.remove(tmppath)
+        if os.path.exists(filepath):
+            # a stale local copy of the old doc
+            os.remove(filepath)
+        return mtime
+
+    def flush(self):
+        # an acknowledged upload is durable, there is nothing to sync
+        pass
+
+    def recover(self, quarantinedir):
+        return []
@@ -0,0 +1,314 @@
+"""Crawl telemetry written under <datadir>/stats.
+
+Downloader reports every request (latency, bytes, retries, errors) per source
+and host, utils.parse_webpage reports the time spent parsing pages, and
+BaseGazette.sync_oneday reports the time taken and the gazettes found for
+each day. Each crawler process keeps its counters in memory and appends them
+as JSON lines to stats/telemetry/<run>.jsonl after every day, so a run cut
+short by -W still leaves its numbers behind. At the end of a run sync.py folds
+the lines of that run into a Prometheus text file, stats/crawl.prom. A file
+per run keeps both that and the durations of earlier runs from reading the
+whole history.
+
+Nothing is written unless configure() was called, so tools that use the
+scrapers directly are unaffected.
+"""
+
+import os
+import time
+import json
+import threading
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_config = {'statsdir': None, 'run_id': None}
+
+def configure(statsdir, run_id = None):
+    # called in the parent before the crawlers fork
+    if run_id == None:
+        run_id = time.strftime('%Y%m%d-%H%M%S-') + str(os.getpid())
+    _config['statsdir'] = statsdir
+    _config['run_id']   = run_id
+    os.makedirs(get_run_dir(statsdir), exist_ok = True)
+    return run_id
+
+def get_run_dir(statsdir):
+    return os.path.join(statsdir, 'telemetry')
+
+def get_jsonl_path():
+    return os.path.join(get_run_dir(_config['statsdir']), \
+                        '%s.jsonl' % _config['run_id'])
+
+def get_prom_path():
+    return os.path.join(_config['statsdir'], 'crawl.prom')
+
+def new_request_stats():
+    return {'requests': 0, 'errors': 0, 'retries': 0, 'bytes': 0, \
+            'latency_sum': 0.0, 'latency_buckets': [0] * (len(LATENCY_BUCKETS) + 1)}
+
+class Collector:
+    def __init__(self):
+        self.lock        = threading.Lock()
+        self.current_src = None
+        self.requests    = {}
+        self.parse       = {}
+
+    def set_source(self, src):
+        self.current_src = src
+
+    def get_request_stats(self, src, host):
+        key = (src, host)
+        if key not in self.requests:
+            self.requests[key] = new_request_stats()
+        return self.requests[key]
+
+    def record_request(self, src, host, latency, num_bytes, error):
+        bucket = len(LATENCY_BUCKETS)
+        for i, le in enumerate(LATENCY_BUCKETS):
+            if latency <= le:
+                bucket = i
+                break
+
+        with self.lock:
+            stats = self.get_request_stats(src, host)
+            stats['requests']    += 1
+            stats['bytes']       += num_bytes
+            stats['latency_sum'] += latency
+            stats['latency_buckets'][bucket] += 1
+            if error:
+                stats['errors'] += 1
+
+    def record_retry(self, src, host):
+        with self.lock:
+            self.get_request_stats(src, host)['retries'] += 1
+
+    def record_parse(self, secs):
+        with self.lock:
+            src = self.current_src
+            if src not in self.parse:
+                self.parse[src] = {'pages': 0, 'secs': 0.0}
+            self.parse[src]['pages'] += 1
+            self.parse[src]['secs']  += secs
+
+    def record_day(self, src, dateobj, secs, num_gazettes, complete):
+        self.write([{'kind': 'day', 'src': src, 'date': str(dateobj), \
+                     'secs': round(secs, 3), 'gazettes': num_gazettes, \
+                     'complete': complete}])
+
+    def flush(self):
+        with self.lock:
+            requests, self.requests = self.requests, {}
+            parse, self.parse       = self.parse, {}
+
+        records = []
+        for (src, host), stats in requests.items():
+            record = {'kind': 'requests', 'src': src, 'host': host}
+            record.update(stats)
+            records.append(record)
+        for src, stats in parse.items():
+            record = {'kind': 'parse', 'src': src}
+            record.update(stats)
+            records.append(record)
+        self.write(records)
+
+    def write(self, records):
+        if _config['statsdir'] == None or not records:
+            return
+
+        now   = time.time()
+        lines = []
+        for record in records:
+            record['run'] = _config['run_id']
+            record['ts']  = now
+            lines.append(json.dumps(record, sort_keys = True) + '\n')
+
+        # a single append per batch so that the lines of concurrent
+        # crawlers do not interleave
+        with open(get_jsonl_path(), 'a') as f:
+            f.write(''.join(lines))
+
+_collector = None
+_collector_pid = None
+
+def get_collector():
+    global _collector, _collector_pid
+
+    if _collector == None or _collector_pid != os.getpid():
+        _collector     = Collector()
+        _collector_pid = os.getpid()
+    return _collector
+
+def read_run(jsonl_path, run_id):
+    records = []
+    if not os.path.exists(jsonl_path):
+        return records
+
+    with open(jsonl_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('run') == run_id:
+                records.append(record)
+    return records
+
+def get_run_files(statsdir, max_runs):
+    # the files of the last max_runs runs, oldest first
+    run_dir = get_run_dir(statsdir)
+    if not os.path.isdir(run_dir):
+        return []
+
+    paths = []
+    for filename in os.listdir(run_dir):
+        if filename.endswith('.jsonl'):
+            path = os.path.join(run_dir, filename)
+            paths.append((os.path.getmtime(path), path))
+    paths.sort()
+    return [path for mtime, path in paths[-max_runs:]]
+
+def get_day_durations(statsdir, max_runs = 50, max_days = 50):
+    # median time a day of each source took over its last max_days days,
+    # read from the files of the last max_runs runs
+    lines = []
+    for path in get_run_files(statsdir, max_runs):
+        with open(path, 'rb') as f:
+            lines.extend(f.read().splitlines())
+
+    secs = {}
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if record.get('kind') != 'day':
+            continue
+        src = record.get('src')
+        if src not in secs:
+            secs[src] = []
+        secs[src].append(record['secs'])
+
+    durations = {}
+    for src, values in secs.items():
+        values = sorted(values[-max_days:])
+        durations[src] = values[len(values) // 2]
+    return durations
+
+def aggregate(records):
+    requests = {}
+    sources  = {}
+
+    def get_source(src):
+        if src not in sources:
+            sources[src] = {'days': 0, 'incomplete_days': 0, 'secs': 0.0, \
+                            'gazettes': 0, 'pages': 0, 'parse_secs': 0.0, \
+                            'requests': 0}
+        return sources[src]
+
+    for record in records:
+        src  = record.get('src')
+        kind = record.get('kind')
+        if kind == 'requests':
+            key = (src, record.get('host'))
+            if key not in requests:
+                requests[key] = new_request_stats()
+            stats = requests[key]
+            for k in ['requests', 'errors', 'retries', 'bytes', 'latency_sum']:
+                stats[k] += record[k]
+            for i, n in enumerate(record['latency_buckets']):
+                stats['latency_buckets'][i] += n
+            get_source(src)['requests'] += record['requests']
+        elif kind == 'parse':
+            source = get_source(src)
+            source['pages']      += record['pages']
+            source['parse_secs'] += record['secs']
+        elif kind == 'day':
+            source = get_source(src)
+            source['days']     += 1
+            source['secs']     += record['secs']
+            source['gazettes'] += record['gazettes']
+            if not record['complete']:
+                source['incomplete_days'] += 1
+    return requests, sources
+
+def prom_labels(**labels):
+    items = []
+    for k, v in sorted(labels.items()):
+        v = str(v).replace('\\', '\\\\').replace('"', '\\"')
+        items.append('%s="%s"' % (k, v))
+    return '{%s}' % ','.join(items)
+
+def to_prometheus(requests, sources):
+    lines = []
+    def metric(name, mtype, helptext, samples):
+        lines.append('# HELP %s %s' % (name, helptext))
+        lines.append('# TYPE %s %s' % (name, mtype))
+        for labels, value in samples:
+            lines.append('%s%s %s' % (name, labels, value))
+
+    reqs = sorted(requests.items(), key = lambda x: (str(x[0][0]), str(x[0][1])))
+    def req_samples(field):
+        return [(prom_labels(src = src, host = host), stats[field]) \
+                for (src, host), stats in reqs]
+
+    metric('egazette_requests_total', 'counter', 'HTTP requests made', \
+           req_samples('requests'))
+    metric('egazette_request_errors_total', 'counter', 'HTTP requests that failed', \
+           req_samples('errors'))
+    metric('egazette_request_retries_total', 'counter', 'HTTP requests retried', \
+           req_samples('retries'))
+    metric('egazette_response_bytes_total', 'counter', 'Bytes received', \
+           req_samples('bytes'))
+
+    lines.append('# HELP egazette_request_latency_seconds Latency of HTTP requests')
+    lines.append('# TYPE egazette_request_latency_seconds histogram')
+    for (src, host), stats in reqs:
+        cumulative = 0
+        bounds = [str(le) for le in LATENCY_BUCKETS] + ['+Inf']
+        for le, n in zip(bounds, stats['latency_buckets']):
+            cumulative += n
+            lines.append('egazette_request_latency_seconds_bucket%s %d' % \
+                         (prom_labels(src = src, host = host, le = le), cumulative))
+        labels = prom_labels(src = src, host = host)
+        lines.append('egazette_request_latency_seconds_sum%s %.3f' % (labels, stats['latency_sum']))
+        lines.append('egazette_request_latency_seconds_count%s %d' % (labels, stats['requests']))
+
+    srcs = sorted(sources.items(), key = lambda x: str(x[0]))
+    def src_samples(field):
+        return [(prom_labels(src = src), stats[field]) for src, stats in srcs]
+
+    metric('egazette_days_total', 'counter', 'Days crawled', src_samples('days'))
+    metric('egazette_incomplete_days_total', 'counter', 'Days crawled with failed requests', \
+           src_samples('incomplete_days'))
+    metric('egazette_crawl_seconds_total', 'counter', 'Time spent crawling days', \
+           src_samples('secs'))
+    metric('egazette_gazettes_total', 'counter', 'New gazettes saved', \
+           src_samples('gazettes'))
+    metric('egazette_pages_parsed_total', 'counter', 'Web pages parsed', \
+           src_samples('pages'))
+    metric('egazette_parse_seconds_total', 'counter', 'Time spent parsing web pages', \
+           src_samples('parse_secs'))
+
+    ratios = []
+    for src, stats in srcs:
+        if stats['requests']:
+            ratios.append((prom_labels(src = src), \
+                           '%.4f' % (stats['gazettes'] / stats['requests'])))
+    metric('egazette_gazettes_per_request', 'gauge', 'New gazettes per HTTP request', ratios)
+
+    return '\n'.join(lines) + '\n'
+
+def write_prometheus():
+    # folds the lines of this run into stats/crawl.prom, returns the per
+    # source totals
+    if _config['statsdir'] == None:
+        return {}
+
+    records = read_run(get_jsonl_path(), _config['run_id'])
+    requests, sources = aggregate(records)
+
+    tmppath = get_prom_path() + '.tmp'
+    with open(tmppath, 'w') as f:
+        f.write(to_prometheus(requests, sources))
+    os.replace(tmppath, get_prom_path())
+    return sources
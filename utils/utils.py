@@ -8,11 +8,15 @@ import datetime
 import sys
 import calendar
 import logging
+import time
 
 from xml.parsers.expat import ExpatError
 from xml.dom import minidom, Node
 from bs4 import BeautifulSoup, NavigableString, Tag
 
+from . import telemetry
+from . import ext_ops
+
 def parse_xml(xmlpage):
     try: 
         d = minidom.parseString(xmlpage)
@@ -172,12 +176,15 @@ def parse_datestr(datestr):
     return None         
 
 def parse_webpage(webpage, parser):
+    start_ts = time.time()
     try:
         d = BeautifulSoup(webpage, parser)
-        return d
     except:
         return None
 
+    telemetry.get_collector().record_parse(time.time() - start_ts)
+    return d
+
 def get_search_form(webpage, parser, search_endp):
     d = parse_webpage(webpage, parser)
     if d is None:
@@ -328,19 +335,17 @@ def replace_xml_illegal_chars(val, replacement=' '):
     return _illegal_xml_chars_RE.sub(replacement, val)
 
 class MetaInfo(dict):
-    def __init__(self):
-        dict.__init__(self)
+    # listings of archive sites hold tens of thousands of these, so no
+    # per-instance __dict__; values are cleaned of characters illegal in
+    # xml only when written out (xml_ops.escape_xml)
+    __slots__ = ()
 
     def copy(self):
-        m = MetaInfo()
-        for k, v in self.items():
-            m[k] = v
-        return m
+        return MetaInfo(self)
  
     def set_field(self, field, value):
-        if type(value) in (str,):
-            value = replace_xml_illegal_chars(value)
-        self.__setitem__(field, value)
+        # field names read from metatags share the string of the constant
+        self.__setitem__(sys.intern(field), value)
 
     def get_field(self, field):
         if field in self:
@@ -540,29 +545,34 @@ def stats_to_message(stats):
  
     return '\n'.join(messagelist)
 
+# extensions of the raw docs saved by FileManager
+FILE_EXTENSIONS = {
+    'text/html':              'html',
+    'application/postscript': 'ps',
+    'application/pdf':        'pdf',
+    'text/plain':             'txt',
+    'image/png':              'png',
+}
+
 def get_file_type(filepath):
-    mtype = magic.from_file(filepath, mime = True)
+    with open(filepath, 'rb') as f:
+        mtype = ext_ops.sniff_type(f.read(ext_ops.SNIFF_BYTES))
+    if mtype == None:
+        mtype = magic.from_file(filepath, mime = True)
 
     return mtype
 
 def get_buffer_type(buff):
-    mtype = magic.from_buffer(buff, mime=True)
+    # libmagic only for what the signatures in ext_ops do not settle
+    mtype = ext_ops.sniff_type(buff)
+    if mtype == None:
+        mtype = magic.from_buffer(buff, mime=True)
 
     return mtype
 
 
 def get_file_extension(mtype):
-    if re.match('text/html', mtype):
-        return 'html'
-    elif re.match('application/postscript', mtype):
-        return 'ps'
-    elif re.match('application/pdf', mtype):
-        return 'pdf'
-    elif re.match('text/plain', mtype):
-        return 'txt'
-    elif re.match('image/png', mtype):
-        return 'png'
-    return 'unkwn'
+    return FILE_EXTENSIONS.get(mtype, 'unkwn')
 
 def setup_logging(loglevel, logfile):
     leveldict = {'critical': logging.CRITICAL, 'error': logging.ERROR, \
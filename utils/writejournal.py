@@ -0,0 +1,228 @@
+"""Crash-safe writes for FileManager.
+
+Docs and metatags are written to a hidden temp file in their directory and
+renamed into place, so a crawler killed by -W or the OOM killer never leaves
+a truncated doc under its final name. Forcing every file to disk on its own
+would be slow on spinning disks, so the fsyncs are batched: the first write
+into a directory since the last flush is recorded in a journal of the process
+(<datadir>/stats/journal/<host>-<pid>.jsonl, fsynced), and flush(), called
+when a day is done, fsyncs the files written and their directories once and
+empties the journal.
+
+Every doc begun and every doc renamed into place is appended to the journal
+as well, without an fsync of its own. A journal that is left behind by a
+process that is gone names the directories whose recent writes may not have
+reached the disk and the docs that were still being written. recover() moves
+the leftover temp files there and the docs still pending that are incomplete
+to <datadir>/quarantine, and removes the journal. Docs that were renamed into
+place are left alone. The crawler then sees the quarantined docs as missing
+and downloads them again.
+"""
+
+import os
+import json
+import errno
+import socket
+import logging
+import threading
+
+# leftovers of interrupted writes, see FileManager.new_tmpfile
+TMP_SUFFIX = '.part'
+
+# PDF readers look for %%EOF in the last 1KB, some writers append more
+PDF_TAIL_BYTES = 64 * 1024
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+def fsync_path(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def is_complete(filepath):
+    # cheap checks of the end of a doc for the formats that have one
+    size = os.path.getsize(filepath)
+    if size == 0:
+        return False
+
+    extension = filepath.rsplit('.', 1)[-1].lower()
+    if extension not in ('pdf', 'xml'):
+        return True
+
+    with open(filepath, 'rb') as f:
+        f.seek(max(0, size - PDF_TAIL_BYTES))
+        tail = f.read()
+    if extension == 'pdf':
+        return b'%%EOF' in tail
+    return tail.rstrip().endswith(b'</document>')
+
+def get_begun(begun, filepath):
+    # the entry filepath was begun under: its own path or, for a download
+    # whose extension is known only at the end, the path without it
+    if filepath in begun:
+        return filepath
+    base = os.path.splitext(filepath)[0]
+    if base in begun:
+        return base
+    return None
+
+class WriteJournal:
+    def __init__(self, journaldir):
+        self.journaldir = journaldir
+        self.hostname   = socket.gethostname()
+        self.logger     = logging.getLogger('judis.writejournal')
+        self.lock       = threading.Lock()
+
+        self.pid        = None
+        self.journal    = None
+        # directory -> files written into it since the last flush
+        self.dirty      = {}
+        # docs begun and not yet renamed into place
+        self.pending    = set()
+
+    def get_journal_path(self, pid):
+        return os.path.join(self.journaldir, '%s-%d.jsonl' % (self.hostname, pid))
+
+    def check_pid(self):
+        # the state of the parent is not carried into forked crawlers
+        if self.pid != os.getpid():
+            self.pid     = os.getpid()
+            self.journal = None
+            self.dirty   = {}
+            self.pending = set()
+
+    def append(self, records, sync):
+        if self.journal == None:
+            os.makedirs(self.journaldir, exist_ok = True)
+            self.journal = open(self.get_journal_path(self.pid), 'a')
+        for record in records:
+            self.journal.write(json.dumps(record) + '\n')
+        self.journal.flush()
+        if sync:
+            os.fsync(self.journal.fileno())
+
+    def begin(self, filepath):
+        # called before writing the temp file of filepath; only the first
+        # write into a directory since the last flush waits for an fsync
+        dirname = os.path.dirname(filepath)
+        with self.lock:
+            self.check_pid()
+            self.pending.add(filepath)
+            if dirname in self.dirty:
+                self.append([{'begin': filepath}], False)
+                return
+
+            self.append([{'dir': dirname}, {'begin': filepath}], True)
+            self.dirty[dirname] = []
+
+    def written(self, filepath):
+        # called once filepath is in place
+        dirname = os.path.dirname(filepath)
+        with self.lock:
+            self.check_pid()
+            self.dirty.setdefault(dirname, []).append(filepath)
+            begun = get_begun(self.pending, filepath)
+            if begun != None:
+                self.pending.discard(begun)
+                self.append([{'done': begun}], False)
+
+    def flush(self):
+        with self.lock:
+            self.check_pid()
+            dirty, self.dirty = self.dirty, {}
+
+            for dirname, filepaths in dirty.items():
+                for filepath in filepaths:
+                    try:
+                        fsync_path(filepath)
+                    except FileNotFoundError:
+                        # replaced or packed since
+                        pass
+                fsync_path(dirname)
+
+            if self.journal != None:
+                self.journal.truncate(0)
+                self.journal.flush()
+                os.fsync(self.journal.fileno())
+
+            # docs of other threads still being written stay journaled
+            records = []
+            for filepath in sorted(self.pending):
+                dirname = os.path.dirname(filepath)
+                if dirname not in self.dirty:
+                    records.append({'dir': dirname})
+                    self.dirty[dirname] = []
+                records.append({'begin': filepath})
+            if records:
+                self.append(records, True)
+
+    def quarantine(self, filepath, basedir, quarantinedir):
+        dest = os.path.join(quarantinedir, os.path.relpath(filepath, basedir))
+        os.makedirs(os.path.dirname(dest), exist_ok = True)
+        os.replace(filepath, dest)
+        self.logger.warning('Quarantined incomplete file %s', filepath)
+
+    def recover_dir(self, dirname, pending, basedir, quarantinedir):
+        quarantined = []
+        try:
+            filenames = os.listdir(dirname)
+        except FileNotFoundError:
+            return quarantined
+
+        for filename in filenames:
+            filepath = os.path.join(dirname, filename)
+            if not os.path.isfile(filepath):
+                continue
+            if filename.startswith('.') and filename.endswith(TMP_SUFFIX):
+                self.quarantine(filepath, basedir, quarantinedir)
+                quarantined.append(filepath)
+            elif get_begun(pending, filepath) != None and not is_complete(filepath):
+                self.quarantine(filepath, basedir, quarantinedir)
+                quarantined.append(filepath)
+        return quarantined
+
+    def recover(self, basedir, quarantinedir):
+        # run at startup, before any crawler writes; returns the paths of the
+        # files moved to quarantinedir
+        quarantined = []
+        if not os.path.isdir(self.journaldir):
+            return quarantined
+
+        for filename in sorted(os.listdir(self.journaldir)):
+            hostname, _, pid = filename.rsplit('.', 1)[0].rpartition('-')
+            if hostname != self.hostname or not pid.isdigit():
+                # journals of other nodes sharing the data directory
+                continue
+            pid = int(pid)
+            if pid == os.getpid() or is_alive(pid):
+                continue
+
+            journal_path = os.path.join(self.journaldir, filename)
+            dirs  = set()
+            begun = set()
+            done  = set()
+            with open(journal_path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if 'dir' in record:
+                        dirs.add(record['dir'])
+                    elif 'begin' in record:
+                        begun.add(record['begin'])
+                    elif 'done' in record:
+                        done.add(record['done'])
+
+            pending = begun - done
+            for dirname in sorted(dirs):
+                quarantined.extend(self.recover_dir(dirname, pending, basedir, quarantinedir))
+            os.remove(journal_path)
+        return quarantined
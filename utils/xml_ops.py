@@ -5,15 +5,17 @@ import datetime
 import logging
 import codecs
 from xml.dom import minidom, Node
-from .utils import MetaInfo
+from .utils import MetaInfo, replace_xml_illegal_chars
 
 def print_tag_file(filepath, feature):
     filehandle = codecs.open(filepath, 'w', 'utf8')
 
+    xmlstring = obj_to_xml('document', feature)
     filehandle.write('<?xml version="1.0" encoding="utf-8"?>\n')
-    filehandle.write(obj_to_xml('document', feature))
+    filehandle.write(xmlstring)
 
     filehandle.close()
+    return xmlstring
 
 def read_tag_file(filepath, relurl):
     filehandle = codecs.open(filepath, 'r', 'utf8')
@@ -55,7 +57,49 @@ def obj_to_xml(tagName, obj):
 
     return xmltags
 
+def obj_to_feature(obj):
+    # what xml_to_feature gives for the xml of obj_to_xml, without writing
+    # and parsing it: values are strings, a list of one is its item
+    if isinstance(obj, dict):
+        feature = {}
+        for k, newobj in obj.items():
+            if isinstance(newobj, list) and k != 'bench':
+                values = [obj_to_feature(o) for o in newobj]
+                if len(values) == 1:
+                    feature[k] = values[0]
+                elif values:
+                    feature[k] = values
+            elif isinstance(newobj, list):
+                feature[k] = obj_to_feature({'name': newobj})
+            elif isinstance(newobj,  datetime.datetime) or \
+                    isinstance(newobj, datetime.date):
+                feature[k] = obj_to_feature(date_to_xml(newobj))
+            else:
+                feature[k] = obj_to_feature(newobj)
+        if feature:
+            return feature
+        return ''
+
+    if type(obj) == int:
+        value = '%d' % obj
+    elif type(obj) == float:
+        value = '%f' % obj
+    else:
+        # end of lines are normalized by the xml parser
+        value = replace_xml_illegal_chars(str(obj))
+        value = value.replace('\r\n', '\n').replace('\r', '\n')
+    if value == '\n':
+        return ''
+    return value
+
 def xml_to_tagdict(docid, xmlstring):
+    feature = xml_to_feature(docid, xmlstring)
+    if feature == None:
+        return None
+    return feature_to_metainfo(feature)
+
+def xml_to_feature(docid, xmlstring):
+    # the tags as parsed from the xml, all values are strings
     try:
         xmlnode = minidom.parseString(xmlstring)
     except ExpatError as e:
@@ -63,14 +107,16 @@ def xml_to_tagdict(docid, xmlstring):
         logger.error('Err %s in xml reading of tagfile  %s' % (e, docid))
         return None
 
-    feature = xml_to_obj(xmlnode.childNodes[0])
+    return xml_to_obj(xmlnode.childNodes[0])
+
+def feature_to_metainfo(feature):
     metainfo = MetaInfo()
     for k, v in feature.items():
         if k == 'date':
             d = feature['date']
             metainfo['date'] = datetime.date(int(d['year']), int(d['month']), int(d['day']))
         else:
-            metainfo[k] = v    
+            metainfo.set_field(k, v)
 
     return metainfo 
 
@@ -107,7 +153,7 @@ def get_xml_tag(tagName, tagValue, escape = True):
     return xmltag
 
 def escape_xml(tagvalue):
-    return saxutils.escape(tagvalue)
+    return saxutils.escape(replace_xml_illegal_chars(tagvalue))
 
 def date_to_xml(dateobj):
     datedict =  {}
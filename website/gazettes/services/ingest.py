@@ -211,7 +211,7 @@ class IngestService:
 
         pdf_size = self.storage.size('raw', relurl)
         asset_fields = {
-            'has_pymupdf': self.storage.find('pymupdf', relurl) is not None,
+            'has_pymupdf': self.storage.exists('pymupdf', relurl),
             'has_pdf': pdf_size is not None,
             'pdf_bytes': pdf_size,
         }
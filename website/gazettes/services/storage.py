@@ -13,6 +13,11 @@ scraper can read the existing tree in place: list it in
 ``GAZETTE_DATA_ROOTS`` and the 658GB of PDFs and 886GB of pymupdf renderings
 never need to be copied or uploaded. Roots are searched in order, so a small
 writable root holding uploads can sit in front of a large read-only archive.
+
+Closed days may have been packed by the scraper into one zip per directory
+(``<root>/raw/<src>/<date>.pack.zip``, see ``egazette.utils.daypack``). An
+asset with no loose file is read from the pack of its day; it then has no
+path of its own, so callers that need one use ``exists()`` and ``open()``.
 """
 
 import glob
@@ -21,6 +26,8 @@ import re
 
 from django.conf import settings
 
+from egazette.utils import daypack
+
 # Subdirectory and canonical extension for each rendering. A None extension
 # means the extension varies and has to be discovered by globbing (raw files
 # are usually PDFs but the scraper stores whatever the source served).
@@ -82,34 +89,93 @@ class AssetStorage:
             write_root = settings.GAZETTE_WRITE_ROOT
         self.write_root = str(write_root)
 
+        self.packs = daypack.PackReader()
+
     # -- reading -----------------------------------------------------------
 
-    def _candidate_paths(self, kind, relurl):
+    def _loose_paths(self, root, kind, relurl):
         subdir, extension = ASSET_KINDS[kind]
-        for root in self.roots:
-            base = os.path.join(root, subdir, relurl)
-            if extension:
-                yield base + extension
-            else:
-                # Raw files keep whatever extension the download had. Sort so
-                # the choice is stable when a source served more than one.
-                for path in sorted(glob.glob(glob.escape(base) + '.*')):
-                    yield path
+        base = os.path.join(root, subdir, relurl)
+        if extension:
+            yield base + extension
+        else:
+            # Raw files keep whatever extension the download had. Sort so
+            # the choice is stable when a source served more than one.
+            for path in sorted(glob.glob(glob.escape(base) + '.*')):
+                yield path
+
+    def _packed_member(self, root, kind, relurl):
+        """(pack path, member name) of an asset in a day pack, or None."""
+        subdir, extension = ASSET_KINDS[kind]
+        dirname, name = os.path.split(os.path.join(root, subdir, relurl))
+        pack_path = daypack.get_pack_path(dirname)
+        members = self.packs.get_members(pack_path)
+        if not members:
+            return None
 
-    def find(self, kind, relurl):
-        """Absolute path to an asset, or None if no root has it."""
+        if extension:
+            candidates = [name + extension]
+        else:
+            candidates = sorted(m for m in members if m.startswith(name + '.'))
+        for member in candidates:
+            if member in members:
+                return pack_path, member
+        return None
+
+    def _locate(self, kind, relurl):
+        """('file', path) or ('pack', (pack path, member)), or None.
+
+        Within a root a loose file wins over the pack of its day: it is a doc
+        saved after the day was packed.
+        """
         relurl = validate_relurl(relurl)
-        for path in self._candidate_paths(kind, relurl):
-            if os.path.isfile(path):
-                return path
+        for root in self.roots:
+            for path in self._loose_paths(root, kind, relurl):
+                if os.path.isfile(path):
+                    return 'file', path
+            member = self._packed_member(root, kind, relurl)
+            if member is not None:
+                return 'pack', member
         return None
 
+    def find(self, kind, relurl):
+        """Absolute path to a loose asset, or None.
+
+        None also for an asset that is only in a day pack; use exists() to
+        tell whether a root has it at all.
+        """
+        location = self._locate(kind, relurl)
+        if location is None or location[0] != 'file':
+            return None
+        return location[1]
+
+    def exists(self, kind, relurl):
+        return self._locate(kind, relurl) is not None
+
+    def extension(self, kind, relurl):
+        """The asset's extension including the dot, or None."""
+        location = self._locate(kind, relurl)
+        if location is None:
+            return None
+        if location[0] == 'file':
+            return os.path.splitext(location[1])[1]
+        return os.path.splitext(location[1][1])[1]
+
+    def open(self, kind, relurl):
+        """A binary file object for the asset, or None."""
+        location = self._locate(kind, relurl)
+        if location is None:
+            return None
+        if location[0] == 'file':
+            return open(location[1], 'rb')
+        return self.packs.open(*location[1])
+
     def read(self, kind, relurl):
         """Asset contents as bytes, or None if it does not exist."""
-        path = self.find(kind, relurl)
-        if path is None:
+        handle = self.open(kind, relurl)
+        if handle is None:
             return None
-        with open(path, 'rb') as handle:
+        with handle:
             return handle.read()
 
     def read_text(self, kind, relurl, encoding='utf-8'):
@@ -119,10 +185,12 @@ class AssetStorage:
         return data.decode(encoding, errors='replace')
 
     def size(self, kind, relurl):
-        path = self.find(kind, relurl)
-        if path is None:
+        location = self._locate(kind, relurl)
+        if location is None:
             return None
-        return os.path.getsize(path)
+        if location[0] == 'file':
+            return os.path.getsize(location[1])
+        return self.packs.get_member(*location[1]).file_size
 
     # -- writing -----------------------------------------------------------
 
@@ -0,0 +1,79 @@
+import datetime
+import os
+import tempfile
+import time
+
+from django.test import SimpleTestCase
+
+from egazette.tools.rebuild_catalog import index_src
+from egazette.utils import utils
+from egazette.utils.file_storage import FileManager
+
+PDF = b'%PDF-1.4\n%%EOF\n'
+DAY = datetime.datetime(2024, 4, 10)
+
+
+def ts(days):
+    return time.mktime((DAY + datetime.timedelta(days=days)).timetuple())
+
+
+class FindRelurlsTests(SimpleTestCase):
+    # the catalog query must select what the walk of raw/ and metatags/
+    # in FileManager.find_matching_relurls did
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.storage = FileManager(tmpdir.name, False, False)
+
+        # relurl -> (raw mtime, meta mtime) in days from DAY
+        docs = {
+            'src1/2024-04-01/old': (-9, -9),
+            'src1/2024-04-01/rawold': (-9, 1),
+            'src1/2024-04-02/metaold': (1, -9),
+            'src1/2024-04-03/inside': (1, 2),
+            'src1/2024-04-03/edge': (0, 5),
+            'src1/2024-04-04/new': (9, 9),
+            'src1/2024-04-04/rawnew': (9, 1),
+            'src2/2024-04-03/other': (1, 1),
+        }
+        for relurl, (raw_days, meta_days) in docs.items():
+            self.storage.save_rawdoc('src1', relurl, None, PDF)
+            self.storage.save_metainfo('src1', relurl,
+                                       utils.MetaInfo({'subject': relurl}))
+            rawpath = os.path.join(self.storage.rawdir, relurl + '.pdf')
+            metapath = os.path.join(self.storage.metadir, relurl + '.xml')
+            os.utime(rawpath, (ts(raw_days), ts(raw_days)))
+            os.utime(metapath, (ts(meta_days), ts(meta_days)))
+        # raw doc without metatags
+        self.storage.save_rawdoc('src1', 'src1/2024-04-03/nometa', None, PDF)
+
+    def find(self, srcs, start, end):
+        start_ts = None if start is None else DAY + datetime.timedelta(days=start)
+        end_ts = None if end is None else DAY + datetime.timedelta(days=end)
+        return list(self.storage.find_matching_relurls(srcs, start_ts, end_ts))
+
+    def test_catalog_matches_the_walk(self):
+        windows = [(None, None), (0, None), (None, 0), (0, 5), (1, 2),
+                   (3, 4), (-20, 20)]
+        walked = {}
+        for srcs in ([], ['src1'], ['src2']):
+            for start, end in windows:
+                walked[(tuple(srcs), start, end)] = self.find(srcs, start, end)
+        self.assertFalse(self.storage.catalog.is_built())
+
+        for src in ('src1', 'src2'):
+            index_src(self.storage, src, False)
+        self.storage.catalog.set_built()
+
+        for (srcs, start, end), relurls in walked.items():
+            with self.subTest(srcs=srcs, start=start, end=end):
+                self.assertEqual(self.find(list(srcs), start, end), relurls)
+
+    def test_window_keeps_docs_with_either_time_inside(self):
+        relurls = self.find(['src1'], 0, 5)
+        self.assertEqual(relurls, ['src1/2024-04-01/rawold',
+                                   'src1/2024-04-02/metaold',
+                                   'src1/2024-04-03/edge',
+                                   'src1/2024-04-03/inside',
+                                   'src1/2024-04-04/rawnew'])
@@ -0,0 +1,48 @@
+import datetime
+import os
+import tempfile
+import time
+
+from django.test import SimpleTestCase
+
+from egazette.utils.crawlstate import CrawlState
+
+
+class ShouldVisitTests(SimpleTestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.state = CrawlState(os.path.join(tmpdir.name, 'crawlstate.db'))
+        self.today = datetime.date.today()
+
+    def finish(self, days_ago, complete=True):
+        dateobj = self.today - datetime.timedelta(days=days_ago)
+        self.state.finish_day('testsrc', dateobj, complete, 3)
+        return dateobj
+
+    def test_days_within_the_lookback_are_always_walked(self):
+        # a daily run walks its whole window even right after the last one
+        for days_ago in (0, 2, 10, 15):
+            dateobj = self.finish(days_ago)
+            self.assertTrue(self.state.should_visit('testsrc', dateobj))
+
+    def test_lookback_of_the_source(self):
+        dateobj = self.finish(10)
+        self.assertFalse(self.state.should_visit('testsrc', dateobj,
+                                                 always_visit_days=5))
+
+    def test_older_completed_days_are_skipped(self):
+        dateobj = self.finish(200)
+        self.assertFalse(self.state.should_visit('testsrc', dateobj))
+        # until the decaying interval has passed
+        later = time.time() + 51 * 86400
+        self.assertTrue(self.state.should_visit('testsrc', dateobj, now=later))
+
+    def test_incomplete_days_are_walked_again(self):
+        dateobj = self.finish(200, complete=False)
+        self.assertTrue(self.state.should_visit('testsrc', dateobj))
+
+    def test_force_walks_everything(self):
+        dateobj = self.finish(200)
+        self.state.force = True
+        self.assertTrue(self.state.should_visit('testsrc', dateobj))
@@ -0,0 +1,298 @@
+import datetime
+import os
+import tempfile
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from egazette.utils import download, jobqueue
+
+
+class FakeSource:
+    # what the scheduler and crawl_worker use of a gazette object; days are
+    # recorded with the units of their host running at the time
+    def __init__(self, name, hostname, secs=0.0, tracker=None):
+        self.name = name
+        self.hostname = hostname
+        self.secs = secs
+        self.tracker = tracker
+
+    def sync_oneday(self, dateobj):
+        if self.tracker is not None:
+            self.tracker.start(self.hostname, self.name, dateobj)
+        time.sleep(self.secs)
+        if self.tracker is not None:
+            self.tracker.end(self.hostname)
+        return []
+
+
+class HostTracker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = {}
+        self.max_running = {}
+        self.days = []
+
+    def start(self, hostname, name, dateobj):
+        with self.lock:
+            self.running[hostname] = self.running.get(hostname, 0) + 1
+            self.max_running[hostname] = max(self.max_running.get(hostname, 0),
+                                             self.running[hostname])
+            self.days.append((name, dateobj))
+
+    def end(self, hostname):
+        with self.lock:
+            self.running[hostname] -= 1
+
+
+def get_dates(num_days):
+    last = datetime.date(2024, 4, 18)
+    return [last - datetime.timedelta(days=i) for i in range(num_days)]
+
+
+class UnitSchedulerTests(SimpleTestCase):
+    def setUp(self):
+        self.event = threading.Event()
+        self.srcobjs = [FakeSource('src0', 'a.gov.in'), FakeSource('src1', 'a.gov.in'),
+                        FakeSource('src2', 'b.gov.in')]
+
+    def test_units_are_claimed_in_order(self):
+        units = [(0, d) for d in get_dates(3)]
+        scheduler = download.UnitScheduler(self.srcobjs, units, 3)
+        self.assertEqual([scheduler.claim(self.event) for i in range(3)], [0, 1, 2])
+        self.assertIsNone(scheduler.claim(self.event))
+
+    def test_busy_host_is_skipped_not_moved(self):
+        dates = get_dates(2)
+        units = [(0, dates[0]), (1, dates[0]), (2, dates[0]), (0, dates[1])]
+        scheduler = download.UnitScheduler(self.srcobjs, units, 1)
+        self.assertEqual(scheduler.claim(self.event), 0)
+        # a.gov.in is busy, the unit of the other host is taken instead
+        self.assertEqual(scheduler.claim(self.event), 2)
+
+        scheduler.finish(0)
+        # the skipped unit is still first in line
+        self.assertEqual(scheduler.claim(self.event), 1)
+
+    def test_claim_waits_for_a_busy_host(self):
+        units = [(0, d) for d in get_dates(2)]
+        scheduler = download.UnitScheduler(self.srcobjs, units, 1)
+        self.assertEqual(scheduler.claim(self.event), 0)
+
+        claimed = []
+        t = threading.Thread(target=lambda: claimed.append(scheduler.claim(self.event)))
+        t.start()
+        time.sleep(0.2)
+        self.assertEqual(claimed, [])
+        scheduler.finish(0)
+        t.join(10)
+        self.assertEqual(claimed, [1])
+
+    def test_claim_stops_on_the_event(self):
+        units = [(0, d) for d in get_dates(2)]
+        scheduler = download.UnitScheduler(self.srcobjs, units, 1)
+        scheduler.claim(self.event)
+        self.event.set()
+        self.assertIsNone(scheduler.claim(self.event))
+
+    def test_spare_host_slots_are_lent(self):
+        units = [(0, d) for d in get_dates(2)]
+        scheduler = download.UnitScheduler(self.srcobjs, units, 2)
+        self.assertEqual(scheduler.claim(self.event), 0)
+
+        self.assertTrue(scheduler.try_acquire_host('a.gov.in'))
+        self.assertFalse(scheduler.try_acquire_host('a.gov.in'))
+        self.assertTrue(scheduler.try_acquire_host('b.gov.in'))
+
+        # the lent slot holds back the next unit of the host
+        claimed = []
+        t = threading.Thread(target=lambda: claimed.append(scheduler.claim(self.event)))
+        t.start()
+        time.sleep(0.2)
+        self.assertEqual(claimed, [])
+        scheduler.release_host('a.gov.in')
+        t.join(10)
+        self.assertEqual(claimed, [1])
+        self.assertFalse(scheduler.try_acquire_host('a.gov.in'))
+
+        scheduler.finish(0)
+        self.assertTrue(scheduler.try_acquire_host('a.gov.in'))
+
+    def test_workers_keep_to_the_host_limit(self):
+        tracker = HostTracker()
+        srcobjs = [FakeSource('src0', 'a.gov.in', 0.1, tracker),
+                   FakeSource('src1', 'a.gov.in', 0.1, tracker),
+                   FakeSource('src2', 'b.gov.in', 0.1, tracker)]
+        dates = get_dates(4)
+        units = [(0, d) for d in dates] + [(1, d) for d in dates] + [(2, d) for d in dates]
+        scheduler = download.UnitScheduler(srcobjs, units, 2)
+
+        workers = [threading.Thread(target=download.crawl_worker,
+                                    args=(srcobjs, scheduler, self.event))
+                   for i in range(4)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join(30)
+
+        self.assertEqual(sorted(tracker.days),
+                         sorted([(srcobjs[u[0]].name, u[1]) for u in units]))
+        self.assertLessEqual(tracker.max_running['a.gov.in'], 2)
+        # the idle workers took the units of the other host meanwhile
+        self.assertEqual(tracker.max_running['b.gov.in'], 2)
+
+
+class OrderUnitsByDeadlineTests(SimpleTestCase):
+    def setUp(self):
+        self.srcobjs = [FakeSource('src0', 'a.gov.in'), FakeSource('src1', 'b.gov.in'),
+                        FakeSource('src2', 'a.gov.in')]
+        self.dates = get_dates(3)
+
+    def order(self, units, durations, max_wait=120, num_workers=2, host_limit=2):
+        return download.order_units_by_deadline(self.srcobjs, units, max_wait,
+                                                num_workers, host_limit, durations)
+
+    def test_newest_dates_first_without_durations(self):
+        # oldest first, as get_work_units makes them
+        units = [(0, d) for d in reversed(self.dates)] + \
+                [(1, d) for d in reversed(self.dates)]
+        planned, deferred = self.order(units, {})
+
+        # a minute a unit, four fit into 2 workers * 120 secs
+        d0, d1, d2 = self.dates
+        self.assertEqual(planned, [(0, d0), (1, d0), (0, d1), (1, d1)])
+        self.assertEqual(deferred, [(0, d2), (1, d2)])
+
+    def test_durations_of_earlier_runs(self):
+        units = [(0, d) for d in self.dates] + [(1, d) for d in self.dates]
+        planned, deferred = self.order(units, {'src0': 100, 'src1': 10})
+
+        d0, d1, d2 = self.dates
+        # longest first within a date; the last src0 day would overrun
+        self.assertEqual(planned, [(0, d0), (1, d0), (0, d1), (1, d1), (1, d2)])
+        self.assertEqual(deferred, [(0, d2)])
+
+    def test_unknown_source_gets_the_median(self):
+        units = [(0, self.dates[0]), (1, self.dates[0])]
+        planned, deferred = self.order(units, {'src0': 200}, num_workers=1,
+                                       max_wait=250)
+        # src1 is taken to need 200 secs as well
+        self.assertEqual(planned, [(0, self.dates[0])])
+        self.assertEqual(deferred, [(1, self.dates[0])])
+
+    def test_host_budget(self):
+        # src0 and src2 share a.gov.in, which runs one unit at a time
+        units = [(0, d) for d in self.dates] + [(2, d) for d in self.dates] + \
+                [(1, d) for d in self.dates]
+        planned, deferred = self.order(units, {}, max_wait=120, num_workers=4,
+                                       host_limit=1)
+
+        d0, d1, d2 = self.dates
+        self.assertEqual([u for u in planned if u[0] != 1], [(0, d0), (2, d0)])
+        self.assertEqual([u for u in planned if u[0] == 1], [(1, d0), (1, d1)])
+        self.assertEqual(sorted(deferred), sorted([(0, d1), (0, d2), (2, d1), (2, d2),
+                                                   (1, d2)]))
+
+    def test_ranges_cost_their_days(self):
+        start = datetime.datetime(2024, 4, 1)
+        end = datetime.datetime(2024, 4, 4)
+        units = [(0, start, end), (1, self.dates[0])]
+        planned, deferred = self.order(units, {'src0': 30, 'src1': 30},
+                                       max_wait=100, num_workers=1)
+        # four days of src0 do not fit into 100 secs
+        self.assertEqual(planned, [(1, self.dates[0])])
+        self.assertEqual(deferred, [(0, start, end)])
+
+
+class FakeStorage:
+    def flush(self):
+        pass
+
+
+class FakeJobSource:
+    # a source for queue mode; sync runs the given function
+    def __init__(self, run):
+        self.name = 'testsrc'
+        self.hostname = 'a.gov.in'
+        self.storage_manager = FakeStorage()
+        self.run = run
+        self.calls = []
+
+    def sync(self, fromdate, todate, event):
+        self.calls.append((fromdate.date(), todate.date()))
+        return self.run(event)
+
+
+class QueueWorkerTests(SimpleTestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.dbpath = os.path.join(tmpdir.name, 'jobs.db')
+
+    def make_queue(self, max_attempts=3):
+        jobq = jobqueue.SqliteJobQueue(self.dbpath, max_attempts=max_attempts)
+        jobq.enqueue([('testsrc', '2024-04-12', '2024-04-18')])
+        return jobq
+
+    def get_job(self, jobq):
+        return jobq.get_conn().execute('SELECT state, worker, attempts, error '
+                                       'FROM jobs').fetchone()
+
+    def get_srcobj(self, srcobj):
+        return lambda name: srcobj if name == srcobj.name else None
+
+    def test_jobs_are_run_and_completed(self):
+        jobq = self.make_queue()
+        srcobj = FakeJobSource(lambda event: [])
+        download.queue_worker(jobq, self.get_srcobj(srcobj), None, 60, 0.1)
+        self.assertEqual(srcobj.calls,
+                         [(datetime.date(2024, 4, 12), datetime.date(2024, 4, 18))])
+        self.assertEqual(self.get_job(jobq)[0], 'done')
+
+    def test_raising_job_is_retried_then_failed(self):
+        def run(event):
+            raise ValueError('bad listing')
+
+        jobq = self.make_queue(max_attempts=2)
+        srcobj = FakeJobSource(run)
+        worker = jobqueue.get_worker_id()
+
+        job = jobq.claim(worker, 60)
+        with self.assertLogs('crawler.worker', 'ERROR'):
+            download.run_job(jobq, job, srcobj, worker, 60, None)
+        state, _, attempts, error = self.get_job(jobq)
+        self.assertEqual((state, attempts), ('pending', 1))
+        self.assertIn('bad listing', error)
+
+        with self.assertLogs('crawler.worker', 'ERROR'):
+            download.queue_worker(jobq, self.get_srcobj(srcobj), None, 60, 0.1)
+        self.assertEqual(len(srcobj.calls), 2)
+        self.assertEqual(self.get_job(jobq)[:3], ('failed', worker, 2))
+        self.assertEqual(jobq.counts(), {'failed': 1})
+
+    def test_lost_lease_stops_the_job(self):
+        jobq = self.make_queue()
+        stopped = []
+
+        def run(event):
+            # another worker takes the job over while this one runs
+            jobq.get_conn().execute("UPDATE jobs SET worker = 'other', lease_until = ?",
+                                    (time.time() + 60,))
+            stopped.append(event.wait(10))
+
+        srcobj = FakeJobSource(run)
+        with self.assertLogs('crawler.worker', 'WARNING') as logs:
+            # runs until the deadline, the job stays leased by the other
+            download.queue_worker(jobq, self.get_srcobj(srcobj), time.time() + 2,
+                                  0.3, 0.1)
+        self.assertEqual(stopped, [True])
+        self.assertTrue(any('Lost the lease' in line for line in logs.output))
+        # neither completed nor released by the worker that lost it
+        self.assertEqual(self.get_job(jobq)[:2], ('leased', 'other'))
+
+    def test_unknown_source_fails_the_job(self):
+        jobq = self.make_queue(max_attempts=1)
+        with self.assertLogs('crawler.worker', 'WARNING'):
+            download.queue_worker(jobq, lambda name: None, None, 60, 0.1)
+        self.assertEqual(self.get_job(jobq)[0], 'failed')
@@ -0,0 +1,73 @@
+import tempfile
+import threading
+import urllib.error
+
+from django.test import SimpleTestCase
+
+from egazette.srcs.basegazette import BaseGazette, WebResponse
+from egazette.utils import ratecontrol
+from egazette.utils.file_storage import FileManager
+
+
+class FailingGazette(BaseGazette):
+    # every fetch answers 404, which download_url does not retry
+    def __init__(self, storage):
+        BaseGazette.__init__(self, 'testsrc', storage)
+        self.hostname = 'example.gov.in'
+        self.rate_control = ratecontrol.RateController()
+        self.rate_control.initial_rate = 1000.0
+        self.fetches = 0
+        self.lock = threading.Lock()
+
+    def download_url_onetime(self, url, *args, **kwargs):
+        with self.lock:
+            self.fetches += 1
+        response = WebResponse()
+        response.set_error(urllib.error.HTTPError(url, 404, 'Not Found', {}, None))
+        return response
+
+
+class FailedRequestTests(SimpleTestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.gazette = FailingGazette(FileManager(tmpdir.name, False, False))
+
+    def run_with_timeout(self, func):
+        # a deadlock fails the test instead of hanging the run
+        thread = threading.Thread(target=func, daemon=True)
+        thread.start()
+        thread.join(10)
+        self.assertFalse(thread.is_alive(), 'crawler hung')
+
+    def test_failed_download_is_counted(self):
+        results = []
+        self.run_with_timeout(lambda: results.append(
+            self.gazette.download_url('http://example.gov.in/1.pdf')))
+        self.assertEqual(results, [None])
+        self.assertEqual(self.gazette.num_failed_requests, 1)
+
+    def test_failures_in_batch_threads_are_counted(self):
+        self.gazette.max_parallel_gazettes = 4
+
+        def save_all():
+            with self.gazette.gazette_batch() as batch:
+                for i in range(8):
+                    batch.save_gazette('testsrc/2024-04-18/%d' % i,
+                                       'http://example.gov.in/%d.pdf' % i, None)
+            self.relurls = batch.relurls
+
+        self.run_with_timeout(save_all)
+        self.assertEqual(self.relurls, [])
+        self.assertEqual(self.gazette.fetches, 8)
+        self.assertEqual(self.gazette.num_failed_requests, 8)
+
+    def test_serial_batch_failures_are_counted(self):
+        def save_all():
+            with self.gazette.gazette_batch() as batch:
+                for i in range(3):
+                    batch.save_gazette('testsrc/2024-04-18/%d' % i,
+                                       'http://example.gov.in/%d.pdf' % i, None)
+
+        self.run_with_timeout(save_all)
+        self.assertEqual(self.gazette.num_failed_requests, 3)
@@ -0,0 +1,53 @@
+import io
+import unittest
+
+from django.test import SimpleTestCase
+
+try:
+    from PIL import Image
+    from egazette.gvision import split_jpegs
+except ImportError:
+    split_jpegs = None
+
+
+def make_jpeg(color, size=(48, 32)):
+    f = io.BytesIO()
+    Image.new('RGB', size, color).save(f, 'JPEG')
+    return f.getvalue()
+
+
+@unittest.skipUnless(split_jpegs, 'needs Pillow and the gvision dependencies')
+class SplitJpegsTests(SimpleTestCase):
+    def setUp(self):
+        # a restart interval puts RST markers in the scan data
+        f = io.BytesIO()
+        Image.new('RGB', (64, 64), 'blue').save(f, 'JPEG', restart_marker_blocks=1)
+        self.images = [make_jpeg('red'), make_jpeg('green', (17, 9)),
+                       f.getvalue()]
+
+    def test_images_are_split_across_chunks(self):
+        stream = b''.join(self.images)
+        for chunk_size in (1, 2, 3, 7, 64, 1 << 20):
+            images = list(split_jpegs(io.BytesIO(stream), chunk_size=chunk_size))
+            self.assertEqual(images, self.images, 'chunk_size %d' % chunk_size)
+
+    def test_empty_stream(self):
+        self.assertEqual(list(split_jpegs(io.BytesIO(b''))), [])
+
+    def test_leading_garbage_is_rejected(self):
+        stream = io.BytesIO(b'Page 1\n' + b''.join(self.images))
+        with self.assertRaises(ValueError):
+            list(split_jpegs(stream, chunk_size=5))
+
+    def test_garbage_between_images_is_rejected(self):
+        stream = io.BytesIO(self.images[0] + b'%%[ warning ]%%\n' + self.images[1])
+        images = []
+        with self.assertRaises(ValueError):
+            for image in split_jpegs(stream, chunk_size=7):
+                images.append(image)
+        self.assertEqual(images, self.images[:1])
+
+    def test_truncated_image_is_rejected(self):
+        stream = io.BytesIO(self.images[0] + self.images[1][:-10])
+        with self.assertRaises(ValueError):
+            list(split_jpegs(stream, chunk_size=7))
@@ -0,0 +1,121 @@
+import os
+import tempfile
+import unittest
+
+from django.test import SimpleTestCase
+
+from egazette.utils.iacache import IAItemCache, get_metadata_changes
+
+try:
+    from egazette.iasync import GazetteIA
+except ImportError:
+    GazetteIA = None
+
+IDENTIFIER = 'in.gazette.testsrc.2024-04-18.1'
+METADATA = {
+    'collection': 'gazetteofindia',
+    'mediatype': 'texts',
+    'title': 'Test Gazette, 2024-04-18',
+    'date': '2024-04-18',
+    'subject': 'Notification',
+}
+
+
+class IAItemCacheTests(SimpleTestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.tmpdir = tmpdir.name
+        self.cache = IAItemCache(os.path.join(tmpdir.name, 'stats', 'iaitems.db'))
+
+    def test_created_item_keeps_its_metadata(self):
+        self.cache.add_files(IDENTIFIER, ['1.pdf', '1.xml'], METADATA)
+        exists, files, meta_hash = self.cache.get(IDENTIFIER)
+        self.assertTrue(exists)
+        self.assertEqual(files, {'1.pdf', '1.xml'})
+        self.assertEqual(self.cache.get_metadata(IDENTIFIER), METADATA)
+
+        changed = dict(METADATA, subject='Extraordinary')
+        self.assertEqual(get_metadata_changes(self.cache.get_metadata(IDENTIFIER),
+                                              changed),
+                         {'subject': 'Extraordinary'})
+
+    def test_update_merges_into_the_metadata(self):
+        self.cache.add_files(IDENTIFIER, ['1.pdf', '1.xml'], METADATA)
+        self.cache.add_files(IDENTIFIER, ['1_jpg.zip'])
+        self.cache.update_metadata(IDENTIFIER, {'ocr': 'tesseract'})
+
+        self.assertEqual(self.cache.get(IDENTIFIER)[1],
+                         {'1.pdf', '1.xml', '1_jpg.zip'})
+        self.assertEqual(self.cache.get_metadata(IDENTIFIER),
+                         dict(METADATA, ocr='tesseract'))
+        self.assertEqual(get_metadata_changes(self.cache.get_metadata(IDENTIFIER),
+                                              METADATA), {})
+
+    def test_update_without_metadata_is_not_stored(self):
+        # the rest of the metadata of the item is not known
+        self.cache.add_files(IDENTIFIER, ['1_jpg.zip'])
+        self.cache.update_metadata(IDENTIFIER, {'ocr': 'tesseract'})
+        self.assertIsNone(self.cache.get_metadata(IDENTIFIER))
+        self.assertIsNone(self.cache.get(IDENTIFIER)[2])
+
+
+@unittest.skipUnless(GazetteIA, 'needs the iasync dependencies')
+class OcrUploadTests(SimpleTestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.tmpdir = tmpdir.name
+        self.cache = IAItemCache(os.path.join(tmpdir.name, 'stats', 'iaitems.db'))
+
+        # gvisionobj is only checked for being set by send
+        self.gazette_ia = GazetteIA(object(), None, None, None, 'INFO', None,
+                                    item_cache=self.cache)
+        self.uploads = []
+        self.gazette_ia.ia_upload = self.fake_upload
+
+    def fake_upload(self, identifier, metadata, to_upload, files):
+        self.uploads.append((identifier, dict(metadata or {}), list(to_upload)))
+        return True
+
+    def ocr_outputs(self):
+        # send removes the OCR outputs once they are uploaded
+        paths = []
+        for name in ('1_jpg.zip', '1_chocr.html.gz'):
+            path = os.path.join(self.tmpdir, name)
+            with open(path, 'wb') as f:
+                f.write(b'ocr')
+            paths.append(path)
+        return paths
+
+    def test_ocr_upload_keeps_the_item_metadata(self):
+        self.cache.add_files(IDENTIFIER, ['1.pdf', '1.xml'], METADATA)
+        self.assertTrue(self.gazette_ia.send(IDENTIFIER, None, self.ocr_outputs(),
+                                             {'1.pdf', '1.xml'}))
+
+        sent = self.uploads[0][1]
+        self.assertEqual(set(sent.keys()), {'ocr', 'fts-ignore-ingestion-lang-filter'})
+
+        metadata = self.cache.get_metadata(IDENTIFIER)
+        self.assertEqual(metadata, dict(METADATA, **sent))
+        # a metadata check afterwards finds nothing to send
+        self.assertEqual(self.gazette_ia.get_metadata_changes(IDENTIFIER, METADATA), {})
+        changed = dict(METADATA, subject='Extraordinary')
+        self.assertEqual(self.gazette_ia.get_metadata_changes(IDENTIFIER, changed),
+                         {'subject': 'Extraordinary'})
+
+    def test_ocr_upload_into_an_unknown_item(self):
+        # the item was created without the cache, its metadata is not known
+        self.assertTrue(self.gazette_ia.send(IDENTIFIER, None, self.ocr_outputs(),
+                                             set()))
+        self.assertIsNone(self.cache.get_metadata(IDENTIFIER))
+        self.assertEqual(self.gazette_ia.get_metadata_changes(IDENTIFIER, METADATA),
+                         METADATA)
+
+    def test_created_item_stores_the_complete_metadata(self):
+        self.assertTrue(self.gazette_ia.send(IDENTIFIER, dict(METADATA),
+                                             self.ocr_outputs(), set()))
+        metadata = self.cache.get_metadata(IDENTIFIER)
+        self.assertEqual(metadata['title'], METADATA['title'])
+        self.assertIn('ocr', metadata)
+        self.assertEqual(self.gazette_ia.get_metadata_changes(IDENTIFIER, METADATA), {})
@@ -0,0 +1,30 @@
+import datetime
+import unittest
+
+from django.test import SimpleTestCase
+
+from egazette.utils import utils
+
+try:
+    from egazette.iasync import GazetteIA
+except ImportError:
+    GazetteIA = None
+
+
+@unittest.skipUnless(GazetteIA, 'needs the iasync dependencies')
+class IAMetadataTests(SimpleTestCase):
+    def test_illegal_xml_chars_are_replaced(self):
+        gazette_ia = GazetteIA(None, None, None, None, 'INFO', None)
+
+        metainfo = utils.MetaInfo()
+        metainfo.set_date(datetime.date(2024, 4, 18))
+        metainfo.set_field('gztype', 'Extra\x0bordinary')
+        metainfo.set_field('subject', 'Notification\x00 of\x1f rates')
+
+        metadata = gazette_ia.to_ia_metadata('central_weekly/2024-04-18/1', metainfo)
+        for k, v in metadata.items():
+            if isinstance(v, str):
+                self.assertEqual(v, utils.replace_xml_illegal_chars(v), k)
+        self.assertIn('Extra ordinary', metadata['title'])
+        self.assertIn('Notification  of  rates', metadata['description'])
+        self.assertEqual(metadata['language'], ['eng', 'hin'])
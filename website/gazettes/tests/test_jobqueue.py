@@ -0,0 +1,127 @@
+import os
+import tempfile
+import unittest
+
+from django.test import SimpleTestCase
+
+from egazette.utils import jobqueue
+
+try:
+    import fakeredis
+    import lupa  # noqa: F401, the claim and heartbeat scripts are Lua
+except ImportError:
+    fakeredis = None
+
+
+class JobQueueMixin:
+    # the same lifecycle against each queue; lease_secs of -1 leaves a
+    # lease that has already expired
+
+    def make_queue(self, max_attempts=3):
+        raise NotImplementedError
+
+    def get_state(self, queue, jobid):
+        raise NotImplementedError
+
+    def test_claim_hands_out_jobs_in_order(self):
+        queue = self.make_queue()
+        queue.enqueue([('src1', '2024-04-01', '2024-04-07'),
+                       ('src2', '2024-04-01', '2024-04-07')])
+        job1 = queue.claim('w1', 60)
+        job2 = queue.claim('w2', 60)
+        self.assertEqual((job1['src'], job1['fromdate'], job1['todate']),
+                         ('src1', '2024-04-01', '2024-04-07'))
+        self.assertEqual(job2['src'], 'src2')
+        self.assertIsNone(queue.claim('w3', 60))
+
+        queue.complete(job1['id'], 'w1')
+        self.assertEqual(self.get_state(queue, job1['id']), 'done')
+
+    def test_heartbeat_renews_only_the_holder(self):
+        queue = self.make_queue()
+        queue.enqueue([('src1', '2024-04-01', '2024-04-07')])
+        job = queue.claim('w1', 60)
+        self.assertTrue(queue.heartbeat(job['id'], 'w1', 60))
+        self.assertFalse(queue.heartbeat(job['id'], 'w2', 60))
+
+    def test_expired_lease_is_claimed_again(self):
+        queue = self.make_queue()
+        queue.enqueue([('src1', '2024-04-01', '2024-04-07')])
+        job = queue.claim('w1', -1)
+        again = queue.claim('w2', 60)
+        self.assertEqual(again['id'], job['id'])
+        # the first worker lost it
+        self.assertFalse(queue.heartbeat(job['id'], 'w1', 60))
+        self.assertTrue(queue.heartbeat(job['id'], 'w2', 60))
+
+    def test_expired_lease_fails_after_max_attempts(self):
+        queue = self.make_queue(max_attempts=2)
+        queue.enqueue([('src1', '2024-04-01', '2024-04-07')])
+        job = queue.claim('w1', -1)
+        self.assertEqual(queue.claim('w2', -1)['id'], job['id'])
+        # both attempts died without failing the job
+        self.assertIsNone(queue.claim('w3', 60))
+        self.assertEqual(self.get_state(queue, job['id']), 'failed')
+
+    def test_release_does_not_count_as_an_attempt(self):
+        queue = self.make_queue(max_attempts=1)
+        queue.enqueue([('src1', '2024-04-01', '2024-04-07')])
+        job = queue.claim('w1', 60)
+        queue.release(job['id'], 'w1')
+        self.assertEqual(self.get_state(queue, job['id']), 'pending')
+        job = queue.claim('w2', 60)
+        self.assertIsNotNone(job)
+        queue.fail(job['id'], 'w2', 'boom')
+        self.assertEqual(self.get_state(queue, job['id']), 'failed')
+
+    def test_fail_retries_until_max_attempts(self):
+        queue = self.make_queue(max_attempts=2)
+        queue.enqueue([('src1', '2024-04-01', '2024-04-07')])
+        job = queue.claim('w1', 60)
+        queue.fail(job['id'], 'w1', 'boom')
+        self.assertEqual(self.get_state(queue, job['id']), 'pending')
+
+        job = queue.claim('w2', 60)
+        queue.fail(job['id'], 'w2', 'boom')
+        self.assertEqual(self.get_state(queue, job['id']), 'failed')
+        self.assertIsNone(queue.claim('w3', 60))
+
+
+class SqliteJobQueueTests(JobQueueMixin, SimpleTestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.dbpath = os.path.join(tmpdir.name, 'jobs.db')
+
+    def make_queue(self, max_attempts=3):
+        return jobqueue.SqliteJobQueue(self.dbpath, max_attempts=max_attempts)
+
+    def get_state(self, queue, jobid):
+        row = queue.get_conn().execute('SELECT state FROM jobs WHERE id = ?',
+                                       (jobid,)).fetchone()
+        return row[0]
+
+    def test_counts(self):
+        queue = self.make_queue()
+        queue.enqueue([('src1', '2024-04-01', '2024-04-07'),
+                       ('src2', '2024-04-01', '2024-04-07')])
+        queue.claim('w1', 60)
+        self.assertEqual(queue.counts(), {'pending': 1, 'leased': 1})
+
+
+@unittest.skipUnless(fakeredis, 'needs fakeredis and lupa')
+class RedisJobQueueTests(JobQueueMixin, SimpleTestCase):
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+
+    def make_queue(self, max_attempts=3):
+        queue = jobqueue.RedisJobQueue('redis://localhost', max_attempts=max_attempts)
+        client = fakeredis.FakeRedis(server=self.server, decode_responses=True)
+        queue.client = client
+        queue.client_pid = os.getpid()
+        queue.claim_script = client.register_script(jobqueue.REDIS_CLAIM)
+        queue.heartbeat_script = client.register_script(jobqueue.REDIS_HEARTBEAT)
+        return queue
+
+    def get_state(self, queue, jobid):
+        return queue.client.hget(queue.job_key(jobid), 'state')
@@ -0,0 +1,103 @@
+import datetime
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.test import SimpleTestCase
+
+from egazette.srcs.basegazette import Downloader
+from egazette.utils.listingcache import ListingCache
+
+LISTING = b'<html><body><a href="/gazettes/1.pdf">Gazette 1</a></body></html>'
+
+
+class ListingHandler(BaseHTTPRequestHandler):
+    etag = '"v1"'
+
+    def do_GET(self):
+        self.server.requests.append(self.headers.get('If-None-Match'))
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.send_header('ETag', self.etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(LISTING)))
+        self.end_headers()
+        self.wfile.write(LISTING)
+
+    def log_message(self, *args):
+        pass
+
+
+class ConditionalListingTests(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ListingHandler)
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.dbpath = os.path.join(tmpdir.name, 'listingcache.db')
+        self.url = 'http://127.0.0.1:%d/listing' % self.server.server_port
+        self.dateobj = datetime.date(2024, 4, 18)
+
+    def crawl(self, scope, parsed):
+        # a run of a scraper that fetches its listing with cached=True and
+        # skips the gazettes of a date whose listing is unchanged
+        downloader = Downloader('testsrc', None)
+        downloader.listing_cache = ListingCache(self.dbpath)
+        response = downloader.download_listing(self.url, scope, cached=True)
+        self.assertEqual(response.webpage, LISTING)
+        if not response.unchanged:
+            parsed.append(scope)
+        downloader.listing_cache.mark_processed(downloader.pending_listings)
+        return response
+
+    def test_cached_listing_is_fetched_conditionally(self):
+        parsed = []
+        self.crawl(self.dateobj, parsed)
+        self.assertEqual(self.server.requests, [None])
+
+        response = self.crawl(self.dateobj, parsed)
+        # the second run sent the ETag, got a 304 and skipped the date
+        self.assertEqual(self.server.requests, [None, '"v1"'])
+        self.assertTrue(response.unchanged)
+        self.assertEqual(parsed, [self.dateobj])
+
+    def test_304_still_serves_a_new_scope(self):
+        parsed = []
+        self.crawl(self.dateobj, parsed)
+        other = self.dateobj + datetime.timedelta(days=1)
+        response = self.crawl(other, parsed)
+        # not modified, but the other date was never processed against it
+        self.assertEqual(self.server.requests, [None, '"v1"'])
+        self.assertFalse(response.unchanged)
+        self.assertEqual(parsed, [self.dateobj, other])
+
+    def test_changed_listing_is_parsed_again(self):
+        parsed = []
+        self.crawl(self.dateobj, parsed)
+        ListingHandler.etag = '"v2"'
+        self.addCleanup(setattr, ListingHandler, 'etag', '"v1"')
+        global LISTING
+        old = LISTING
+        LISTING = old.replace(b'Gazette 1', b'Gazette 2')
+        self.addCleanup(globals().__setitem__, 'LISTING', old)
+
+        response = self.crawl(self.dateobj, parsed)
+        self.assertEqual(self.server.requests, [None, '"v1"'])
+        self.assertFalse(response.unchanged)
+        self.assertEqual(parsed, [self.dateobj, self.dateobj])
+
+    def test_304_is_not_a_failed_fetch(self):
+        parsed = []
+        self.crawl(self.dateobj, parsed)
+        with self.assertNoLogs('crawler.testsrc', 'WARNING'):
+            with self.assertLogs('crawler.testsrc', 'DEBUG') as logs:
+                self.crawl(self.dateobj, parsed)
+        self.assertIn('DEBUG:crawler.testsrc:Not modified: %s' % self.url, logs.output)
@@ -0,0 +1,78 @@
+import datetime
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+
+from egazette.utils import utils, xml_ops
+from egazette.utils.file_storage import FileManager
+from egazette.utils.metastore import MetaStore
+
+
+def parse(metainfo):
+    xmlstring = xml_ops.obj_to_xml('document', metainfo)
+    return xml_ops.xml_to_feature('r', xmlstring.encode('utf-8'))
+
+
+class ObjToFeatureTests(SimpleTestCase):
+    # the metastore record is built from the metainfo, it must be what the
+    # XML written for it parses into
+
+    def check(self, fields):
+        metainfo = utils.MetaInfo(fields)
+        self.assertEqual(xml_ops.obj_to_feature(metainfo), parse(metainfo))
+
+    def test_strings(self):
+        self.check({'subject': 'Rates & <charges>', 'empty': '', 'newline': '\n',
+                    'crlf': 'a\r\nb', 'illegal': 'a\x01b', 'hindi': 'हिंदी'})
+
+    def test_numbers_dates_and_none(self):
+        self.check({'num': 5, 'fraction': 1.5, 'none': None,
+                    'date': datetime.date(2024, 4, 18),
+                    'ts': datetime.datetime(2024, 4, 18, 10, 30)})
+
+    def test_lists_and_dicts(self):
+        self.check({'many': ['a', 'b'], 'one': ['a'], 'none': [],
+                    'bench': ['j1', 'j2'], 'nested': {'x': '1', 'y': {'z': '2'}},
+                    'emptydict': {}})
+
+
+class MetaStoreTests(SimpleTestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.datadir = tmpdir.name
+
+    def test_saved_metainfo_is_read_back_from_the_segment(self):
+        storage = FileManager(self.datadir, True, False)
+        metainfo = utils.MetaInfo({'subject': 'Notification'})
+        metainfo['date'] = datetime.date(2024, 4, 18)
+        storage.save_metainfo('testsrc', 'testsrc/2024-04-18/1', metainfo)
+
+        metapath = os.path.join(storage.metadir, 'testsrc/2024-04-18/1.xml')
+        tags = storage.metastore.get('testsrc/2024-04-18/1',
+                                     os.path.getmtime(metapath))
+        self.assertEqual(tags, parse(metainfo))
+        self.assertEqual(storage.get_metainfo('testsrc/2024-04-18/1')['date'],
+                         datetime.date(2024, 4, 18))
+
+    def test_compact_keeps_the_last_record(self):
+        store = MetaStore(os.path.join(self.datadir, 'metastore'))
+        store.append('testsrc/2024-04-18/1', 1.0, {'v': 'old'})
+        store.append('testsrc/2024-04-18/2', 1.0, {'v': 'two'})
+        store.append('testsrc/2024-04-18/1', 2.0, {'v': 'new'})
+
+        self.assertEqual(store.compact_src('testsrc'), 1)
+        self.assertEqual(store.get('testsrc/2024-04-18/1', 2.0), {'v': 'new'})
+        self.assertEqual(store.get('testsrc/2024-04-18/2', 1.0), {'v': 'two'})
+        segpath = store.get_segment_path('testsrc/2024-04-18/1')
+        with open(segpath) as f:
+            self.assertEqual(len(f.readlines()), 2)
+        # nothing left to drop
+        self.assertEqual(store.compact(segpath), 0)
+
+    def test_compact_skips_rewritten_days(self):
+        store = MetaStore(os.path.join(self.datadir, 'metastore'))
+        store.append('testsrc/2024-04-18/1', 1.0, {'v': 'old'})
+        store.append('testsrc/2024-04-18/1', 2.0, {'v': 'new'})
+        self.assertEqual(store.compact_src('testsrc', skip={'testsrc/2024-04-18'}), 0)
@@ -0,0 +1,63 @@
+from django.test import SimpleTestCase
+
+from egazette.utils import ratecontrol
+
+
+class RateControllerTests(SimpleTestCase):
+    def setUp(self):
+        self.control = ratecontrol.RateController(['example.gov.in'])
+
+    def rate(self):
+        return self.control.get_stats()['example.gov.in']['rate']
+
+    def test_mixed_fast_and_slow_ok_responses_do_not_slow_down(self):
+        # Listing pages that answer in 0.2s and postbacks that take 3s are
+        # both healthy answers; the slow ones must not drag the rate down.
+        for i in range(50):
+            latency = 3.0 if i % 2 else 0.2
+            self.control.record('example.gov.in', latency, status=200,
+                                num_bytes=20000)
+        self.assertAlmostEqual(self.rate(), self.control.initial_rate +
+                               50 * self.control.increase_step)
+
+    def test_ok_responses_grow_the_rate_additively(self):
+        for i in range(4):
+            self.control.record('example.gov.in', 0.5, status=200)
+        self.assertAlmostEqual(self.rate(), self.control.initial_rate +
+                               4 * self.control.increase_step)
+
+    def test_throttling_halves_the_rate(self):
+        self.control.record('example.gov.in', 0.5, status=429)
+        self.assertAlmostEqual(self.rate(), self.control.initial_rate / 2)
+        self.control.record('example.gov.in', 0.5, status=503)
+        self.assertAlmostEqual(self.rate(), self.control.initial_rate / 4)
+
+    def test_timeout_is_throttling(self):
+        self.control.record('example.gov.in', 30.0, error=True)
+        self.assertAlmostEqual(self.rate(), self.control.initial_rate / 2)
+        stats = self.control.get_stats()['example.gov.in']
+        self.assertEqual(stats['throttled'], 1)
+
+    def test_other_errors_keep_the_rate(self):
+        self.control.record('example.gov.in', 0.5, status=404, error=True)
+        self.assertAlmostEqual(self.rate(), self.control.initial_rate)
+        self.assertEqual(self.control.get_stats()['example.gov.in']['errors'], 1)
+
+    def test_rate_recovers_after_429s(self):
+        for i in range(20):
+            self.control.record('example.gov.in', 0.5, status=429)
+        self.assertAlmostEqual(self.rate(), round(self.control.min_rate, 3))
+        for i in range(20):
+            self.control.record('example.gov.in', 3.0, status=200)
+        self.assertGreater(self.rate(), 5.0)
+
+    def test_retry_delay_honours_retry_after(self):
+        delay = self.control.get_retry_delay(5, 300, 1, retry_after='120')
+        self.assertEqual(delay, 120)
+        delay = self.control.get_retry_delay(5, 300, 1, retry_after='3600')
+        self.assertEqual(delay, 300)
+
+    def test_retry_delay_grows_exponentially(self):
+        delay = self.control.get_retry_delay(5, 300, 3)
+        self.assertGreaterEqual(delay, 10)
+        self.assertLessEqual(delay, 20)
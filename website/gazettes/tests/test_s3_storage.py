@@ -0,0 +1,156 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from django.test import SimpleTestCase
+
+from egazette.utils import utils
+from egazette.utils.file_storage import FileManager, LocalBackend
+
+try:
+    import boto3
+    from moto import mock_aws
+except ImportError:
+    boto3 = None
+
+from egazette.utils.s3_storage import S3Backend
+
+PDF = b'%PDF-1.4\n1 0 obj\n<< >>\nendobj\ntrailer\n<< >>\n%%EOF\n'
+RELURL = 'testsrc/2024-04-18/1'
+
+
+def make_metainfo():
+    metainfo = utils.MetaInfo()
+    metainfo.set_field('gzid', '1')
+    metainfo.set_field('subject', 'Notification')
+    return metainfo
+
+
+class StorageBackendMixin:
+    # the same FileManager calls against each backend
+
+    def make_storage(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.datadir = tmpdir.name
+
+    def test_saved_docs_are_found(self):
+        storage = self.make_storage()
+        self.assertFalse(storage.has_rawfile(RELURL))
+        self.assertTrue(storage.save_rawdoc('testsrc', RELURL, None, PDF))
+        self.assertTrue(storage.save_metainfo('testsrc', RELURL, make_metainfo()))
+
+        self.assertTrue(storage.has_rawfile(RELURL))
+        self.assertTrue(storage.has_metainfo(RELURL))
+        self.assertEqual(storage.get_metainfo(RELURL)['subject'], 'Notification')
+        self.assertIsNotNone(storage.get_raw_mtime(RELURL))
+
+        f, extension = storage.open_rawdoc(RELURL)
+        self.assertEqual(extension, 'pdf')
+        self.assertEqual(f.read(), PDF)
+        f.close()
+
+        with open(storage.get_rawfile_path(RELURL), 'rb') as f:
+            self.assertEqual(f.read(), PDF)
+
+        doc = storage.catalog.get_doc(RELURL)
+        self.assertEqual(doc[0], 'pdf')
+        self.assertEqual(doc[1], len(PDF))
+
+    def test_streamed_doc(self):
+        storage = self.make_storage()
+        tmpfile = storage.new_raw_tmpfile(RELURL)
+        tmpfile.write(PDF)
+        tmpfile.close()
+        self.assertTrue(storage.save_rawfile('testsrc', RELURL, tmpfile.name, PDF[:16]))
+        self.assertFalse(os.path.exists(tmpfile.name))
+
+        f, extension = storage.open_rawdoc(RELURL)
+        self.assertEqual(f.read(), PDF)
+        f.close()
+
+    def test_existing_docs_are_not_overwritten(self):
+        storage = self.make_storage()
+        storage.save_rawdoc('testsrc', RELURL, None, PDF)
+        self.assertFalse(storage.save_rawdoc('testsrc', RELURL, None, PDF + b'\n'))
+        self.assertFalse(storage.should_download_raw(RELURL, None))
+
+    def test_find_matching_relurls_walks_the_docs(self):
+        storage = self.make_storage()
+        for relurl in (RELURL, 'testsrc/2024-04-19/2', 'othersrc/2024-04-18/3'):
+            storage.save_rawdoc('testsrc', relurl, None, PDF)
+            storage.save_metainfo('testsrc', relurl, make_metainfo())
+        # no metatags, not a complete doc
+        storage.save_rawdoc('testsrc', 'testsrc/2024-04-19/4', None, PDF)
+
+        self.assertEqual(list(storage.find_matching_relurls(['testsrc'], None, None)),
+                         [RELURL, 'testsrc/2024-04-19/2'])
+
+
+class LocalStorageTests(StorageBackendMixin, SimpleTestCase):
+    def make_storage(self):
+        return FileManager(self.datadir, False, False)
+
+    def test_default_backend_is_local(self):
+        storage = self.make_storage()
+        self.assertIsInstance(storage.backend, LocalBackend)
+        storage.save_rawdoc('testsrc', RELURL, None, PDF)
+        self.assertTrue(os.path.exists(os.path.join(self.datadir, 'raw',
+                                                    RELURL + '.pdf')))
+
+
+@unittest.skipUnless(boto3, 'needs boto3 and moto')
+class S3StorageTests(StorageBackendMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        mock = mock_aws()
+        mock.start()
+        self.addCleanup(mock.stop)
+        self.client = boto3.client('s3', region_name='us-east-1',
+                                   aws_access_key_id='test',
+                                   aws_secret_access_key='test')
+        self.client.create_bucket(Bucket='gazettes')
+
+    def make_storage(self, datadir=None):
+        backend = S3Backend(datadir or self.datadir, 'gazettes', 'india',
+                            client=self.client)
+        return FileManager(datadir or self.datadir, False, False, backend=backend)
+
+    def test_docs_are_objects(self):
+        storage = self.make_storage()
+        storage.save_rawdoc('testsrc', RELURL, None, PDF)
+        storage.save_metainfo('testsrc', RELURL, make_metainfo())
+
+        keys = [item['Key'] for item in
+                self.client.list_objects_v2(Bucket='gazettes')['Contents']]
+        self.assertEqual(sorted(keys), ['india/metatags/%s.xml' % RELURL,
+                                        'india/raw/%s.pdf' % RELURL])
+        head = self.client.head_object(Bucket='gazettes',
+                                       Key='india/raw/%s.pdf' % RELURL)
+        self.assertEqual(head['ContentType'], 'application/pdf')
+        # raw docs are not kept on the local disk
+        self.assertFalse(os.path.exists(os.path.join(self.datadir, 'raw',
+                                                     RELURL + '.pdf')))
+
+    def test_fresh_cache_reads_from_the_store(self):
+        self.make_storage().save_rawdoc('testsrc', RELURL, None, PDF)
+        self.make_storage().save_metainfo('testsrc', RELURL, make_metainfo())
+
+        # another machine, with an empty datadir
+        otherdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, otherdir)
+        storage = self.make_storage(otherdir)
+        self.assertTrue(storage.has_rawfile(RELURL))
+        self.assertTrue(storage.has_metainfo(RELURL))
+        self.assertFalse(storage.has_rawfile('testsrc/2024-04-18/2'))
+        self.assertEqual(storage.get_metainfo(RELURL)['subject'], 'Notification')
+        self.assertIsNotNone(storage.get_meta_mtime(RELURL))
+
+    def test_blob_store_needs_a_local_backend(self):
+        backend = S3Backend(self.datadir, 'gazettes', 'india', client=self.client)
+        with self.assertRaises(ValueError):
+            FileManager(self.datadir, False, False, dedup=True, backend=backend)
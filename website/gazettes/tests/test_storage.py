@@ -1,8 +1,12 @@
 import os
 import tempfile
+from unittest import mock
 
 from django.test import SimpleTestCase
 
+from egazette.utils import daypack
+from egazette.utils.file_storage import FileManager
+
 from gazettes.services.storage import (
     AssetStorage,
     InvalidRelurl,
@@ -112,3 +116,90 @@ class AssetStorageTests(SimpleTestCase):
         self.storage.save('html', 'andhra/2018/4', b'first')
         self.storage.save('html', 'andhra/2018/4', b'second')
         self.assertEqual(self.storage.read('html', 'andhra/2018/4'), b'second')
+
+    def _pack(self, root, kind, daydir):
+        daypack.pack_dir(os.path.join(root, kind, daydir))
+
+    def test_reads_from_a_day_pack(self):
+        # The scraper packs closed days into one zip per directory.
+        self._write(self.first, 'raw', 'andhra/2018-05-04/1.pdf', 'pdf bytes')
+        self._write(self.first, 'html', 'andhra/2018-05-04/1.html', '<p>1</p>')
+        self._pack(self.first, 'raw', 'andhra/2018-05-04')
+        self._pack(self.first, 'html', 'andhra/2018-05-04')
+
+        self.assertFalse(
+            os.path.exists(os.path.join(self.first, 'raw', 'andhra/2018-05-04'))
+        )
+        self.assertEqual(self.storage.read('raw', 'andhra/2018-05-04/1'),
+                         b'pdf bytes')
+        self.assertEqual(self.storage.read_text('html', 'andhra/2018-05-04/1'),
+                         '<p>1</p>')
+        self.assertEqual(self.storage.size('raw', 'andhra/2018-05-04/1'), 9)
+        self.assertEqual(self.storage.extension('raw', 'andhra/2018-05-04/1'),
+                         '.pdf')
+
+    def test_packed_asset_has_no_path(self):
+        self._write(self.first, 'raw', 'andhra/2018-05-04/1.pdf', 'pdf bytes')
+        self._pack(self.first, 'raw', 'andhra/2018-05-04')
+
+        self.assertIsNone(self.storage.find('raw', 'andhra/2018-05-04/1'))
+        self.assertTrue(self.storage.exists('raw', 'andhra/2018-05-04/1'))
+        self.assertFalse(self.storage.exists('raw', 'andhra/2018-05-04/2'))
+        with self.storage.open('raw', 'andhra/2018-05-04/1') as handle:
+            self.assertEqual(handle.read(), b'pdf bytes')
+
+    def test_loose_file_wins_over_the_pack(self):
+        # A doc saved after its day was packed stays loose until the next pack.
+        self._write(self.first, 'html', 'andhra/2018-05-04/1.html', 'packed')
+        self._pack(self.first, 'html', 'andhra/2018-05-04')
+        self._write(self.first, 'html', 'andhra/2018-05-04/1.html', 'loose')
+
+        self.assertEqual(self.storage.read_text('html', 'andhra/2018-05-04/1'),
+                         'loose')
+
+
+class PackDirTests(SimpleTestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.daydir = os.path.join(self.datadir, 'raw', 'andhra', '2018-05-04')
+        os.makedirs(self.daydir)
+        for name in ('1.pdf', '2.pdf'):
+            with open(os.path.join(self.daydir, name), 'wb') as handle:
+                handle.write(b'%PDF ' + name.encode())
+
+    def test_packs_and_removes_the_files(self):
+        self.assertEqual(daypack.pack_dir(self.daydir), ['1.pdf', '2.pdf'])
+        self.assertFalse(os.path.exists(self.daydir))
+        members = daypack.PackReader().get_members(daypack.get_pack_path(self.daydir))
+        self.assertEqual(sorted(members), ['1.pdf', '2.pdf'])
+
+    def test_file_rewritten_while_packing_is_kept(self):
+        # A crawler saves 1.pdf again after it went into the zip; the new
+        # doc must survive until the next pack.
+        pack_file = daypack.pack_file
+
+        def pack_then_rewrite(out, filepath, filename):
+            stat = pack_file(out, filepath, filename)
+            if filename == '1.pdf':
+                tmppath = filepath + '.new'
+                with open(tmppath, 'wb') as handle:
+                    handle.write(b'%PDF newer')
+                os.replace(tmppath, filepath)
+            return stat
+
+        with mock.patch.object(daypack, 'pack_file', pack_then_rewrite):
+            daypack.pack_dir(self.daydir)
+
+        self.assertEqual(os.listdir(self.daydir), ['1.pdf'])
+        with open(os.path.join(self.daydir, '1.pdf'), 'rb') as handle:
+            self.assertEqual(handle.read(), b'%PDF newer')
+
+    def test_relurls_skip_temp_files(self):
+        # a pack being written and a doc being saved
+        srcdir = os.path.dirname(self.daydir)
+        open(os.path.join(srcdir, '2018-05-05.pack.zip.tmp.123'), 'wb').close()
+        open(os.path.join(self.daydir, '.3.pdf.abc.part'), 'wb').close()
+
+        storage = FileManager(self.datadir, False, False)
+        relurls = list(storage.recursive_relurls(storage.rawdir, 'andhra'))
+        self.assertEqual(relurls, ['andhra/2018-05-04/1', 'andhra/2018-05-04/2'])
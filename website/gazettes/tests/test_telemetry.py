@@ -0,0 +1,44 @@
+import os
+import datetime
+import tempfile
+
+from django.test import SimpleTestCase
+
+from egazette.utils import telemetry
+
+
+class TelemetryTests(SimpleTestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.statsdir = tmpdir.name
+        self.addCleanup(telemetry._config.update, dict(telemetry._config))
+
+    def run_crawl(self, run_id, secs, mtime):
+        telemetry.configure(self.statsdir, run_id)
+        collector = telemetry.Collector()
+        collector.record_day('testsrc', datetime.date(2024, 4, 18), secs, 1, True)
+        os.utime(telemetry.get_jsonl_path(), (mtime, mtime))
+
+    def test_each_run_has_its_own_file(self):
+        self.run_crawl('run1', 10.0, 1000)
+        self.run_crawl('run2', 20.0, 2000)
+        self.assertEqual(sorted(os.listdir(telemetry.get_run_dir(self.statsdir))),
+                         ['run1.jsonl', 'run2.jsonl'])
+
+        sources = telemetry.write_prometheus()
+        self.assertEqual(sources['testsrc']['days'], 1)
+        self.assertEqual(sources['testsrc']['secs'], 20.0)
+        self.assertTrue(os.path.exists(telemetry.get_prom_path()))
+
+    def test_durations_come_from_the_last_runs(self):
+        for i, secs in enumerate([100.0, 1.0, 2.0, 3.0]):
+            self.run_crawl('run%d' % i, secs, 1000 * (i + 1))
+
+        self.assertEqual(telemetry.get_day_durations(self.statsdir), {'testsrc': 3.0})
+        # the first run is no longer read
+        self.assertEqual(telemetry.get_day_durations(self.statsdir, max_runs=3),
+                         {'testsrc': 2.0})
+
+    def test_no_runs(self):
+        self.assertEqual(telemetry.get_day_durations(self.statsdir), {})
@@ -0,0 +1,132 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+
+from django.test import SimpleTestCase
+
+from egazette.utils.file_storage import FileManager
+from egazette.utils.writejournal import WriteJournal
+
+PDF = b'%PDF-1.4\n1 0 obj\n<< >>\nendobj\n%%EOF\n'
+
+
+def get_dead_pid():
+    proc = subprocess.Popen([sys.executable, '-c', 'pass'])
+    proc.wait()
+    return proc.pid
+
+
+class RecoverTests(SimpleTestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.datadir = tmpdir.name
+        self.journaldir = os.path.join(self.datadir, 'stats', 'journal')
+        self.quarantinedir = os.path.join(self.datadir, 'quarantine')
+        self.daydir = os.path.join(self.datadir, 'raw', 'testsrc', '2024-04-18')
+        os.makedirs(self.daydir)
+
+    def write(self, filename, content, mtime=None):
+        filepath = os.path.join(self.daydir, filename)
+        with open(filepath, 'wb') as f:
+            f.write(content)
+        if mtime is not None:
+            os.utime(filepath, (mtime, mtime))
+        return filepath
+
+    def leave_journal(self, pid, begun=(), done=()):
+        # what a crawler killed before its flush leaves behind
+        os.makedirs(self.journaldir, exist_ok=True)
+        path = os.path.join(self.journaldir,
+                            '%s-%d.jsonl' % (socket.gethostname(), pid))
+        records = [{'dir': self.daydir}]
+        records.extend({'begin': os.path.join(self.daydir, name)} for name in begun)
+        records.extend({'done': os.path.join(self.daydir, name)} for name in done)
+        with open(path, 'w') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+        return path
+
+    def test_incomplete_files_are_quarantined(self):
+        # 1 was a streamed download, begun without its extension
+        journal = self.leave_journal(get_dead_pid(),
+                                     begun=['1', '2.pdf', '3.pdf', '5.pdf'],
+                                     done=['5.pdf'])
+        truncated = self.write('1.pdf', PDF[:20])
+        empty = self.write('2.pdf', b'')
+        complete = self.write('3.pdf', PDF)
+        tmpfile = self.write('.4.pdf.abc.part', PDF[:10])
+        # renamed into place, or not written by the crawler at all
+        renamed = self.write('5.pdf', PDF[:20])
+        other = self.write('6.pdf', PDF[:20])
+
+        with self.assertLogs('judis.writejournal', 'WARNING'):
+            quarantined = WriteJournal(self.journaldir).recover(self.datadir,
+                                                                self.quarantinedir)
+
+        self.assertEqual(sorted(quarantined), sorted([truncated, empty, tmpfile]))
+        self.assertEqual(sorted(os.listdir(self.daydir)), ['3.pdf', '5.pdf', '6.pdf'])
+        for filepath in (truncated, empty, tmpfile):
+            moved = os.path.join(self.quarantinedir,
+                                 os.path.relpath(filepath, self.datadir))
+            self.assertTrue(os.path.exists(moved))
+        for filepath in (complete, renamed, other):
+            self.assertTrue(os.path.exists(filepath))
+        self.assertFalse(os.path.exists(journal))
+
+    def test_pdf_with_a_long_trailer_is_complete(self):
+        self.leave_journal(get_dead_pid(), begun=['1.pdf'])
+        self.write('1.pdf', PDF + b'\0' * 8192)
+        quarantined = WriteJournal(self.journaldir).recover(self.datadir,
+                                                            self.quarantinedir)
+        self.assertEqual(quarantined, [])
+
+    def test_journal_records_docs_until_they_are_in_place(self):
+        journal = WriteJournal(self.journaldir)
+        inplace = os.path.join(self.daydir, '1.pdf')
+        journal.begin(os.path.join(self.daydir, '1'))
+        self.write('1.pdf', PDF[:20])
+        journal.written(inplace)
+        journal.begin(os.path.join(self.daydir, '2.pdf'))
+        journal.begin(os.path.join(self.daydir, '3.pdf'))
+        journal.flush()
+        # 3 was done after the flush, 2 never was
+        journal.written(os.path.join(self.daydir, '3.pdf'))
+        pending = self.write('2.pdf', PDF[:20])
+        self.write('3.pdf', PDF[:20])
+
+        # as if this process had died
+        dead = journal.get_journal_path(get_dead_pid())
+        os.rename(journal.get_journal_path(os.getpid()), dead)
+        with self.assertLogs('judis.writejournal', 'WARNING'):
+            quarantined = WriteJournal(self.journaldir).recover(self.datadir,
+                                                                self.quarantinedir)
+        self.assertEqual(quarantined, [pending])
+
+    def test_journal_of_a_live_process_is_left_alone(self):
+        journal = self.leave_journal(os.getppid(), begun=['1.pdf'])
+        truncated = self.write('1.pdf', PDF[:20])
+
+        quarantined = WriteJournal(self.journaldir).recover(self.datadir,
+                                                            self.quarantinedir)
+        self.assertEqual(quarantined, [])
+        self.assertTrue(os.path.exists(truncated))
+        self.assertTrue(os.path.exists(journal))
+
+    def test_storage_forgets_quarantined_docs(self):
+        storage = FileManager(self.datadir, False, False)
+        storage.save_rawdoc('testsrc', 'testsrc/2024-04-18/1', None, PDF)
+        self.assertIsNotNone(storage.catalog.get_doc('testsrc/2024-04-18/1')[0])
+
+        # the doc was cut short by a crash before the day was flushed
+        self.leave_journal(get_dead_pid(), begun=['1.pdf'])
+        self.write('1.pdf', PDF[:20])
+
+        storage = FileManager(self.datadir, False, False)
+        with self.assertLogs('judis.writejournal', 'WARNING'):
+            self.assertEqual(len(storage.recover()), 1)
+        self.assertFalse(storage.has_rawfile('testsrc/2024-04-18/1'))
+        self.assertIsNone(storage.catalog.get_doc('testsrc/2024-04-18/1')[0])
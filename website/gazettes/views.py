@@ -154,9 +154,9 @@ def _detail_context(request, gazette, storage):
         'source': gazette.source,
         'languages': sources_service.language_names(gazette.source.languages),
         'ia_url': ia_url,
-        'has_pdf': gazette.has_pdf and storage.find('raw', gazette.relurl),
+        'has_pdf': gazette.has_pdf and storage.exists('raw', gazette.relurl),
         'has_pymupdf': gazette.has_pymupdf
-        and storage.find('pymupdf', gazette.relurl),
+        and storage.exists('pymupdf', gazette.relurl),
     }
 
 
@@ -184,7 +184,7 @@ def detail_pymupdf(request, identifier):
     gazette = _get_gazette(identifier)
     storage = _storage()
 
-    if not storage.find('pymupdf', gazette.relurl):
+    if not storage.exists('pymupdf', gazette.relurl):
         raise Http404('No pymupdf rendering for this gazette')
 
     context = _detail_context(request, gazette, storage)
@@ -222,14 +222,23 @@ def gazette_pdf(request, identifier):
     """
     gazette = _get_gazette(identifier)
     storage = _storage()
-    path = storage.find('raw', gazette.relurl)
+    extension = storage.extension('raw', gazette.relurl)
 
-    if path is None:
+    if extension is None:
         return HttpResponseRedirect(
             settings.GAZETTE_IA_DETAILS_URL.rstrip('/') + '/' + gazette.identifier
         )
 
-    filename = '%s%s' % (gazette.identifier, os.path.splitext(path)[1])
+    filename = '%s%s' % (gazette.identifier, extension)
+    path = storage.find('raw', gazette.relurl)
+
+    if path is None:
+        # Only in the pack of its day: nginx cannot serve a zip member, so
+        # stream it from here.
+        return FileResponse(
+            storage.open('raw', gazette.relurl),
+            content_type='application/pdf', filename=filename
+        )
 
     if settings.GAZETTE_USE_X_ACCEL:
         # Hand the file off to nginx; see the internal location block in